@@ -0,0 +1,293 @@
+# MIT License
+#
+# Copyright (c) 2024 mjteter
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import hashlib
+import json
+from pathlib import Path
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+import logging
+
+import metrics
+from persistence import atomic_write
+
+
+_logger = logging.getLogger(__name__)
+
+NHL_URL = 'https://api-web.nhle.com/v1'
+
+DEFAULT_TIMEOUT = (3.05, 10)  # (connect, read) seconds
+POOL_SIZE = 4  # connections kept alive per host
+
+# retry/backoff per endpoint, matched on the path right after the server url.  live play by play goes stale fast, so
+# give up early and let the next poll try again, the daily endpoints can afford to wait a little longer
+ENDPOINT_RETRIES = {'gamecenter': {'total': 2, 'backoff_factor': 0.5},
+                    'standings': {'total': 4, 'backoff_factor': 2},
+                    'club-schedule-season': {'total': 4, 'backoff_factor': 2},
+                    'club-stats': {'total': 4, 'backoff_factor': 2}}
+DEFAULT_RETRIES = {'total': 3, 'backoff_factor': 1}
+RETRY_STATUS = (429, 500, 502, 503, 504)
+
+HTTP_CACHE_PATH = Path('.') / 'resources' / 'http_cache'
+
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+
+def _adapter(retries: dict) -> HTTPAdapter:
+    retry = Retry(total=retries['total'], backoff_factor=retries['backoff_factor'], status_forcelist=RETRY_STATUS,
+                  allowed_methods=frozenset(['GET', 'HEAD']))
+    return HTTPAdapter(pool_connections=POOL_SIZE, pool_maxsize=POOL_SIZE, max_retries=retry)
+
+
+class ResponseCache(object):
+    def __init__(self, path: Path = HTTP_CACHE_PATH):
+        """
+        keeps the validators (ETag, Last-Modified), a hash and the body of the last response per url on disk, so
+        requests can be made conditional and unchanged payloads can be skipped
+
+        :param path: folder for the index and the cached bodies
+        """
+        self.path = path
+        self.lock = threading.Lock()
+
+        self.path.mkdir(parents=True, exist_ok=True)
+        try:
+            with open(self.path / 'index.json') as f:
+                self.index = json.load(f)
+        except (IOError, ValueError):
+            self.index = {}
+
+    def _body_path(self, url: str) -> Path:
+        return self.path / (hashlib.sha1(url.encode()).hexdigest() + '.json')
+
+    def _save_index(self):
+        # atomic, a power cut must not leave validators for a body that was never written
+        atomic_write(self.path / 'index.json', json.dumps(self.index, indent=2).encode())
+
+    def validators(self, url: str) -> dict:
+        """
+        :return: headers to make the request for url conditional, empty if there is no cached body to fall back on
+        """
+        with self.lock:
+            entry = self.index.get(url)
+
+        headers = {}
+        if entry and self._body_path(url).exists():
+            if entry.get('etag'):
+                headers['If-None-Match'] = entry['etag']
+            if entry.get('lastModified'):
+                headers['If-Modified-Since'] = entry['lastModified']
+
+        return headers
+
+    def store(self, url: str, response: requests.Response) -> bool:
+        """
+        :return: True if the body is different from the cached one
+        """
+        digest = hashlib.sha1(response.content).hexdigest()
+        new_entry = {'etag': response.headers.get('ETag'), 'lastModified': response.headers.get('Last-Modified'),
+                     'hash': digest}
+
+        with self.lock:
+            body_path = self._body_path(url)
+            changed = self.index.get(url, {}).get('hash') != digest or not body_path.exists()
+
+            if changed:
+                atomic_write(body_path, response.content)
+
+            if self.index.get(url) != new_entry:
+                self.index[url] = new_entry
+                self._save_index()
+
+        return changed
+
+    def forget(self, url: str):
+        """
+        drops the cached body of url, the next request for it is not conditional
+        """
+        with self.lock:
+            if self.index.pop(url, None) is not None:
+                self._save_index()
+            try:
+                self._body_path(url).unlink()
+            except FileNotFoundError:
+                pass
+
+    def body(self, url: str):
+        """
+        :return: the last body received for url, None if there is none
+        """
+        try:
+            with open(self._body_path(url), 'rb') as f:
+                return f.read()
+        except IOError:
+            return None
+
+
+class ApiSession(requests.Session):
+    def __init__(self, server: str = NHL_URL, headers: dict = None, timeout=DEFAULT_TIMEOUT,
+                 cache_path: Path = HTTP_CACHE_PATH):
+        """
+        keep-alive session for one api server, so polls reuse the pooled tcp/tls connection instead of doing a new
+        handshake for every request
+
+        :param server: base url of the api, e.g. NHL_URL or the MOCKSERVER_URL in DEV mode
+        :param headers: extra headers sent with every request (e.g. mock server api key)
+        :param timeout: default (connect, read) timeout for requests that do not pass one
+        :param cache_path: folder for the ResponseCache, None to always download and parse the full payload
+        """
+        super().__init__()
+
+        self.server = server.rstrip('/')
+        self.timeout = timeout
+        self.cache = ResponseCache(cache_path) if cache_path is not None else None
+
+        self.headers.update({'Accept': 'application/json', 'Accept-Encoding': 'gzip, deflate'})
+        if headers:
+            self.headers.update(headers)
+
+        # most specific prefix wins when requests picks the adapter
+        self.mount(self.server + '/', _adapter(DEFAULT_RETRIES))
+        for endpoint, retries in ENDPOINT_RETRIES.items():
+            self.mount(f'{self.server}/{endpoint}', _adapter(retries))
+
+    def request(self, method, url, *args, **kwargs):
+        kwargs.setdefault('timeout', self.timeout)
+
+        name = f'api {self.endpoint_name(url)}'
+        start = time.perf_counter()
+        try:
+            response = super().request(method, url, *args, **kwargs)
+        except requests.RequestException:
+            metrics.registry.count(f'{name} errors')
+            raise
+        metrics.registry.record(name, time.perf_counter() - start)  # includes the retries
+        metrics.registry.count(f'{name} requests')
+        if response.status_code == 304:
+            metrics.registry.count(f'{name} not modified')
+        elif not kwargs.get('stream'):
+            metrics.registry.count(f'{name} bytes', len(response.content))
+
+        return response
+
+    def endpoint_name(self, url: str) -> str:
+        """
+        :return: first path segment after the server url, e.g. 'gamecenter', used to group the metrics
+        """
+        return url[len(self.server):].lstrip('/').split('/', 1)[0] if url.startswith(self.server) else 'other'
+
+    def get_endpoint(self, endpoint: str, **kwargs) -> requests.Response:
+        """
+        :param endpoint: path after the server url, e.g. 'standings/now'
+        """
+        return self.get(self.url(endpoint), **kwargs)
+
+    def url(self, endpoint: str) -> str:
+        return f'{self.server}/{endpoint.lstrip("/")}'
+
+    def conditional_get(self, url: str):
+        """
+        sends the cached validators with the request and compares the body hash with the cached one
+
+        :return: (changed, response) with response None if the server answered 304 or sent the same body again
+        """
+        if self.cache is None:
+            return True, self.get(url)
+
+        response = self.get(url, headers=self.cache.validators(url))
+        if response.status_code == 304:
+            _logger.debug(f'{url} not modified')
+            return False, None
+
+        response.raise_for_status()
+        if not self.cache.store(url, response):
+            _logger.debug(f'{url} body unchanged')
+            return False, None
+
+        return True, response
+
+    def get_json(self, url: str, parse=json.loads):
+        """
+        conditional request that falls back on the cached body
+
+        :param parse: turns the raw body bytes into the returned data, e.g. pbp_stream.parse_game
+        :return: (changed, parsed json)
+        :raises requests.exceptions.InvalidJSONError: if the body is no valid json
+        """
+        changed, response = self.conditional_get(url)
+        if changed:
+            return True, parse_json(url, response.content, parse)
+
+        return False, self.cached_json(url, parse)
+
+    def cached_json(self, url: str, parse=json.loads):
+        """
+        :return: the cached body of url parsed, fetched again without validators if it is missing or damaged
+        """
+        body = self.cache.body(url)
+        if body is None:
+            _logger.warning(f'cached body of {url} missing, fetching it again')
+        else:
+            try:
+                return parse_json(url, body, parse)
+            except requests.exceptions.InvalidJSONError as cache_ex:
+                _logger.warning(f'cached body of {url} damaged, fetching it again: {cache_ex}')
+
+        self.cache.forget(url)
+        _, response = self.conditional_get(url)
+        return parse_json(url, response.content, parse)
+
+
+def parse_json(url: str, body: bytes, parse=json.loads):
+    """
+    :raises requests.exceptions.InvalidJSONError: if body is no valid json (e.g. the html page of a captive portal),
+    so callers that retry on a RequestException handle it like any other failed request
+    """
+    try:
+        return parse(body)
+    except ValueError as parse_ex:  # json.JSONDecodeError, pbp_stream.parse_game
+        raise requests.exceptions.InvalidJSONError(f'bad json from {url}: {parse_ex}') from parse_ex
+
+
+def get_session(server: str = NHL_URL, headers: dict = None) -> ApiSession:
+    """
+    :return: the shared session for server, created on first use
+    """
+    with _sessions_lock:
+        if server not in _sessions:
+            _logger.info(f'Open api session for {server}')
+            _sessions[server] = ApiSession(server, headers=headers)
+
+        return _sessions[server]
+
+
+def close_sessions():
+    with _sessions_lock:
+        for session in _sessions.values():
+            session.close()
+        _sessions.clear()
@@ -24,19 +24,43 @@ import queue
 
 import requests
 import datetime as dt
-from time import sleep
+import heapq
+import itertools
 import math
 import json
 import threading
+import time
+from pathlib import Path
 
 import logging
 
+from api_session import NHL_URL, get_session, parse_json
+from fetch_engine import FetchEngine
+import metrics
+import pbp_stream
+from persistence import WriteBehind
+from player_index import PLAYER_ID_KEYS, PlayerIndex
+
 
 _logger = logging.getLogger(__name__)
 
 TIME_FORMAT = '%Y-%m-%d %H:%M:%S'
 SCHED_TIME_FORMAT = '%Y-%m-%dT%H:%M:%S%z'
 MAX_REQUESTS_PER_MIN = 10
+DATA_PATH = Path('.') / 'resources'
+MAX_IDLE_SECONDS = 60  # safety net for a kill flag set without Bank.stop(), which wakes Bank right away
+
+# lower goes first when several requests are due, a live game must never wait behind the daily requests
+REQUEST_PRIORITY = {'get_game': 0, 'get_schedule': 1, 'get_standings': 2, 'get_roster': 3}
+DEFAULT_PRIORITY = 5
+# a request for an endpoint fetched less than this many seconds ago (for another team) reuses that response
+SHARED_FETCH_SECONDS = 15
+
+# League method: endpoint it requests, formatted with the League team and the request args
+ENDPOINTS = {'get_standings': 'standings/now',
+             'get_schedule': 'club-schedule-season/{team}/now',
+             'get_roster': 'club-stats/{team}/now',
+             'get_game': 'gamecenter/{args[0]}/play-by-play'}
 
 # list of keys for own dict matched to cascading list of keys from nhl api
 GAME_MAP = {'id': ['id'],
@@ -58,6 +82,50 @@ GAME_MAP = {'id': ['id'],
             }
 
 
+def message(method: str, args=None, kwargs=None, delay=0) -> dict:
+    """
+    :param method: name of the method to call on the receiving thread
+    :param delay: minutes to wait before making the request (League only)
+    :return: queue message, stamped with the time it was sent so the receiver can measure the hand-off latency
+    """
+    return {'method': method, 'args': args if args is not None else [], 'kwargs': kwargs if kwargs is not None else {},
+            'delay': delay, 'sent': time.monotonic()}
+
+
+class QueueStats(object):
+    def __init__(self, name):
+        """
+        counts how often a thread wakes up and how long messages waited in its queue
+
+        :param name: thread name for the summary
+        """
+        self.name = name
+        self.started = time.monotonic()
+        self.wakeups = 0
+        self.messages = 0
+        self.latency_total = 0.0
+        self.latency_max = 0.0
+
+    def wakeup(self, msg=None):
+        """
+        :param msg: the message that woke the thread, None if it woke for a timer
+        """
+        self.wakeups += 1
+        if msg is not None and 'sent' in msg:
+            latency = time.monotonic() - msg['sent']
+            metrics.registry.record(f'queue {self.name}', latency)
+            self.messages += 1
+            self.latency_total += latency
+            self.latency_max = max(self.latency_max, latency)
+
+    def summary(self) -> str:
+        elapsed = max(time.monotonic() - self.started, 1e-9)
+        mean_ms = self.latency_total / self.messages * 1000 if self.messages else 0
+        return (f'{self.name}: {self.wakeups} wakeups in {elapsed:.1f} s ({self.wakeups / elapsed:.2f}/s), '
+                f'{self.messages} messages, hand-off latency mean {mean_ms:.2f} ms, '
+                f'max {self.latency_max * 1000:.2f} ms')
+
+
 class KillFlag(threading.Event):
     """A wrapper for the typical event class to allow for overriding the
     `__bool__` magic method, since it looks nicer.
@@ -66,48 +134,350 @@ class KillFlag(threading.Event):
         return self.is_set()
 
 
+class TokenBucket(object):
+    def __init__(self, rate_per_min=MAX_REQUESTS_PER_MIN, capacity=None):
+        """
+        rate limiter that allows bursts of up to capacity requests and refills at rate_per_min
+
+        :param rate_per_min: tokens added per minute
+        :param capacity: most tokens that can be saved up, defaults to rate_per_min
+        """
+        self.rate = rate_per_min / 60
+        self.capacity = capacity if capacity is not None else rate_per_min
+        self.tokens = float(self.capacity)
+        self.stamp = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.stamp) * self.rate)
+        self.stamp = now
+
+    def take(self) -> bool:
+        """
+        :return: True if a token was available and taken
+        """
+        self._refill()
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+    def refund(self):
+        """
+        gives back a token for a request that should not count, e.g. an unchanged conditional request
+        """
+        self.tokens = min(self.capacity, self.tokens + 1)
+
+    def wait_time(self) -> float:
+        """
+        :return: seconds until the next token is available
+        """
+        self._refill()
+        return 0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+
+class RequestScheduler(object):
+    def __init__(self, priorities=None):
+        """
+        requests waiting for their due time sit in a heap by due time, once due they move to a heap by priority.
+        requests for the same method and arguments are coalesced into one, keeping the earliest due time
+
+        :param priorities: method: priority, lower goes first, defaults to REQUEST_PRIORITY
+        """
+        self.priorities = priorities if priorities is not None else REQUEST_PRIORITY
+
+        self.waiting = []  # (due, priority, seq, key)
+        self.ready = []  # (priority, due, seq, key)
+        self.entries = {}  # key: {'func': func, 'due': due, 'seq': seq}, only the current entry per key is valid
+        self.counter = itertools.count()
+
+    def __len__(self):
+        return len(self.entries)
+
+    @staticmethod
+    def _key(func) -> tuple:
+        return func['method'], json.dumps([func['args'], func['kwargs']], sort_keys=True, default=str)
+
+    def _valid(self, key, seq) -> bool:
+        entry = self.entries.get(key)
+        return entry is not None and entry['seq'] == seq
+
+    def add(self, func, due: float) -> bool:
+        """
+        :param func: {'method': method_name, 'args': args, 'kwargs': kwargs}
+        :param due: time.monotonic() time the request should be made at
+        :return: False if it was coalesced into an already scheduled request that is due at the same time or earlier
+        """
+        key = self._key(func)
+        entry = self.entries.get(key)
+        if entry is not None and entry['due'] <= due:
+            return False
+
+        # an earlier due time replaces the scheduled entry, the old heap item is skipped when it comes up
+        seq = next(self.counter)
+        self.entries[key] = {'func': func, 'due': due, 'seq': seq}
+        heapq.heappush(self.waiting, (due, self.priorities.get(func['method'], DEFAULT_PRIORITY), seq, key))
+        return True
+
+    def _promote(self, now: float):
+        while self.waiting and self.waiting[0][0] <= now:
+            due, priority, seq, key = heapq.heappop(self.waiting)
+            if self._valid(key, seq):
+                heapq.heappush(self.ready, (priority, due, seq, key))
+
+    def has_ready(self, now: float) -> bool:
+        self._promote(now)
+        while self.ready and not self._valid(self.ready[0][3], self.ready[0][2]):
+            heapq.heappop(self.ready)
+        return bool(self.ready)
+
+    def pop_ready(self, now: float):
+        """
+        :return: the due func with the highest priority, None if nothing is due
+        """
+        if not self.has_ready(now):
+            return None
+
+        key = heapq.heappop(self.ready)[3]
+        return self.entries.pop(key)['func']
+
+    def next_due(self, now: float):
+        """
+        :return: seconds until the next request is due, None if nothing is scheduled
+        """
+        if self.has_ready(now):
+            return 0
+
+        while self.waiting and not self._valid(self.waiting[0][3], self.waiting[0][2]):
+            heapq.heappop(self.waiting)
+        if not self.waiting:
+            return None
+
+        return max(self.waiting[0][0] - now, 0)
+
+
+class PlayTracker(object):
+    def __init__(self, game_id):
+        """
+        remembers the last play of a game that was passed on, so every poll only handles the plays added since
+
+        :param game_id: nhl api game id
+        """
+        self.game_id = game_id
+        self.last_sort_order = -1
+        self.kept = {}  # sortOrder: raw play, of the plays passed on so far
+        self.players = PlayerIndex(game_id=game_id)  # built from the first response, reused on later polls
+
+    def _refresh_players(self, response, details):
+        """
+        rebuilds the index from the current rosterSpots if a play refers to a player it does not have yet
+        (first poll or a late roster change)
+        """
+        for key in PLAYER_ID_KEYS:
+            if key in details and details[key] not in self.players:
+                self.players.add_roster_spots(response.get('rosterSpots', []))
+                return
+
+    def _delta(self, response, play):
+        """
+        :return: the fields of play Bank() needs, None for play types that are not passed on
+        """
+        if play['typeDescKey'] not in pbp_stream.PLAY_TYPES:
+            return None
+
+        delta = {'typeDescKey': play['typeDescKey'], 'sortOrder': play['sortOrder'],
+                 'period': play['periodDescriptor']['number'], 'timeInPeriod': play['timeInPeriod']}
+
+        details = play.get('details', {})
+        self._refresh_players(response, details)
+        self.players.enrich(details, delta)
+
+        if play['typeDescKey'] == 'penalty':
+            delta['descKey'] = details.get('descKey', '')
+            delta['duration'] = details.get('duration', 0)
+
+        return delta
+
+    def new_plays(self, response):
+        """
+        :param response: (sparse) play by play response, plays ordered by sortOrder like the api sends them
+        :return: (deltas, reset) deltas for the plays after the last one seen, reset is True if a play passed on
+        before was changed or taken back (corrected scorer or assists, overturned goal, restarted feed) and the deltas
+        are the whole game again
+        """
+        plays = response.get('plays', [])
+        if not plays:
+            return [], False
+
+        # walk back from the end, so late in a game only the new plays are turned into deltas
+        seen_count = len(plays)
+        while seen_count and plays[seen_count - 1].get('sortOrder', -1) > self.last_sort_order:
+            seen_count -= 1
+
+        # the api edits plays it already sent, they have to be the ones passed on before
+        seen = {play.get('sortOrder'): play for play in plays[:seen_count]
+                if play.get('typeDescKey') in pbp_stream.PLAY_TYPES}
+        reset = seen != self.kept
+        if reset:
+            _logger.warning(f'PlayTracker: plays of {self.game_id} up to sortOrder {self.last_sort_order} changed, '
+                            f'start over')
+            seen_count = 0
+            seen = {}
+
+        deltas = []
+        for play in plays[seen_count:]:
+            if play.get('typeDescKey') in pbp_stream.PLAY_TYPES:
+                seen[play.get('sortOrder')] = play
+            try:
+                delta = self._delta(response, play)
+            except KeyError:
+                _logger.error('KeyError in PlayTracker.new_plays()')
+                continue
+            if delta is not None:
+                deltas.append(delta)
+
+        self.kept = seen
+        self.last_sort_order = plays[-1].get('sortOrder', self.last_sort_order)
+
+        return deltas, reset
+
+
 class League(threading.Thread):
-    def __init__(self, resp_queue, req_queue, team='PHI'):
+    def __init__(self, resp_queue, req_queue, team='PHI', server=NHL_URL):
         super().__init__(daemon=True)
 
         self.resp_queue = resp_queue
         self.req_queue = req_queue
-        self.team = team
-
-        self.requests_made = []
-        self.delayed_requests = []
-        #  each item of form:
-        # {'func': {'method': method_name, 'args': args, 'kwargs': kwargs}, 'time_to_req': datetime}
+        self.team = team  # default team for requests that do not name one
+        self.subscribers = {team: resp_queue}  # team: resp_queue of the Bank() following it, see subscribe()
+        self.game_teams = {}  # game_id: teams playing, known after the first response
+        self.session = get_session(server)
+
+        self.scheduler = RequestScheduler()
+        self.rate_limiter = TokenBucket(MAX_REQUESTS_PER_MIN)
+        self.engine = FetchEngine()  # tokens are taken when a batch is formed, so no limiter of its own
+        self.prefetched = {}  # url: (changed, response) or the exception raised, filled by _prefetch()
+        self.fetched_at = {}  # endpoint: time.monotonic() of the last request
+        self.handed_off = {}  # endpoint: teams whose Bank() got it at least once since start
+        self.game_states = {}  # game_id: last gameState passed to Bank()
+        self.play_trackers = {}  # game_id: PlayTracker
+        self.stats = QueueStats('League')
 
         _logger.info('Initialize League() thread')
         return
 
+    def subscribe(self, team: str, resp_queue: queue.Queue):
+        """
+        adds a Bank() following another team, call before start().  shared requests (standings, a game between two
+        followed teams) are still made once and passed to every Bank() they concern
+
+        :param team: team abbreviation, e.g. 'LAK'
+        :param resp_queue: queue of that team's Bank()
+        """
+        self.subscribers[team] = resp_queue
+
+    def _send(self, teams, msg: dict):
+        for team in teams:
+            self.subscribers[team].put(msg)
+
+    def _game_receivers(self, game_id, teams=None):
+        """
+        :param teams: teams playing the game, defaults to what is known from earlier responses
+        :return: followed teams playing in game_id, all of them if none match or the teams are not known yet
+        """
+        teams = teams if teams is not None else self.game_teams.get(game_id, ())
+        return [team for team in self.subscribers if team in teams] or list(self.subscribers)
+
     def _append_delayed_request(self, delayed_req):
         """
-        adds delayed request if none exactly the same have been added, if not, check if new delay time is shorter than
-        currently listed
+        schedules a request, a request for the same method and arguments that is already scheduled is kept and moved
+        to the earlier of both times
 
         :param delayed_req: of form {'func': {'method': 'method_name', 'args': [args], 'kwargs': {kwargs}},
         'time_to_req': datetime}
         """
-        found_prior_req = False
-        for req in self.delayed_requests:
-            if req['func'] == delayed_req['func']:
-                if delayed_req['time_to_req'] < req['time_to_req']:
-                    req['time_to_req'] = delayed_req['time_to_req']
-                found_prior_req = True
-                break
+        delay = (delayed_req['time_to_req'] - dt.datetime.now().astimezone(None)).total_seconds()
+        if not self.scheduler.add(delayed_req['func'], time.monotonic() + max(delay, 0)):
+            _logger.debug(f'{delayed_req["func"]["method"]} is already scheduled, coalesced')
+
+    def _idle_timeout(self):
+        """
+        :return: seconds until the next request can be made, None to block until a request arrives
+        """
+        now = time.monotonic()
+        if self.scheduler.has_ready(now):
+            return self.rate_limiter.wait_time()
+
+        return self.scheduler.next_due(now)
 
-        if not found_prior_req:
-            self.delayed_requests.append(delayed_req)
+    def _recently_fetched(self, endpoint: str) -> bool:
+        last = self.fetched_at.get(endpoint)
+        return (self.session.cache is not None and last is not None and
+                time.monotonic() - last < SHARED_FETCH_SECONDS)
 
-    def _len_requests_made(self) -> int:
-        _logger.debug(f'Check set of requests made {self.requests_made}')
-        current_dt_delta = dt.datetime.now().astimezone(None) - dt.timedelta(minutes=1)
-        #  clear out old requests
-        self.requests_made = [req for req in self.requests_made if req[1] > current_dt_delta]
+    def _endpoint(self, method: str, args=(), team: str = None) -> str:
+        return ENDPOINTS[method].format(team=team or self.team, args=args)
 
-        return len(self.requests_made)
+    def _prefetch(self, batch):
+        """
+        makes the requests of a batch concurrently, the get_* methods then pick up the results in _get_json()
+
+        :param batch: list of {'method': method_name, 'args': args, 'kwargs': kwargs}
+        """
+        endpoints = {self._endpoint(func['method'], func['args'], func['kwargs'].get('team'))
+                     for func in batch if func['method'] in ENDPOINTS}
+        urls = {self.session.url(endpoint) for endpoint in endpoints if not self._recently_fetched(endpoint)}
+        if len(urls) < 2:
+            return
+
+        _logger.debug(f'League prefetching {len(urls)} requests')
+        self.prefetched.update(self.engine.fetch_all({url: (self.session.conditional_get, (url,)) for url in urls}))
+
+    def _get_json(self, method: str, endpoint: str, parse=json.loads, receivers=None):
+        """
+        makes a conditional request for endpoint, the request only counts towards MAX_REQUESTS_PER_MIN if the payload
+        changed.  an unchanged payload is still returned until every receiver got it once since start
+
+        :param method: name of the calling method for logging
+        :param endpoint: path after the server url, e.g. 'standings/now'
+        :param parse: turns the raw body bytes into the returned data
+        :param receivers: teams the result is passed to, defaults to the League team
+        :return: parsed json or None if nothing changed since the last request
+        :raises requests.exceptions.RequestException: InvalidJSONError for a body that is no valid json
+        """
+        receivers = set(receivers if receivers is not None else [self.team])
+        handed_off = self.handed_off.setdefault(endpoint, set())
+
+        url = self.session.url(endpoint)
+        if url not in self.prefetched and self._recently_fetched(endpoint):
+            # the same endpoint was just requested for another team, share that response instead of asking again
+            self.rate_limiter.refund()
+            metrics.registry.count('league shared')
+            if receivers <= handed_off:
+                return None
+            handed_off.update(receivers)
+            return self.session.cached_json(url, parse)
+
+        if url in self.prefetched:
+            result = self.prefetched.pop(url)
+            if isinstance(result, Exception):
+                raise result
+            changed, response = result
+        else:
+            changed, response = self.session.conditional_get(url)
+        self.fetched_at[endpoint] = time.monotonic()
+
+        if changed:
+            data = parse_json(url, response.content, parse)
+        else:
+            self.rate_limiter.refund()
+            if receivers <= handed_off:
+                _logger.debug(f'{method}: nothing changed since last request, skipping')
+                return None
+            data = self.session.cached_json(url, parse)
+
+        handed_off.update(receivers)
+        return data
 
     def get_standings(self):
         """
@@ -119,14 +489,16 @@ class League(threading.Thread):
 
         current_dt = dt.datetime.now().astimezone(None)
         try:
-            self.requests_made.append(['get_standings', current_dt])  # add to history
-            response = requests.get('https://api-web.nhle.com/v1/standings/now').json()
-        except requests.exceptions.JSONDecodeError:
+            response = self._get_json('get_standings', self._endpoint('get_standings'), receivers=self.subscribers)
+        except requests.exceptions.RequestException:  # bad json, timeout or retries used up
             _logger.error('No response for standings API request!  Try again in 5 minutes.')
             self._append_delayed_request({'func': {'method': 'get_standings', 'args': [], 'kwargs': {}},
                                           'time_to_req': current_dt + dt.timedelta(minutes=5)})
             return
 
+        if response is None:
+            return
+
         standings = {'requestTime':current_dt.strftime(TIME_FORMAT), 'Central': {}, 'Pacific': {},
                      'Atlantic': {}, 'Metropolitan': {}, 'Western': {}, 'Eastern': {}}
 
@@ -149,24 +521,27 @@ class League(threading.Thread):
                 standings[conf] = dict(sorted(standings[conf].items(),
                                               key=lambda item: (-item[1]['points'], -item[1]['pointPctg'])))
 
-        self.resp_queue.put({'method': 'save_standings', 'args': [standings], 'kwargs': {}, 'delay': 0})
+        self._send(self.subscribers, message('save_standings', [standings]))
 
         return
 
-    def get_schedule(self):
-        _logger.info(f'Get {self.team} schedule')
+    def get_schedule(self, team=None):
+        team = team or self.team
+        _logger.info(f'Get {team} schedule')
         current_dt = dt.datetime.now().astimezone(None)
 
         try:
-            self.requests_made.append(['get_schedule', current_dt])  # add to history
-            response = requests.get('https://api-web.nhle.com/v1/club-schedule-season/' + self.team + '/now').json()
-        except requests.exceptions.JSONDecodeError:
+            response = self._get_json('get_schedule', self._endpoint('get_schedule', team=team), receivers=[team])
+        except requests.exceptions.RequestException:  # bad json, timeout or retries used up
             _logger.error('No response for schedule API request!  Try again in 5 minutes.')
-            self._append_delayed_request({'func': {'method': 'get_schedule', 'args': [], 'kwargs': {}},
+            self._append_delayed_request({'func': {'method': 'get_schedule', 'args': [], 'kwargs': {'team': team}},
                                          'time_to_req': current_dt + dt.timedelta(minutes=5)})
             return
 
-        schedule = {'requestTime': current_dt.strftime(TIME_FORMAT), 'team': self.team, 'games': []}
+        if response is None:
+            return
+
+        schedule = {'requestTime': current_dt.strftime(TIME_FORMAT), 'team': team, 'games': []}
         for gm in response['games']:
             schedule['games'].append({'id': gm['id'],
                                       'startTimeUTC': gm['startTimeUTC'],
@@ -183,25 +558,28 @@ class League(threading.Thread):
                 schedule['games'][-1]['homeScore'] = None
                 schedule['games'][-1]['gameOutcome'] = None
 
-        self.resp_queue.put({'method': 'save_schedule', 'args': [schedule], 'kwargs': {}, 'delay': 0})
+        self._send([team], message('save_schedule', [schedule]))
 
         return
 
-    def get_roster(self):
-        _logger.info(f'Get {self.team} roster')
+    def get_roster(self, team=None):
+        team = team or self.team
+        _logger.info(f'Get {team} roster')
         current_dt = dt.datetime.now().astimezone(None)
 
         try:
-            self.requests_made.append(['get_roster', current_dt])  # add to history
-            response = requests.get('https://api-web.nhle.com/v1/club-stats/' + self.team + '/now').json()
-        except requests.exceptions.JSONDecodeError:
+            response = self._get_json('get_roster', self._endpoint('get_roster', team=team), receivers=[team])
+        except requests.exceptions.RequestException:  # bad json, timeout or retries used up
             _logger.error('No response for roster API request!  Try again in 5 minutes.')
-            self._append_delayed_request({'func': {'method': 'get_roster', 'args': [], 'kwargs': {}},
+            self._append_delayed_request({'func': {'method': 'get_roster', 'args': [], 'kwargs': {'team': team}},
                                          'time_to_req': current_dt + dt.timedelta(minutes=5)})
             return
 
+        if response is None:
+            return
+
         # roster = {'requestTime': dt.datetime.now().strftime(TIME_FORMAT), 'team': self.team, 'skaters': [],
-        roster = {'requestTime': current_dt.strftime(TIME_FORMAT), 'team': self.team, 'skaters': [],
+        roster = {'requestTime': current_dt.strftime(TIME_FORMAT), 'team': team, 'skaters': [],
                   'goalies': []}
         for sktr in response['skaters']:
             roster['skaters'].append({'playerId': sktr['playerId'],
@@ -230,7 +608,7 @@ class League(threading.Thread):
                                       'assists': glie['assists'],
                                       'points': glie['points']})
 
-        self.resp_queue.put({'method': 'save_roster', 'args': [roster], 'kwargs': {}, 'delay': 0})
+        self._send([team], message('save_roster', [roster]))
 
         return
 
@@ -239,14 +617,22 @@ class League(threading.Thread):
         current_dt = dt.datetime.now().astimezone(None)
 
         try:
-            self.requests_made.append(['get_game', current_dt])  # add to history
-            response = requests.get('https://api-web.nhle.com/v1/gamecenter/' + str(game_id) + '/play-by-play').json()
-        except requests.exceptions.JSONDecodeError:
+            response = self._get_json('get_game', self._endpoint('get_game', [game_id]),
+                                      parse=pbp_stream.parse_game,
+                                      receivers=self._game_receivers(game_id))
+        except requests.exceptions.RequestException:  # bad json, timeout or retries used up
             _logger.error('No response for live game API request!  Try again in 5 minutes.')
             self._append_delayed_request({'func': {'method': 'get_game', 'args': [game_id], 'kwargs': {}},
                                          'time_to_req': current_dt + dt.timedelta(seconds=45)})
             return
 
+        if response is None:
+            # Bank() only schedules the next poll of a game that is not over when it gets an update, so keep polling
+            if self.game_states.get(game_id) not in ('OFF', 'FINAL'):
+                self._append_delayed_request({'func': {'method': 'get_game', 'args': [game_id], 'kwargs': {}},
+                                              'time_to_req': current_dt + dt.timedelta(seconds=30)})
+            return
+
         # with open('resources/test_game.json', 'r') as f:
         #     response = json.load(f)
         # with open('resources/test_game.json', 'w') as f:
@@ -291,25 +677,14 @@ class League(threading.Thread):
         #     game['awaySituation'] = ''
         #     game['homeSituation'] = ''
 
-        game['plays'] = []
-        for play in response['plays']:
-            try:
-                if play['typeDescKey'] == 'goal':
-                    game['plays'].append({'typeDescKey': 'goal', 'period': play['periodDescriptor']['number'],
-                                          'timeInPeriod': play['timeInPeriod'],
-                                          'scoringPlayerId': play['details']['scoringPlayerId']})
-
-                    for plyr in response['rosterSpots']:
-                        if plyr['playerId'] == game['plays'][-1]['scoringPlayerId']:  # noqa (pycharm bs)
-                            game['plays'][-1]['scoringPlayerName'] = plyr['firstName']['default'] + ' ' + \
-                                                                     plyr['lastName']['default']
-                            break
-                    else:
-                        game['plays'][-1]['scoringPlayerName'] = ''
-            except KeyError:
-                _logger.error('KeyError in League().get_game() plays')
+        if game_id not in self.play_trackers:
+            self.play_trackers[game_id] = PlayTracker(game_id)
+        deltas, reset = self.play_trackers[game_id].new_plays(response)
 
-        self.resp_queue.put({'method': 'update_live_game', 'args': [game], 'kwargs': {}, 'delay': 0})
+        self.game_states[game_id] = game['gameState']
+        self.game_teams[game_id] = (game['awayTeam'], game['homeTeam'])
+        self._send(self._game_receivers(game_id),
+                   message('update_live_game', [game], {'deltas': deltas, 'reset': reset}))
 
         return
 
@@ -317,50 +692,44 @@ class League(threading.Thread):
         _logger.info('Start League() thread running')
 
         while True:
-            current_dt = dt.datetime.now().astimezone(None)
+            # sleep until a request arrives, the next scheduled request is due or a token frees up
+            try:
+                func_and_args = self.req_queue.get(timeout=self._idle_timeout())
+            except queue.Empty:
+                func_and_args = None
+            self.stats.wakeup(func_and_args)
 
-            # handle incoming immediate requests
-            if not self.req_queue.empty():
-                func_and_args = self.req_queue.get()
+            if func_and_args is not None:
                 method = func_and_args['method']
-                args = func_and_args['args']
-                kwargs = func_and_args['kwargs']
                 delay = func_and_args['delay']
 
                 if hasattr(self, method):
                     if delay > 0:
-                        _logger.debug(f'{method} is set to delay request {delay} minutes to '
-                                      f'{current_dt + dt.timedelta(minutes=delay)}')
-                        self._append_delayed_request({'func': {'method': method, 'args': args, 'kwargs': kwargs},
-                                                      'time_to_req': current_dt + dt.timedelta(minutes=delay)})
-                    else:
-                        num_made_reqs = self._len_requests_made()
-                        if num_made_reqs >= MAX_REQUESTS_PER_MIN:
-                            _logger.debug(f'Making too many requests!  Delaying {method} request.')
-                            self._append_delayed_request({'func': {'method': method, 'args': args, 'kwargs': kwargs},
-                                                          'time_to_req': current_dt + dt.timedelta(minutes=1)})
-                        else:
-                            getattr(self, method)(*args, **kwargs)
-                            sleep(0.1)
+                        _logger.debug(f'{method} is set to delay request {delay} minutes')
+                    func = {'method': method, 'args': func_and_args['args'], 'kwargs': func_and_args['kwargs']}
+                    if not self.scheduler.add(func, time.monotonic() + delay * 60):
+                        _logger.debug(f'{method} is already scheduled, coalesced')
                 else:
                     _logger.error(f'No such method {method} in League() class!')
 
-            if self.delayed_requests:  # if there are any delayed reqs
-                reqs_to_make = [req for req in self.delayed_requests if req['time_to_req'] < current_dt]
-                self.delayed_requests = [req for req in self.delayed_requests if req not in reqs_to_make]
-                for req in reqs_to_make:
-                    method = req['func']['method']
-                    args = req['func']['args']
-                    kwargs = req['func']['kwargs']
-
-                    num_made_reqs = self._len_requests_made()
-                    if num_made_reqs >= MAX_REQUESTS_PER_MIN:
-                        _logger.debug(f'Making too many requests!  Delaying {method} request.')
-                        self._append_delayed_request({'func': {'method': method, 'args': args, 'kwargs': kwargs},
-                                                      'time_to_req': current_dt + dt.timedelta(minutes=1)})
-                    else:
-                        getattr(self, method)(*args, **kwargs)
-                        sleep(0.1)
+                # pick up everything already queued before choosing what goes first
+                if not self.req_queue.empty():
+                    continue
+
+            # everything due that there are tokens for goes out at once, then is handled in priority order
+            now = time.monotonic()
+            batch = []
+            while self.scheduler.has_ready(now) and self.rate_limiter.take():
+                batch.append(self.scheduler.pop_ready(now))
+
+            if self.scheduler.has_ready(now):
+                _logger.debug(f'Making too many requests!  Waiting {self.rate_limiter.wait_time():.1f} s.')
+                metrics.registry.count('league deferred')
+
+            self._prefetch(batch)
+            for func in batch:
+                getattr(self, func['method'])(*func['args'], **func['kwargs'])
+            self.prefetched.clear()  # results of requests that were not picked up are stale next time
 
 
 class Bank(threading.Thread):
@@ -368,13 +737,26 @@ class Bank(threading.Thread):
     Threading class that acts as intermediary between gui and requesting thread
     """
     def __init__(self, kill_flag: KillFlag, resp_queue: queue.Queue, league_queue: queue.Queue,
-                 gui_queue: queue.Queue, period_hours: int = 24):
+                 gui_queue: queue.Queue, period_hours: int = 24, team: str = None, data_path: Path = DATA_PATH):
+        """
+        :param team: team this Bank() follows when one League() serves several teams (see League.subscribe()), None
+        for the League default team
+        :param data_path: folder for the saved json files, give every followed team its own
+        """
         super().__init__()
 
+        self.team = team
+        self.team_kwargs = {'team': team} if team else {}  # for the team specific League requests
+        self.data_path = Path(data_path)
+        self.data_path.mkdir(parents=True, exist_ok=True)
+
         self.kill_flag = kill_flag
         self.resp_queue = resp_queue
         self.league_queue = league_queue
-        self.gui_queue = gui_queue
+        self.gui_queue = gui_queue  # Bank() -> gui, every saved update is passed on as message
+        self.stats = QueueStats('Bank')
+        self.writer = WriteBehind(name=f'WriteBehind-{team or "default"}')  # json files are saved off this thread
+        self.writer.start()
 
         self.period_hours = period_hours
         self.standings_tod = dt.timedelta(minutes=0)
@@ -405,22 +787,22 @@ class Bank(threading.Thread):
         # load league standings
         try:
             _logger.debug('Bank().init retrieve standings.json')
-            with open('resources/standings.json') as f:
+            with open(self.data_path / 'standings.json') as f:
                 self.standings = json.load(f)
                 # refresh standings if old
                 if current_dt - dt.datetime.strptime(self.standings['requestTime'], TIME_FORMAT).astimezone(
                         None) > dt.timedelta(hours=6):
-                    self.league_queue.put({'method': 'get_standings', 'args': [], 'kwargs': {}, 'delay': 0})
+                    self.league_queue.put(message('get_standings'))
         except FileNotFoundError:
             _logger.debug('Bank().init standings.json does not exist, make request')
             self.standings = {}
             # make request to get league standings immediately rather than wait
-            self.league_queue.put({'method': 'get_standings', 'args': [], 'kwargs': {}, 'delay': 0})
+            self.league_queue.put(message('get_standings'))
 
         # load team schedule
         try:
             _logger.debug('Bank().init retrieve schedule.json')
-            with open('resources/schedule.json') as f:
+            with open(self.data_path / 'schedule.json') as f:
                 self.schedule = json.load(f)
                 self.set_game_ids()
 
@@ -428,12 +810,12 @@ class Bank(threading.Thread):
                 # !!! refresh if existing schedule is for team other than current active in settings
                 if current_dt - dt.datetime.strptime(self.schedule['requestTime'], TIME_FORMAT).astimezone(None) \
                         > dt.timedelta(hours=6):
-                    self.league_queue.put({'method': 'get_schedule', 'args': [], 'kwargs': {}, 'delay': 0})
+                    self.league_queue.put(message('get_schedule', kwargs=self.team_kwargs))
         except FileNotFoundError:
             _logger.debug('Bank().init schedule.json does not exist, make request')
             self.schedule = {}
             # make request to get league standings immediately rather than wait
-            self.league_queue.put({'method': 'get_schedule', 'args': [], 'kwargs': {}, 'delay': 0})
+            self.league_queue.put(message('get_schedule', kwargs=self.team_kwargs))
             # game request will be triggered when response is passed to Bank.save_schedule()
 
             # if no schedule exists make sure to check for games in 5 seconds
@@ -442,27 +824,41 @@ class Bank(threading.Thread):
         # load team roster
         try:
             _logger.debug('Bank().init retrieve roster.json')
-            with open('resources/roster.json') as f:
+            with open(self.data_path / 'roster.json') as f:
                 self.roster = json.load(f)
+                self.roster_index = PlayerIndex()
+                self.roster_index.add_club_roster(self.roster)
                 # refresh roster if old
                 # !!! refresh if existing roster if for team other than current active in settings
                 if current_dt - dt.datetime.strptime(self.roster['requestTime'], TIME_FORMAT).astimezone(None) \
                         > dt.timedelta(hours=6):
-                    self.league_queue.put({'method': 'get_roster', 'args': [], 'kwargs': {}, 'delay': 0})
+                    self.league_queue.put(message('get_roster', kwargs=self.team_kwargs))
         except FileNotFoundError:
             _logger.debug('Bank().init roster.json does not exist, make request')
             self.roster = {}
+            self.roster_index = PlayerIndex()
             # make request to get league standings immediately rather than wait
-            self.league_queue.put({'method': 'get_roster', 'args': [], 'kwargs': {}, 'delay': 0})
+            self.league_queue.put(message('get_roster', kwargs=self.team_kwargs))
 
         _logger.info('Initialize Bank() thread')
         return
 
+    def stop(self):
+        """
+        sets the kill flag and wakes the thread, so it does not have to poll the flag while idle
+        """
+        self.kill_flag.set()
+        self.resp_queue.put(None)
+
+    def _to_gui(self, method, data):
+        if self.gui_queue is not None:
+            self.gui_queue.put(message(method, [data], self.team_kwargs))
+
     def save_standings(self, standings):
         _logger.info('Save standings to file')
         self.standings = standings
-        with open('resources/standings.json', 'w') as f:
-            json.dump(self.standings, f, indent=2)  # noqa (ignore pycharm false pos)
+        self.writer.save(self.data_path / 'standings.json', self.standings)
+        self._to_gui('update_standings', self.standings)
 
         return
 
@@ -470,8 +866,8 @@ class Bank(threading.Thread):
         _logger.info('Save schedule to file')
         self.schedule = schedule
 
-        with open('resources/schedule.json', 'w') as f:
-            json.dump(self.schedule, f, indent=2)  # noqa (ignore pycharm false pos)
+        self.writer.save(self.data_path / 'schedule.json', self.schedule)
+        self._to_gui('update_schedule', self.schedule)
 
         # if current_game is not set, then it is safe to run and possibly update game_update_time
         # this should be run in case of schedule changes
@@ -484,8 +880,10 @@ class Bank(threading.Thread):
     def save_roster(self, roster):
         _logger.info('Save roster to file')
         self.roster = roster
-        with open('resources/roster.json', 'w') as f:
-            json.dump(self.roster, f, indent=2)  # noqa (ignore pycharm false pos)
+        self.roster_index = PlayerIndex()  # playerId lookup into self.roster
+        self.roster_index.add_club_roster(roster)
+        self.writer.save(self.data_path / 'roster.json', self.roster)
+        self._to_gui('update_roster', self.roster)
 
         return
 
@@ -494,7 +892,7 @@ class Bank(threading.Thread):
 
         if not self.schedule:
             _logger.debug('Back().schedule not set for method Bank().set_game_ids()')
-            self.league_queue.put({'method': 'get_schedule', 'args': [], 'kwargs': {}, 'delay': 0})
+            self.league_queue.put(message('get_schedule', kwargs=self.team_kwargs))
 
         current_dt = dt.datetime.now().astimezone(None)
         last_gt = current_dt - dt.timedelta(days=1)
@@ -559,22 +957,53 @@ class Bank(threading.Thread):
             self.next_game = {}
             # self.game_update_time = current_dt + dt.timedelta(days=500)
 
-        self.league_queue.put({'method': 'get_game', 'args': [gm_id], 'kwargs': {}, 'delay': 0})
+        self.league_queue.put(message('get_game', [gm_id]))
         return
 
-    def update_live_game(self, game):
+    def update_live_game(self, game, deltas=None, reset=False):
+        """
+        :param game: GAME_MAP values of the live game
+        :param deltas: plays since the last update from PlayTracker, None if game already has the full 'plays' list
+        :param reset: drop the plays kept so far before applying deltas
+        """
         _logger.debug('Bank(): update_live_game')
+
+        # game and deltas are not changed, League passes the same message to the Bank() of each team playing
+        game = dict(game)
+
+        if deltas is not None:
+            if reset or self.live_game_pbp.get('id') != game['id']:
+                plays = []
+            else:
+                plays = list(self.live_game_pbp.get('plays', []))  # the gui may still hold the old list
+
+            for delta in deltas:
+                if delta['typeDescKey'] == 'goal':
+                    if not delta.get('scoringPlayerName'):
+                        delta = {**delta, 'scoringPlayerName': self.roster_index.name(delta.get('scoringPlayerId'))}
+                    _logger.info(f'Bank().update_live_game: goal {delta["scoringPlayerName"]}, '
+                                 f'P{delta["period"]} {delta["timeInPeriod"]}')
+                    plays.append(delta)
+                elif delta['typeDescKey'] == 'penalty':
+                    _logger.info(f'Bank().update_live_game: {delta["duration"]} min {delta["descKey"]} penalty '
+                                 f'{delta.get("committedByPlayerName", "")}, '
+                                 f'P{delta["period"]} {delta["timeInPeriod"]}')
+                elif delta['typeDescKey'] == 'period-end':
+                    _logger.info(f'Bank().update_live_game: end of period {delta["period"]}')
+
+            game['plays'] = plays
+
         intermission = 'Intermission' if game['inIntermission'] else 'Period'
         _logger.info(f'Bank().update_live_game: {game["awayTeam"]}: {game["awayScore"]} @ '
                      f'{game["homeTeam"]}: {game["homeScore"]} | {intermission} {game["period"]}, {game["clock"]} | '
                      f'{game["id"]}')
 
-        with open('resources/game_play-by-play.json', 'w') as f:
-            json.dump(game, f, indent=2)  # noqa (ignore pycharm false pos)
+        self.writer.save(self.data_path / 'game_play-by-play.json', game)
 
         prior_state = self.live_game_pbp.get('gameState', 'OFF')
         current_dt = dt.datetime.now().astimezone(None)
         self.live_game_pbp = game
+        self._to_gui('update_game', game)
 
         if game['gameState'] in ('OFF', 'FINAL'):
             # game is over, set live_game (play by play) and current_game (metadata) to empty sets, set next time
@@ -591,7 +1020,7 @@ class Bank(threading.Thread):
 
             if prior_state not in ['OFF', 'FINAL']:
                 # update standings in 15 minutes if game state has changed
-                self.league_queue.put({'method': 'get_standings', 'args': [], 'kwargs': {}, 'delay': 15})
+                self.league_queue.put(message('get_standings', delay=15))
         else:
             # self.live_game_pbp = game
             self.game_update_time = current_dt + dt.timedelta(seconds=30)
@@ -600,16 +1029,31 @@ class Bank(threading.Thread):
 
         return
 
+    def _idle_timeout(self) -> float:
+        """
+        :return: seconds until the next scheduled request, capped in case the kill flag is set without stop()
+        """
+        current_dt = dt.datetime.now().astimezone(None)
+        next_dt = min(self.standings_next_get_time, self.sched_next_get_time, self.roster_next_get_time,
+                      self.game_update_time)
+        return min(max((next_dt - current_dt).total_seconds(), 0), MAX_IDLE_SECONDS)
+
     def run(self):
         _logger.info('Start Bank() thread')
         try:
             while not self.kill_flag:
+                # sleep until a response arrives or the next scheduled request is due
+                try:
+                    func_and_args = self.resp_queue.get(timeout=self._idle_timeout())
+                except queue.Empty:
+                    func_and_args = None
+                self.stats.wakeup(func_and_args)
+
                 current_dt = dt.datetime.now().astimezone(None)
 
                 # handle incoming immediate requests
-                if not self.resp_queue.empty():
+                if func_and_args is not None:
                     _logger.debug('League to Bank Queue has a response')
-                    func_and_args = self.resp_queue.get()
                     method = func_and_args['method']
                     args = func_and_args['args']
                     kwargs = func_and_args['kwargs']
@@ -617,7 +1061,6 @@ class Bank(threading.Thread):
 
                     if hasattr(self, method):
                         getattr(self, method)(*args, **kwargs)
-                        sleep(0.1)
                     else:
                         _logger.error(f'No such method {method} in Bank() class!')
 
@@ -625,37 +1068,38 @@ class Bank(threading.Thread):
                 if self.standings_next_get_time < current_dt:
                     _logger.info('Bank passing standings request')
 
-                    self.league_queue.put({'method': 'get_standings', 'args': [], 'kwargs': {}, 'delay': 0})
+                    self.league_queue.put(message('get_standings'))
                     self.standings_next_get_time = self.standings_next_get_time + dt.timedelta(hours=self.period_hours)
 
                 if self.sched_next_get_time < current_dt:
                     _logger.info(f'Bank() passing schedule request')
 
-                    self.league_queue.put({'method': 'get_schedule', 'args': [], 'kwargs': {}, 'delay': 0})
+                    self.league_queue.put(message('get_schedule', kwargs=self.team_kwargs))
                     self.sched_next_get_time = self.sched_next_get_time + dt.timedelta(hours=self.period_hours)
 
                 if self.roster_next_get_time < current_dt:
                     _logger.info(f'Bank passing roster request')
 
-                    self.league_queue.put({'method': 'get_roster', 'args': [], 'kwargs': {}, 'delay': 0})
+                    self.league_queue.put(message('get_roster', kwargs=self.team_kwargs))
                     self.roster_next_get_time = self.roster_next_get_time + dt.timedelta(hours=self.period_hours)
 
                 # pass live game request to league
                 if self.game_update_time < current_dt:
                     _logger.debug('Bank will make live game update request')
                     if not self.current_game:
-                        # if for some reason self.current_game_id is not set, then make sure it is set or
-                        # self.game_update_time is > current_dt
+                        # if for some reason self.current_game_id is not set, then make sure it is set, this
+                        # requests a game as well
                         self.set_game_ids()
                     else:
-                        self.league_queue.put({'method': 'get_game', 'args': [self.current_game['id']], 'kwargs': {}, 'delay': 0})
-                        # set to make next request in 5 minutes in case get_game doesn't get a response
-                        self.game_update_time = dt.datetime.now().astimezone(None) + dt.timedelta(minutes=5)
-
-                sleep(0.1)
+                        self.league_queue.put(message('get_game', [self.current_game['id']]))
+                    # set to make next request in 5 minutes in case get_game doesn't get a response, else the
+                    # timeout stays 0 and every pass requests the game again
+                    self.game_update_time = dt.datetime.now().astimezone(None) + dt.timedelta(minutes=5)
 
 
         finally:
             _logger.debug(f'Thread {self.name} performing cleanup')
             # Perform any cleanup
+            self.writer.close()  # whatever is still pending goes to disk before the thread ends
+            _logger.info(self.stats.summary())
             _logger.debug(f'Thread {self.name} stopped.')
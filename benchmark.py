@@ -0,0 +1,338 @@
+# MIT License
+#
+# Copyright (c) 2024 mjteter
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""
+Headless benchmarks for the hot paths of main.py, run from the repo folder (main.py needs config.json and resources/):
+
+    python benchmark.py --save           # store the numbers of this machine as baseline
+    python benchmark.py                  # compare against the baseline, exits with 1 on a regression
+    python benchmark.py --filter frame   # only the cases with 'frame' in their name
+
+Every case is timed with perf_counter over enough calls to run for at least 0.2 s, the best of REPEAT rounds is
+reported per call.  Allocations are the peak of memory traced by tracemalloc during a single call, that covers
+python objects (e.g. the bytes handed from PIL to pygame) but not the pixel buffers SDL allocates itself.  The baseline
+is machine specific, save it on the Pi you deploy to (it is not part of the repo).
+"""
+
+import os
+
+os.environ['SDL_VIDEODRIVER'] = 'dummy'  # before pygame opens a display in main
+os.environ['SDL_AUDIODRIVER'] = 'dummy'
+
+import argparse
+import json
+from pathlib import Path
+import platform
+import sys
+import tempfile
+import timeit
+import tracemalloc
+
+import pygame
+from PIL import Image
+
+import beta_pygame
+import data_worker
+import framebuffer
+import main
+import mock_server
+
+
+PATH = Path('.')
+BASELINE_PATH = PATH / 'benchmark_baseline.json'
+GAME_PATH = PATH / 'resources' / 'test_game.json'
+
+REPEAT = 5
+THRESHOLD = 1.25  # slower / more allocating than baseline by this factor is a regression
+MIN_ALLOC_SLACK = 1024  # bytes, allocation differences below this are noise (dict resizes, interned strings)
+
+CASES = {}  # name: setup function returning the callable to measure
+
+
+def case(name: str):
+    def register(setup):
+        CASES[name] = setup
+        return setup
+    return register
+
+
+def fixtures() -> dict:
+    """
+    :return: raw api responses, standings/schedule/roster are made up from the recorded game like the mock server
+    does, the resources/*.json files are already cleaned
+    """
+    with open(GAME_PATH) as game_file:
+        game = json.load(game_file)
+    replay = mock_server.GameReplay(game)
+
+    return {'standings': mock_server.synthetic_standings(),
+            'schedule': mock_server.synthetic_schedule(main.NHL_TEAM, replay),
+            'roster': mock_server.synthetic_club_stats(main.NHL_TEAM, replay),
+            'game': game}
+
+
+@case('clean_standings_response')
+def bench_clean_standings(data):
+    return lambda: data_worker.clean_standings_response(data['standings'])
+
+
+@case('clean_schedule_response')
+def bench_clean_schedule(data):
+    return lambda: data_worker.clean_schedule_response(data['schedule'], main.NHL_TEAM)
+
+
+@case('clean_roster_response')
+def bench_clean_roster(data):
+    return lambda: data_worker.clean_roster_response(data['roster'], main.NHL_TEAM)
+
+
+@case('clean_game_response')
+def bench_clean_game(data):
+    return lambda: data_worker.clean_game_response(data['game'], main.GAME_MAP)
+
+
+@case('DrawImage_resize_convert')
+def bench_draw_image(data):
+    with Image.open(main.LOGO_PATH / f'{main.NHL_TEAM}{main.LOGO_SUFFIX}.png') as image:
+        image.load()
+    return lambda: main.DrawImage(None, image, size=(188, 125))
+
+
+@case('DrawImage_fill')
+def bench_fill(data):
+    with Image.open(main.LOGO_PATH / 'wifi.png') as image:
+        image.load()
+    surface = main.DrawImage(None, image, size=(15, 15)).image
+    return lambda: main.DrawImage.fill(surface, main.BLUE)
+
+
+@case('DrawString_clock')
+def bench_draw_clock(data):
+    surface = pygame.Surface((main.SURFACE_WIDTH, main.SURFACE_HEIGHT))
+    return lambda: main.DrawString(surface, '02:18', main.FONT_SCORE, main.MAIN_FONT, 40).left(198)
+
+
+@case('DrawString_label')
+def bench_draw_label(data):
+    surface = pygame.Surface((main.SURFACE_WIDTH, main.SURFACE_HEIGHT))
+    return lambda: main.DrawString(surface, 'Intermission', main.FONT_SMALL_BOLD, main.MAIN_FONT, 20).right()
+
+
+@case('multi_uniform_text_fill')
+def bench_text_fill(data):
+    # the score boxes of beta_pygame.LiveGame
+    text_rect_list = [['3', pygame.Rect((192, 0), (130, 110)), 'mc'],
+                      ['10', pygame.Rect((192, 110), (130, 110)), 'mc']]
+    return lambda: beta_pygame.multi_uniform_text_fill(text_rect_list)
+
+
+@case('multi_uniform_text_fill_cold')
+def bench_text_fill_cold(data):
+    """first build of a page, nothing solved or loaded yet"""
+    text_rect_list = [['3', pygame.Rect((192, 0), (130, 110)), 'mc'],
+                      ['10', pygame.Rect((192, 110), (130, 110)), 'mc']]
+
+    def run():
+        beta_pygame.fit_font_size.cache_clear()
+        beta_pygame.get_font.cache_clear()
+        beta_pygame.multi_uniform_text_fill(text_rect_list)
+    return run
+
+
+@case('create_scaled_surf')
+def bench_scale(data):
+    return lambda: main.create_scaled_surf(main.display_surf, aa=False)
+
+
+@case('create_scaled_surf_aa')
+def bench_scale_aa(data):
+    return lambda: main.create_scaled_surf(main.display_surf, aa=True)
+
+
+def framebuffer_case(changed: bool):
+    fb = framebuffer.Framebuffer(Path(tempfile.mkdtemp()) / 'fb', size=main.tft_surf.get_size())
+    frames = [main.tft_surf.copy(), main.tft_surf.copy()]
+    frames[1].fill(main.BLUE)
+    fb.write(frames[0])
+
+    def run():
+        if changed:
+            frames.reverse()
+        fb.write(frames[0])
+    return run
+
+
+@case('framebuffer_write')
+def bench_framebuffer_write(data):
+    """DISPLAY BACKEND FRAMEBUFFER, every row of the frame changed and is converted and written"""
+    return framebuffer_case(True)
+
+
+@case('framebuffer_write_unchanged')
+def bench_framebuffer_unchanged(data):
+    """full frame written again, every row is compared but none written"""
+    return framebuffer_case(False)
+
+
+def frame_case(dirty_rects: bool, full: bool = False):
+    def run():
+        main.DIRTY_RECTS = dirty_rects
+        if full:
+            main.dirty_rects.full_frame()
+        main.frame([])
+    return run
+
+
+@case('frame_steady')
+def bench_frame_steady(data):
+    """nothing changed since the last frame, what an idle kiosk draws IDLE_FPS times a second"""
+    return frame_case(True)
+
+
+@case('frame_full')
+def bench_frame_full(data):
+    """full redraw, e.g. after a VIDEOEXPOSE or new data"""
+    return frame_case(True, full=True)
+
+
+@case('frame_no_dirty_rects')
+def bench_frame_no_dirty_rects(data):
+    """DISPLAY DIRTY_RECTS false in config.json, the whole surface is composed and scaled every frame"""
+    return frame_case(False)
+
+
+def measure(func) -> dict:
+    """
+    :return: {'time_us': best time per call, 'peak_bytes': peak traced memory of one call}
+    """
+    func()  # warm up, fonts and caches are loaded on first use
+
+    timer = timeit.Timer(func)
+    number, _ = timer.autorange()  # calls per round, at least 0.2 s
+    best = min(timer.repeat(repeat=REPEAT, number=number)) / number
+
+    tracemalloc.start()
+    try:
+        before, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {'time_us': round(best * 1e6, 2), 'peak_bytes': max(0, peak - before), 'calls': number}
+
+
+def run(names) -> dict:
+    data = fixtures()
+    dirty_rects_setting = main.DIRTY_RECTS
+    show_api_stats = main.SHOW_API_STATS
+
+    main.SHOW_API_STATS = False  # measure the kiosk, not the overlay
+    results = {}
+    try:
+        for name in names:
+            results[name] = measure(CASES[name](data))
+    finally:
+        main.DIRTY_RECTS = dirty_rects_setting
+        main.SHOW_API_STATS = show_api_stats
+
+    return results
+
+
+def compare(results: dict, baseline: dict, threshold: float = THRESHOLD) -> list:
+    """
+    :return: names of the cases that are slower or allocate more than threshold times their baseline
+    """
+    regressions = []
+    old_cases = baseline.get('cases', {})
+
+    print(f'{"case":<28} {"time us":>10} {"baseline":>10} {"ratio":>6}   {"peak KiB":>9} {"baseline":>9}')
+    for name, result in results.items():
+        old = old_cases.get(name)
+        if old is None:
+            print(f'{name:<28} {result["time_us"]:>10.2f} {"-":>10} {"-":>6}   '
+                  f'{result["peak_bytes"] / 1024:>9.1f} {"-":>9}')
+            continue
+
+        ratio = result['time_us'] / old['time_us'] if old['time_us'] else 1
+        slower = ratio > threshold
+        bigger = result['peak_bytes'] > max(old['peak_bytes'] * threshold, old['peak_bytes'] + MIN_ALLOC_SLACK)
+        flag = '  REGRESSION' if slower or bigger else ''
+        if flag:
+            regressions.append(name)
+
+        print(f'{name:<28} {result["time_us"]:>10.2f} {old["time_us"]:>10.2f} {ratio:>6.2f}   '
+              f'{result["peak_bytes"] / 1024:>9.1f} {old["peak_bytes"] / 1024:>9.1f}{flag}')
+
+    return regressions
+
+
+def main_cli(argv=None) -> int:
+    parser = argparse.ArgumentParser(description='headless benchmarks of the hockey kiosk hot paths')
+    parser.add_argument('--save', action='store_true', help='store the results as new baseline')
+    parser.add_argument('--baseline', type=Path, default=BASELINE_PATH, help='baseline json file')
+    parser.add_argument('--filter', default='', help='only run cases with this text in their name')
+    parser.add_argument('--threshold', type=float, default=THRESHOLD,
+                        help='ratio to the baseline that counts as regression')
+    args = parser.parse_args(argv)
+
+    names = [name for name in CASES if args.filter in name]
+    if not names:
+        print(f'no case matches {args.filter!r}, cases: {", ".join(CASES)}')
+        return 2
+
+    results = run(names)
+
+    if args.save:
+        baseline = {'machine': platform.machine(), 'python': platform.python_version(),
+                    'pygame': pygame.version.ver, 'cases': results}
+        if args.filter and args.baseline.exists():  # keep the cases that were not run
+            with open(args.baseline) as baseline_file:
+                old = json.load(baseline_file)
+            baseline['cases'] = {**old.get('cases', {}), **results}
+        with open(args.baseline, 'w') as baseline_file:
+            json.dump(baseline, baseline_file, indent=2)
+        compare(results, {})
+        print(f'baseline saved to {args.baseline}')
+        return 0
+
+    if not args.baseline.exists():
+        compare(results, {})
+        print(f'no baseline at {args.baseline}, run with --save first')
+        return 0
+
+    with open(args.baseline) as baseline_file:
+        baseline = json.load(baseline_file)
+    if baseline.get('machine') != platform.machine():
+        print(f'baseline was saved on {baseline.get("machine")}, this is {platform.machine()}')
+
+    regressions = compare(results, baseline, args.threshold)
+    if regressions:
+        print(f'{len(regressions)} regression(s): {", ".join(regressions)}')
+        return 1
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main_cli())
@@ -25,14 +25,14 @@ import json
 # import os.path
 
 # from time import time as _time
-from time import sleep
+from time import monotonic
 # import datetime as dt
 # import math
 
 # import threading
 import queue
 
-from api_threading import League, Bank, KillFlag
+from api_threading import League, Bank, KillFlag, QueueStats, DATA_PATH
 from api_threading import _logger as _logger_api
 import logging
 
@@ -56,6 +56,7 @@ def get_settings():
     #         settings = json.load(f)
     # except FileNotFoundError:
     settings = {'team': 'PHI',
+                'teams': [],  # more teams to follow off the same League, e.g. ['LAK', 'NYR']
                 'period': 6,  # time in hours to routinely refresh standings, schedule, roster, etc
                 }
 
@@ -78,14 +79,14 @@ def main():
         # queue to pass requests to the league thread
         req_to_league_queue = queue.Queue()  # in triplet format: ('method_name', [arg_list], {'kwarg': 'dict'})
 
-        # queue to pass gui requests to bank
-        gui_to_bank_queue = queue.Queue()
+        # queue to pass updates from bank to the gui
+        bank_to_gui_queue = queue.Queue()   # same format as above
 
         # initialize threads
         league_thread = League(resp_to_bank_queue, req_to_league_queue, team=settings['team'])  # ,
                                # period_hours=settings['period'])  # , standings_tod=standings_tod,
                                # sched_period_days=settings['schedule']['period'], sched_tod=sched_tod)
-        bank_thread = Bank(kill_flag, resp_to_bank_queue, req_to_league_queue, gui_to_bank_queue,
+        bank_thread = Bank(kill_flag, resp_to_bank_queue, req_to_league_queue, bank_to_gui_queue,
                            period_hours=settings['period'])
 
         league_thread.name = 'League'
@@ -94,18 +95,41 @@ def main():
         # collect non daemon threads for careful termination
         non_daemon_threads.append(bank_thread)
 
+        # one more bank per followed team, all served by the same league thread
+        for team in settings['teams']:
+            team_queue = queue.Queue()
+            league_thread.subscribe(team, team_queue)
+            team_bank = Bank(kill_flag, team_queue, req_to_league_queue, bank_to_gui_queue,
+                             period_hours=settings['period'], team=team, data_path=DATA_PATH / team)
+            team_bank.name = f'Bank {team}'
+            non_daemon_threads.append(team_bank)
+
         # start threads
         league_thread.start()
-        bank_thread.start()
-
-        # sleep for testing
-        sleep(5)
+        for thread in non_daemon_threads:
+            thread.start()
+
+        # stand in for the gui for testing, block on the queue instead of sleeping
+        gui_stats = QueueStats('GUI')
+        test_end = monotonic() + 5
+        while monotonic() < test_end:
+            try:
+                update = bank_to_gui_queue.get(timeout=max(0, test_end - monotonic()))
+            except queue.Empty:
+                break
+            gui_stats.wakeup(update)
+            _logger.debug(f'GUI received {update["method"]} {update["kwargs"].get("team", settings["team"])}')
+
+        _logger.info(league_thread.stats.summary())
+        _logger.info(gui_stats.summary())
     except KeyboardInterrupt:
         _logger.debug('Interrupt received, setting quit flag.')
         kill_flag.set()
     finally:
         _logger.debug('Starting termination, setting quit flag.')
         kill_flag.set()  # ensure flag is set
+        for thread in non_daemon_threads:
+            thread.stop()  # wake the thread so it sees the flag without waiting for its next timer
 
         # Join threads
         _logger.debug('Attempting to join threads')
@@ -22,6 +22,10 @@
 
 # import os
 # from time import sleep
+from collections import OrderedDict
+import functools
+import os
+from pathlib import Path
 from typing import Tuple, Dict, List
 import sys
 
@@ -39,6 +43,7 @@ from pygame.locals import *  # for key coordinates
 
 PATH = sys.path[0] + '/'
 LOGO_PATH = PATH + '/resources/logos/'
+LOGO_CACHE_PATH = Path(PATH) / 'resources' / 'logo_cache'
 FONT_PATH = PATH + '/resources/fonts/'
 
 BACKGROUNDS = {'dark': {'gray': [(0, 0, 3, 255),
@@ -104,6 +109,9 @@ W_SIZE = 480  # Width of window size
 H_SIZE = 320  # Height of window size
 TOP_MENU_H_SIZE = 40  # height of tabs at top
 WINDOW_SIZE = (W_SIZE, H_SIZE)
+FONT_CACHE_SIZE = 32  # Font objects kept open, one per (path, size)
+LAYOUT_CACHE_SIZE = 128  # solved font sizes, one per layout of texts and boxes
+LOGO_CACHE_SIZE = 16  # rasterized logos kept in memory, a page shows two
 # HELP = ['Press ESC to enable/disable Menu',
 #         'Press ENTER to access a Sub-Menu or use an option',
 #         'Press UP/DOWN to move through Menu',
@@ -138,6 +146,90 @@ def pyg_draw_rect_multi_border(surface: pygame.Surface,
     return
 
 
+@functools.lru_cache(maxsize=FONT_CACHE_SIZE)
+def get_font(font_path: str, font_size: int) -> pygame.font.Font:
+    """
+    Shared Font object, loading a ttf file is the expensive part of trying a font size
+    :param font_path:
+    :param font_size:
+    :return:
+    """
+    return pygame.font.Font(font_path, font_size)
+
+
+def font_sizes(start: int) -> List[int]:
+    """
+    The font sizes tried for a fit, largest first: steps of 10 down to 50, then 2 down to 16, then 1
+    :param start: largest font size
+    :return:
+    """
+    sizes = []
+    font_size = start
+    while font_size > 0:
+        sizes.append(font_size)
+        if font_size > 50:
+            font_size -= 10
+        elif font_size > 16:
+            font_size -= 2
+        else:
+            font_size -= 1
+    return sizes
+
+
+def largest_fitting_size(font_path: str, fits, start: int) -> int:
+    """
+    Binary search over font_sizes(start), text only grows with the font size so the first size that fits is found
+    with a handful of size() calls instead of trying every size
+    :param font_path:
+    :param fits: function(font) returning True if the texts fit with that font
+    :param start: largest font size
+    :return: largest font size that fits, the smallest one if none does
+    """
+    sizes = font_sizes(start)
+    low, high = 0, len(sizes) - 1  # sizes[high] is used if nothing fits
+    while low < high:
+        middle = (low + high) // 2
+        if fits(get_font(font_path, sizes[middle])):
+            high = middle
+        else:
+            low = middle + 1
+    return sizes[low]
+
+
+@functools.lru_cache(maxsize=LAYOUT_CACHE_SIZE)
+def fit_font_size(font_path: str, layout: Tuple, start: int = 200) -> int:
+    """
+    Largest font size at which every text fits into its own box
+    :param font_path:
+    :param layout: tuple of (text, box width, box height), hashable so a page rebuilt with the same texts and boxes
+    is solved only once
+    :param start: largest font size
+    :return:
+    """
+    def fits(font):
+        return all(font.size(text)[0] <= width and font.size(text)[1] <= height for text, width, height in layout)
+
+    return largest_fitting_size(font_path, fits, start)
+
+
+@functools.lru_cache(maxsize=LAYOUT_CACHE_SIZE)
+def fit_font_size_row(font_path: str, texts: Tuple, width: int, height: int, start: int = 50) -> int:
+    """
+    Largest font size at which all texts side by side fit into width and each of them into height
+    :param font_path:
+    :param texts:
+    :param width:
+    :param height:
+    :param start: largest font size
+    :return:
+    """
+    def fits(font):
+        sizes = [font.size(text) for text in texts]
+        return sum(size[0] for size in sizes) <= width and all(size[1] <= height for size in sizes)
+
+    return largest_fitting_size(font_path, fits, start)
+
+
 def multi_uniform_text_fill(text_rect_list: List, font_path: str = FONT_PATH + 'JetBrainsMono-Medium.ttf',
                             color: Tuple[int, int, int, int] = COLOR_MAIN_FONT):
     """
@@ -148,35 +240,10 @@ def multi_uniform_text_fill(text_rect_list: List, font_path: str = FONT_PATH + '
     :param color:
     :return:
     """
+    font_size = fit_font_size(font_path, tuple((text, rect.width, rect.height) for (text, rect, loc) in text_rect_list))
+    font = get_font(font_path, font_size)
 
-    text_fits = False
-    font_size = 200
-    font_rect_list = []
-
-    while not text_fits:
-        font = pygame.font.Font(font_path, font_size)
-        font_rect_list = []
-        # print(font_size)
-        text_fits = True
-        for (text, rect, loc) in text_rect_list:
-            test_text = font.render(text, True, color)
-            font_rect_list.append([test_text, rect, loc])
-            width = test_text.get_rect().width
-            height = test_text.get_rect().height
-            # print(width, rect.width, height, rect.height)
-            # print(font.size(text), font.get_height())
-            if height > rect.height or width > rect.width:
-                text_fits = False
-
-        if not text_fits:
-            if font_size > 50:
-                font_size -= 10
-            elif font_size > 16:
-                font_size -= 2
-            else:
-                font_size -= 1
-
-    return font_rect_list
+    return [[font.render(text, True, color), rect, loc] for (text, rect, loc) in text_rect_list]
 
 
 def render_font_rect_list(surface: pygame.Surface, font_rect_list: List):
@@ -210,31 +277,111 @@ def render_font_rect_list(surface: pygame.Surface, font_rect_list: List):
     return
 
 
+def rasterize_logo(filepath: str, size: Tuple[int, int]) -> pygame.Surface:
+    """
+    Renders an svg logo, trims the empty border and centers it scaled into a transparent surface of size
+    :param filepath:
+    :param size:
+    :return:
+    """
+    raw_logo = pygame.image.load(filepath)
+    pixel_rect = raw_logo.get_bounding_rect()  # sometimes pygame adds empty borders
+    pixel_surf = pygame.Surface(pixel_rect.size).convert_alpha()
+    pixel_surf.fill(COLOR_EMPTY)  # make sure background is transparent
+    pixel_surf.blit(raw_logo, (0, 0), pixel_rect)
+
+    cleaned_size = pixel_surf.get_size()
+
+    if (cleaned_size[0] / cleaned_size[1]) <= (size[0] / size[1]):
+        w1 = round(size[1] / cleaned_size[1] * cleaned_size[0])
+        h1 = size[1]
+    else:
+        w1 = size[0]
+        h1 = round(size[0] / cleaned_size[0] * cleaned_size[1])
+
+    pixel_surf = pygame.transform.scale(pixel_surf, (w1, h1))
+
+    surf = pygame.Surface(size).convert_alpha()
+    surf.fill(COLOR_EMPTY)  # make sure background is transparent
+    surf.blit(pixel_surf, pixel_surf.get_rect(center=surf.get_rect().center))
+    return surf
+
+
+class LogoCache(object):
+    def __init__(self, cache_path: Path = LOGO_CACHE_PATH, max_surfaces: int = LOGO_CACHE_SIZE):
+        """
+        Rasterized logos by (svg file, mtime, size), the theme is part of the file name (PHI_dark.svg).  Kept in
+        memory for page rebuilds and on disk as raw RGBA pixels for the next boot, a changed svg gets a new mtime and
+        is rendered again
+        :param cache_path: folder for the pixel buffers, None to keep them in memory only
+        :param max_surfaces: logos kept in memory, least recently used are dropped
+        """
+        self.cache_path = cache_path
+        self.max_surfaces = max_surfaces
+        self.surfaces = OrderedDict()  # (filepath, mtime_ns, size): surface, oldest first
+
+    def _buffer_path(self, filepath: str, mtime_ns: int, size: Tuple[int, int]) -> Path:
+        return self.cache_path / f'{Path(filepath).stem}@{size[0]}x{size[1]}-{mtime_ns}.rgba'
+
+    def _load(self, buffer_path: Path, size: Tuple[int, int]):
+        try:
+            with open(buffer_path, 'rb') as buffer_file:
+                pixels = buffer_file.read()
+        except OSError:
+            return None
+
+        if len(pixels) != size[0] * size[1] * 4:  # cut short by a power loss while saving
+            return None
+        return pygame.image.frombytes(pixels, size, 'RGBA').convert_alpha()
+
+    def _save(self, buffer_path: Path, surf: pygame.Surface):
+        try:
+            self.cache_path.mkdir(parents=True, exist_ok=True)
+            for stale in self.cache_path.glob(buffer_path.name.rsplit('-', 1)[0] + '-*.rgba'):
+                stale.unlink()  # same logo and size rendered from an older svg
+            temp_path = buffer_path.with_suffix('.tmp')
+            with open(temp_path, 'wb') as buffer_file:
+                buffer_file.write(pygame.image.tobytes(surf, 'RGBA'))
+            os.replace(temp_path, buffer_path)
+        except OSError as save_ex:
+            print(f'logo cache not saved: {save_ex}')
+
+    def get(self, filepath: str, size: Tuple[int, int]) -> pygame.Surface:
+        """
+        :param filepath: svg file of the logo
+        :param size: (width, height) of the returned surface
+        :return: ready to blit surface, shared, do not draw on it
+        """
+        size = tuple(size)
+        mtime_ns = os.stat(filepath).st_mtime_ns
+        key = (filepath, mtime_ns, size)
+
+        if key in self.surfaces:
+            self.surfaces.move_to_end(key)
+            return self.surfaces[key]
+
+        buffer_path = self._buffer_path(filepath, mtime_ns, size) if self.cache_path is not None else None
+        surf = self._load(buffer_path, size) if buffer_path is not None else None
+        if surf is None:
+            surf = rasterize_logo(filepath, size)
+            if buffer_path is not None:
+                self._save(buffer_path, surf)
+
+        self.surfaces[key] = surf
+        while len(self.surfaces) > self.max_surfaces:
+            self.surfaces.popitem(last=False)
+        return surf
+
+
+logo_cache = LogoCache()
+
+
 class Logo(pygame.sprite.Sprite):
     def __init__(self, filepath: str, left_top: Tuple[int, int] = (0, 0), size: Tuple[int, int] = (177, 118)):
         super().__init__()
 
-        raw_logo = pygame.image.load(filepath)
-        pixel_rect = raw_logo.get_bounding_rect()  # sometimes pygame adds empty borders
-        pixel_surf = pygame.Surface(pixel_rect.size).convert_alpha()
-        pixel_surf.fill(COLOR_EMPTY)  # make sure background is transparent
-        pixel_surf.blit(raw_logo, (0, 0), pixel_rect)
-
-        cleaned_size = pixel_surf.get_size()
-
-        if (cleaned_size[0] / cleaned_size[1]) <= (size[0] / size[1]):
-            w1 = round(size[1] / cleaned_size[1] * cleaned_size[0])
-            h1 = size[1]
-        else:
-            w1 = size[0]
-            h1 = round(size[0] / cleaned_size[0] * cleaned_size[1])
-
-        pixel_surf = pygame.transform.scale(pixel_surf, (w1, h1))
-
         self.rect = pygame.Rect(left_top, size)
-        self.surf = pygame.Surface(self.rect.size).convert_alpha()
-        self.surf.fill(COLOR_EMPTY)  # make sure background is transparent
-        self.surf.blit(pixel_surf, pixel_surf.get_rect(center=self.surf.get_rect().center))
+        self.surf = logo_cache.get(filepath, self.rect.size)
 
         # self.rect = self.surf.get_rect()
 
@@ -414,42 +561,22 @@ class MultiPage(pygame.sprite.Sprite):
         self.menu_rect = self.menu_surf.get_rect()
 
         # determine what the correct font size should be
-        menu_text_fits = False
-        self.menu_font_size = 50
-        tab_widths = [10 for _ in range(self.total_tabs)]
-
-        while not menu_text_fits:
-            self.menu_font = pygame.font.Font(FONT_PATH + 'JetBrainsMono-Medium.ttf', self.menu_font_size)
-            tab_widths = []
-            tab_height = 0
-            total_width = 0
-            for ii in range(self.total_tabs):
-                test_font = self.menu_font.render(tabs[ii][0], True, COLOR_TAB_TEXT_ACTIVE)
-                tab_widths.append(test_font.get_rect().width)
-                tab_height = test_font.get_rect().height
-                total_width += test_font.get_rect().width
-
-            if tab_height > self.tab_padded_height or total_width > self.tab_total_padded_width:
-                if self.menu_font_size > 50:
-                    self.menu_font_size -= 10
-                elif self.menu_font_size > 16:
-                    self.menu_font_size -= 2
-                else:
-                    self.menu_font_size -= 1
-            # elif self.menu_font_size < 6:
-            #     menu_text_fits = True  # bug out on failure to find reasonable font size
-            else:
-                menu_text_fits = True
-                # print(tab_widths)
+        self.menu_font_size = fit_font_size_row(FONT_PATH + 'JetBrainsMono-Medium.ttf', tuple(tab[0] for tab in tabs),
+                                                self.tab_total_padded_width, self.tab_padded_height)
+        self.menu_font = get_font(FONT_PATH + 'JetBrainsMono-Medium.ttf', self.menu_font_size)
+        tab_widths = [self.menu_font.size(tabs[ii][0])[0] for ii in range(self.total_tabs)]
+        total_width = sum(tab_widths)
+
+        # print(tab_widths)
+        ii = 0
+        while total_width < self.tab_total_padded_width:
+            tab_widths[ii] += 1
+            total_width += 1
+            if ii == self.total_tabs - 1:
                 ii = 0
-                while total_width < self.tab_total_padded_width:
-                    tab_widths[ii] += 1
-                    total_width += 1
-                    if ii == self.total_tabs - 1:
-                        ii = 0
-                    else:
-                        ii += 1
-                # print(tab_widths)
+            else:
+                ii += 1
+        # print(tab_widths)
         print(self.menu_font_size)
         tab_rects = []
         border_lines = []
@@ -468,7 +595,7 @@ class MultiPage(pygame.sprite.Sprite):
                 pygame.draw.line(self.menu_surf, COLOR_BORDER, border_lines[-1][0], border_lines[-1][1], border_width)
             tab_rects.append(pygame.Rect((tab_left, tab_top), (tab_width, tab_height)))
 
-        self.menu_font_bold = pygame.font.Font(FONT_PATH + 'JetBrainsMono-ExtraBold.ttf', self.menu_font_size)
+        self.menu_font_bold = get_font(FONT_PATH + 'JetBrainsMono-ExtraBold.ttf', self.menu_font_size)
         # print(tab_rects)
         for ii, (page_title, page) in enumerate(tabs):
             if self.active_tab == ii:  # if active
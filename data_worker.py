@@ -0,0 +1,560 @@
+# MIT License
+#
+# Copyright (c) 2024 mjteter
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""
+Fetching and cleaning of the hockey data (standings, schedule, roster, game) for main.py, either on the calling
+thread (Fetcher) or in a worker process of its own (DataWorker), so json decoding and dict building never hold the GIL
+the 20 FPS pygame loop needs.
+
+The worker is started as `python data_worker.py` and not with multiprocessing, spawn would run main.py (and open a
+second display) in the child and fork copies a process with SDL and running threads.  Parent and worker talk through
+the worker's stdin/stdout, every message is a pickle with a 4 byte length in front:
+
+    parent -> worker: settings dict (first message), ('update',), ('stop',)
+    worker -> parent: ('data', delta), ('unchanged',), ('error', text)
+
+A delta only holds the sections, and in a section only the keys, that changed since the last data sent, e.g. the clock
+and score of the game.  The worker also writes the json/snapshot exports, the parent only has to apply the delta.
+DataWorker restarts the worker when it dies, after a delay that doubles up to max_restart_delay.
+"""
+
+import json
+import os
+from pathlib import Path
+import pickle
+import struct
+import subprocess
+import sys
+import threading
+import time
+
+import requests
+
+import logging
+
+import api_session
+import fetch_engine
+import metrics
+import pbp_stream
+from persistence import atomic_write
+from player_index import PlayerIndex
+import snapshot
+
+
+_logger = logging.getLogger(__name__)
+
+LENGTH = struct.Struct('<I')  # length in front of every pickled message
+MAX_RESTART_DELAY = 60  # seconds, a worker that keeps dying is restarted at most this often
+LOG_FORMAT = '%(asctime)s.%(msecs)03d - worker %(name)s - %(levelname)s - %(message)s'
+
+
+def clean_standings_response(response):
+    standings = { 'Central': {}, 'Pacific': {}, 'Atlantic': {}, 'Metropolitan': {}, 'Western': {}, 'Eastern': {}}
+
+    for team in response['standings']:
+        if len(standings[team['divisionName']]) < 3:
+            standings[team['divisionName']][team['teamAbbrev']['default']] = {'gamesPlayed': team['gamesPlayed'],  # noqa
+                                                                   'wins': team['wins'], 'losses': team['losses'],
+                                                                   'otLosses': team['otLosses'],
+                                                                   'points': team['points'],
+                                                                   'pointPctg': team['pointPctg']}
+        else:
+            standings[team['conferenceName']][team['teamAbbrev']['default']] = {'gamesPlayed': team['gamesPlayed'],  # noqa
+                                                                     'wins': team['wins'], 'losses': team['losses'],
+                                                                     'otLosses': team['otLosses'],
+                                                                     'points': team['points'],
+                                                                     'pointPctg': team['pointPctg']}
+
+    for conf in standings:
+        if conf in ('Western', 'Eastern'):
+            standings[conf] = dict(sorted(standings[conf].items(),
+                                          key=lambda item: (-item[1]['points'], -item[1]['pointPctg'])))
+
+    return standings
+
+
+def clean_schedule_response(response, team: str):
+    schedule = {'team': team, 'games': []}
+    for gm in response['games']:
+        schedule['games'].append({'id': gm['id'],
+                                  'startTimeUTC': gm['startTimeUTC'],
+                                  'gameType': gm['gameType'],  # 1: preseason, 2: regular
+                                  'gameState': gm['gameState'],  # FINAL, OFF, LIVE, FUT, PRE
+                                  'awayTeam': gm['awayTeam']['abbrev'],
+                                  'homeTeam': gm['homeTeam']['abbrev']})
+        schedule['games'][-1]['awayScore'] = gm['awayTeam'].get('score', None)
+        schedule['games'][-1]['homeScore'] = gm['homeTeam'].get('score', None)
+        try:
+            schedule['games'][-1]['gameOutcome'] = gm['gameOutcome'].get('lastPeriodType', None)  # REG, OT, SO
+        except KeyError:
+            schedule['games'][-1]['gameOutcome'] = None
+
+    return schedule
+
+
+def shown_game_id(schedule: dict):
+    """
+    :return: id of the last game played before the next future game
+    """
+    for ii, gm in enumerate(schedule['games']):
+        if gm['gameState'] == 'FUT':
+            if ii == 0:
+                show_game_ind = 0
+            else:
+                show_game_ind = ii - 1
+            break
+    else:
+        show_game_ind = -1
+
+    return schedule['games'][show_game_ind]['id']
+
+
+def clean_roster_response(response, team: str):
+    roster = {'team': team, 'skaters': [],
+              'goalies': []}
+    for sktr in response['skaters']:
+        roster['skaters'].append({'playerId': sktr['playerId'],
+                                  'headshot': sktr['headshot'],
+                                  'firstName': sktr['firstName']['default'],
+                                  'lastName': sktr['lastName']['default'],
+                                  'positionCode': sktr['positionCode'],
+                                  'gamesPlayed': sktr['gamesPlayed'],
+                                  'goals': sktr['goals'],
+                                  'assists': sktr['assists'],
+                                  'points': sktr['points']})
+
+    for glie in response['goalies']:
+        roster['goalies'].append({'playerId': glie['playerId'],
+                                  'headshot': glie['headshot'],
+                                  'firstName': glie['firstName']['default'],
+                                  'lastName': glie['lastName']['default'],
+                                  'gamesPlayed': glie['gamesPlayed'],
+                                  'gamesStarted': glie['gamesStarted'],
+                                  'wins': glie['wins'],
+                                  'losses': glie['losses'],
+                                  'ties': glie['ties'],
+                                  'overtimeLosses': glie['overtimeLosses'],
+                                  'savePercentage': glie['savePercentage'],
+                                  'goals': glie['goals'],
+                                  'assists': glie['assists'],
+                                  'points': glie['points']})
+
+    return roster
+
+
+def clean_game_response(response, game_map: dict, players: PlayerIndex = None):
+    """
+    :param players: playerId lookup of this game, roster spots of late roster changes are added to it
+    """
+    if players is None:
+        players = PlayerIndex(response.get('rosterSpots', []), game_id=response.get('id'))
+
+    game = {}
+
+    for key, rkeys in game_map.items():
+        temp_resp = response
+        for rk in rkeys[:-1]:
+            if rk not in temp_resp:
+                game[key] = ''
+                break
+            else:
+                temp_resp = temp_resp[rk]  # let temp_resp be the sub dict in response
+        else:
+            if rkeys[-1] not in temp_resp:
+                game[key] = ''
+            else:
+                game[key] = temp_resp[rkeys[-1]]  # get the last value
+
+    game['plays'] = []
+    for play in response['plays']:
+        try:
+            if play['typeDescKey'] == 'goal':
+                scorer_id = play['details']['scoringPlayerId']
+                if scorer_id not in players:  # late roster change
+                    players.add_roster_spots(response.get('rosterSpots', []))
+
+                game['plays'].append({'typeDescKey': 'goal', 'period': play['periodDescriptor']['number'],
+                                      'timeInPeriod': play['timeInPeriod'],
+                                      'scoringPlayerId': scorer_id,
+                                      'scoringPlayerName': players.name(scorer_id)})
+        except KeyError:
+            _logger.error('KeyError in League().get_game() plays')
+
+    return game
+
+
+def export_json(data: dict, path: Path):
+    """
+    pretty printed copy of the data for debugging, nothing reads it back
+    """
+    with open(path, 'w+') as outputfile:
+        json.dump(data, outputfile, indent=2, sort_keys=True)  # noqa
+
+
+class Fetcher(object):
+    def __init__(self, server: str, team: str, game_id, game_map: dict, headers: dict = None):
+        """
+        fetches the four endpoints at once and cleans the responses into the dict main.py draws from
+
+        :param game_id: game shown until the first schedule says otherwise
+        """
+        self.server = server
+        self.team = team
+        self.game_id = game_id
+        self.game_map = game_map
+        self.headers = headers or {}
+
+        self.players = PlayerIndex()  # playerId lookup for the shown game, rebuilt when the game changes
+        self.responses = {}  # url: parsed body, an unchanged body is taken from here instead of parsed again
+        self.sections = {}  # section: (parsed body, cleaned section), cleaned again only for another body
+        self.fetched = False
+
+    def _game_url(self) -> str:
+        return f'{self.server}/gamecenter/{self.game_id}/play-by-play'
+
+    def _get_json(self, session: api_session.ApiSession, url: str, parse=json.loads):
+        """
+        like ApiSession.get_json, but the body is only parsed if it changed since the last fetch
+
+        :return: (changed, parsed json)
+        """
+        changed, response = session.conditional_get(url)
+        if changed:
+            data = api_session.parse_json(url, response.content, parse)
+        elif url in self.responses:
+            data = self.responses[url]
+        else:
+            data = session.cached_json(url, parse)  # first fetch of url, the body was cached by an earlier run
+        self.responses[url] = data
+
+        return changed, data
+
+    def _clean(self, section: str, response, clean, *args):
+        """
+        :return: (changed, clean(response, *args)), the section cleaned last time if response is the same body
+        """
+        last_response, cleaned = self.sections.get(section, (None, None))
+        if response is last_response:
+            return False, cleaned
+
+        cleaned = clean(response, *args)
+        self.sections[section] = (response, cleaned)
+        return True, cleaned
+
+    def fetch(self):
+        """
+        :return: {'standings': ..., 'schedule': ..., 'roster': ..., 'game': ...}, None if no endpoint changed since
+        the last data returned
+        :raises requests.RequestException: if an endpoint could not be fetched
+        """
+        session = api_session.get_session(self.server, headers=self.headers)
+
+        # the game is fetched along with the rest for the game shown so far, and again below in the rare case the new
+        # schedule moves on to another game
+        game_request_url = self._game_url()
+
+        with fetch_engine.FetchEngine() as engine:
+            results = engine.fetch_all({'standings': (self._get_json, (session, f'{self.server}/standings/now')),
+                                        'schedule': (self._get_json,
+                                                     (session, f'{self.server}/club-schedule-season/{self.team}/now')),
+                                        'roster': (self._get_json,
+                                                   (session, f'{self.server}/club-stats/{self.team}/now')),
+                                        'game': (self._get_json, (session, game_request_url, pbp_stream.parse_game))},
+                                       raise_errors=True)
+
+        _, standings_response = results['standings']
+        _, schedule_response = results['schedule']
+        _, roster_response = results['roster']
+        _, game_response = results['game']
+
+        schedule_changed, schedule_data = self._clean('schedule', schedule_response, clean_schedule_response,
+                                                      self.team)
+        self.game_id = shown_game_id(schedule_data)
+
+        if game_request_url != self._game_url():
+            self.responses.pop(game_request_url, None)
+            _, game_response = self._get_json(session, self._game_url(), parse=pbp_stream.parse_game)
+
+        if self.players.game_id != game_response.get('id') or not self.players:
+            self.players = PlayerIndex(game_response.get('rosterSpots', []), game_id=game_response.get('id'))
+
+        # a body that did not change is the same object as last time, so its section is not cleaned again
+        standings_changed, standings_data = self._clean('standings', standings_response, clean_standings_response)
+        roster_changed, roster_data = self._clean('roster', roster_response, clean_roster_response, self.team)
+        game_changed, game_data = self._clean('game', game_response, clean_game_response, self.game_map,
+                                              self.players)
+
+        if not (standings_changed or schedule_changed or roster_changed or game_changed) and self.fetched:
+            return None
+
+        self.fetched = True
+
+        return {'standings': standings_data,
+                'schedule': schedule_data,
+                'roster': roster_data,
+                'game': game_data}
+
+
+def diff(old: dict, new: dict) -> dict:
+    """
+    :return: {'set': {section: value}, 'update': {section: {key: value}}, 'remove': {section: [keys]}} that turns old
+    into new, sections that are dicts in both are compared key by key
+    """
+    delta = {'set': {}, 'update': {}, 'remove': {}}
+
+    for section, value in new.items():
+        old_value = old.get(section)
+        if old_value == value:
+            continue
+        if isinstance(old_value, dict) and isinstance(value, dict):
+            delta['update'][section] = {key: item for key, item in value.items()
+                                        if key not in old_value or old_value[key] != item}
+            removed = [key for key in old_value if key not in value]
+            if removed:
+                delta['remove'][section] = removed
+        else:
+            delta['set'][section] = value
+
+    removed = [section for section in old if section not in new]
+    if removed:
+        delta['remove'][None] = removed  # whole sections
+
+    return delta
+
+
+def apply(data: dict, delta: dict) -> dict:
+    """
+    :return: a new dict, data and its sections are not changed (they may still be drawn from)
+    """
+    new = dict(data)
+
+    for section in delta['remove'].get(None, ()):
+        new.pop(section, None)
+    new.update(delta['set'])
+
+    for section, items in delta['update'].items():
+        new[section] = {**new[section], **items}
+    for section, keys in delta['remove'].items():
+        if section is None:
+            continue
+        new[section] = {key: item for key, item in new[section].items() if key not in keys}
+
+    return new
+
+
+def send(stream, message):
+    data = pickle.dumps(message, protocol=pickle.HIGHEST_PROTOCOL)
+    stream.write(LENGTH.pack(len(data)) + data)
+    stream.flush()
+
+
+def receive(stream):
+    """
+    :raises EOFError: if the other side closed the pipe
+    """
+    header = stream.read(LENGTH.size)
+    if len(header) < LENGTH.size:
+        raise EOFError('pipe closed')
+    size, = LENGTH.unpack(header)
+    data = stream.read(size)
+    if len(data) < size:
+        raise EOFError('pipe closed')
+    return pickle.loads(data)
+
+
+def serve(commands, results):
+    """
+    worker side, answers ('update',) with the delta to the data sent before until ('stop',) or the parent is gone
+
+    :param commands: binary stream the settings and commands are read from
+    :param results: binary stream the answers are written to
+    """
+    settings = receive(commands)
+
+    fetcher = Fetcher(settings['server'], settings['team'], settings['game_id'], settings['game_map'],
+                      headers=settings['headers'])
+    json_path = settings.get('json_path')
+    snapshot_path = settings.get('snapshot_path')
+
+    writer = None
+    if settings.get('metrics_path') is not None:
+        writer = metrics.MetricsWriter(settings['metrics_path'], interval=settings['metrics_interval'])
+        writer.start()
+
+    sent = {}
+    try:
+        while True:
+            try:
+                command = receive(commands)
+            except EOFError:
+                _logger.info('parent closed the pipe')
+                break
+            if command[0] == 'stop':
+                break
+
+            try:
+                data = fetcher.fetch()
+            except requests.RequestException as update_ex:
+                send(results, ('error', str(update_ex)))
+                continue
+            except (KeyError, IndexError, TypeError, ValueError) as clean_ex:
+                # a response the clean_* functions do not understand, a restarted worker would only fail on it again
+                _logger.exception('could not clean the responses')
+                send(results, ('error', f'unexpected response: {clean_ex!r}'))
+                continue
+
+            if data is None:
+                send(results, ('unchanged',))
+                continue
+
+            # exports first, the parent must not find the snapshot file older than the data it was sent
+            if json_path is not None:
+                export_json(data, json_path)
+            if snapshot_path is not None:
+                atomic_write(snapshot_path, snapshot.dumps(data))
+
+            with metrics.registry.timer('worker diff'):
+                delta = diff(sent, data)
+            send(results, ('data', delta))
+            sent = data
+    finally:
+        api_session.close_sessions()
+        if writer is not None:
+            writer.stop()
+
+
+class DataWorker(threading.Thread):
+    def __init__(self, settings: dict, on_answer, max_restart_delay: float = MAX_RESTART_DELAY):
+        """
+        runs the worker process, restarts it when it dies and hands its answers to the callbacks (on this thread)
+
+        :param settings: Fetcher arguments (server, team, game_id, game_map, headers) and the export paths
+        (json_path, snapshot_path, None to skip) and metrics_path/metrics_interval for the worker's metrics file
+        :param on_answer: called with (data, error) for every answer: data is the whole new data (a new dict every
+        time), error the text of a failed fetch, both None if nothing changed
+        """
+        super().__init__(daemon=True, name='DataWorker')
+
+        self.settings = settings
+        self.on_answer = on_answer
+        self.max_restart_delay = max_restart_delay
+
+        self.lock = threading.Lock()  # for process and writes to its stdin
+        self.process = None
+        self.stopped = threading.Event()
+        self.data = {}  # data the worker's deltas apply to, starts over with every worker
+
+    def _start_process(self):
+        process = subprocess.Popen([sys.executable, os.path.abspath(__file__)],
+                                   stdin=subprocess.PIPE, stdout=subprocess.PIPE, cwd=os.getcwd())
+        send(process.stdin, self.settings)
+        _logger.info(f'worker process {process.pid} started')
+
+        return process
+
+    def request_update(self) -> bool:
+        """
+        asks the worker to fetch now, the answer arrives through on_data/on_error
+
+        :return: False if there is no worker running (it is restarted and fetches right away)
+        """
+        with self.lock:
+            if self.process is None:
+                return False
+            try:
+                send(self.process.stdin, ('update',))
+            except OSError as send_ex:
+                _logger.warning(f'worker process not reached: {send_ex}')
+                return False
+        return True
+
+    def _handle(self, message):
+        if message[0] == 'data':
+            with metrics.registry.timer('worker apply'):
+                self.data = apply(self.data, message[1])
+            self.on_answer(self.data, None)
+        elif message[0] == 'unchanged':
+            self.on_answer(None, None)
+        else:
+            self.on_answer(None, message[1])
+
+    def run(self):
+        delay = 1
+        while not self.stopped.is_set():
+            started = time.monotonic()
+            try:
+                with self.lock:
+                    self.process = self._start_process()
+                    self.data = {}
+                self.request_update()  # a restarted worker has nothing sent yet
+
+                while True:
+                    message = receive(self.process.stdout)
+                    try:
+                        self._handle(message)
+                    except Exception as handle_ex:  # a drawing bug must not end the supervision
+                        _logger.exception(f'worker answer {message[0]} not handled: {handle_ex}')
+            except (EOFError, OSError, pickle.UnpicklingError) as worker_ex:
+                if self.stopped.is_set():
+                    break
+                reason = worker_ex
+
+            with self.lock:
+                exit_code = None
+                if self.process is not None:
+                    self.process.kill()
+                    exit_code = self.process.wait()
+                    self.process = None
+            _logger.error(f'worker process died ({reason}), exit code {exit_code}')
+            metrics.registry.count('worker restarts')
+
+            if time.monotonic() - started > self.max_restart_delay:
+                delay = 1  # it ran fine for a while, not a crash loop
+            self.stopped.wait(delay)
+            delay = min(delay * 2, self.max_restart_delay)
+
+    def stop(self, timeout: float = 5):
+        self.stopped.set()
+        with self.lock:
+            process = self.process
+            if process is not None:
+                try:
+                    send(process.stdin, ('stop',))
+                    process.stdin.close()
+                except OSError:
+                    pass
+        if process is not None:
+            try:
+                process.wait(timeout)
+            except subprocess.TimeoutExpired:
+                process.kill()
+        if self.is_alive():
+            self.join(timeout)
+
+
+if __name__ == '__main__':
+    logging.basicConfig(format=LOG_FORMAT, datefmt='%Y-%m-%d %H:%M:%S', level=logging.INFO)
+    logging.getLogger("urllib3").setLevel(logging.WARNING)
+
+    channel = sys.stdout.buffer
+    sys.stdout = sys.stderr  # a stray print must not end up in the pipe
+    serve(sys.stdin.buffer, channel)
@@ -0,0 +1,115 @@
+# MIT License
+#
+# Copyright (c) 2024 mjteter
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""
+Runs independent api requests concurrently, so fetching standings, schedule, roster and play by play takes about one
+round trip instead of four.
+
+The requests themselves still go through the pooled, caching api_session.ApiSession on a small thread pool, asyncio
+only schedules them, applies the shared rate limiter and abandons whatever is left when the batch times out.
+"""
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from api_session import POOL_SIZE
+
+import logging
+
+
+_logger = logging.getLogger(__name__)
+
+FETCH_TIMEOUT = 60  # seconds for a whole batch, long enough for the per endpoint retries in api_session
+
+
+class FetchEngine(object):
+    def __init__(self, max_workers: int = POOL_SIZE, rate_limiter=None, timeout: float = FETCH_TIMEOUT):
+        """
+        one engine per thread, fetch_all() runs the engine's own event loop until the batch is done
+
+        :param max_workers: requests running at the same time, no point going above the session's pool size
+        :param rate_limiter: object with take() and wait_time() (e.g. api_threading.TokenBucket) every request has
+        to get a token from, None if the caller already limits the requests
+        :param timeout: seconds before the requests of a batch that are still running are cancelled
+        """
+        self.rate_limiter = rate_limiter
+        self.timeout = timeout
+
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='fetch')
+        self.loop = asyncio.new_event_loop()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    async def _call(self, func, args):
+        if self.rate_limiter is not None:
+            while not self.rate_limiter.take():
+                await asyncio.sleep(self.rate_limiter.wait_time())
+
+        return await self.loop.run_in_executor(self.executor, func, *args)
+
+    async def _gather(self, calls: dict) -> dict:
+        tasks = {key: self.loop.create_task(self._call(func, args)) for key, (func, args) in calls.items()}
+
+        _, pending = await asyncio.wait(tasks.values(), timeout=self.timeout)
+        for task in pending:
+            # only the asyncio wrapper is cancelled, the executor thread keeps running the blocking request until
+            # it returns or times out, its result is abandoned
+            task.cancel()
+        if pending:
+            await asyncio.gather(*pending, return_exceptions=True)
+
+        results = {}
+        for key, task in tasks.items():
+            if task.cancelled():
+                _logger.error(f'fetch {key} cancelled after {self.timeout} s')
+                results[key] = requests.exceptions.Timeout(f'fetch cancelled after {self.timeout} s')
+            elif task.exception() is not None:
+                results[key] = task.exception()
+            else:
+                results[key] = task.result()
+
+        return results
+
+    def fetch_all(self, calls: dict, raise_errors: bool = False) -> dict:
+        """
+        :param calls: key: (blocking callable, args), e.g. {'standings': (session.get_json, (url,))}
+        :param raise_errors: raise the first exception instead of returning it as result
+        :return: key: return value or the exception raised by the callable
+        """
+        results = self.loop.run_until_complete(self._gather(calls))
+
+        if raise_errors:
+            for result in results.values():
+                if isinstance(result, Exception):
+                    raise result
+
+        return results
+
+    def close(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        self.loop.close()
@@ -0,0 +1,140 @@
+# MIT License
+#
+# Copyright (c) 2024 mjteter
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""
+Output straight to a linux framebuffer device (e.g. /dev/fb1 of the PiTFT) without X or an SDL video driver, newer
+SDL releases dropped the fbcon driver main.py used to go through.
+
+The device is memory-mapped once.  write() converts the changed rects of a frame to the pixel format of the device
+(RGB565 for the PiTFT, XRGB8888 for a 32 bit framebuffer) with an SDL blit into a shadow surface, then copies only
+the rows that really differ from what is already in the framebuffer.  fbtft drivers send the memory pages written to
+over SPI, so an unchanged row is never sent to the panel.
+
+Any regular file works as device, for tests and benchmarks:
+
+    fb = Framebuffer('/tmp/fb', size=(480, 320))
+"""
+
+import mmap
+import os
+from pathlib import Path
+import stat
+
+import pygame
+
+import logging
+
+
+_logger = logging.getLogger(__name__)
+
+SYSFS_PATH = Path('/sys/class/graphics')
+MASKS = {16: (0xF800, 0x07E0, 0x001F, 0),  # RGB565
+         32: (0xFF0000, 0x00FF00, 0x0000FF, 0)}  # XRGB8888
+
+
+def device_info(path: Path) -> dict:
+    """
+    :return: {'size': (width, height), 'bits_per_pixel': bpp, 'stride': bytes per row} read from sysfs, empty if path
+    is no framebuffer device (e.g. a regular file)
+    """
+    info_path = SYSFS_PATH / Path(path).name
+    try:
+        width, height = (int(value) for value in (info_path / 'virtual_size').read_text().split(','))
+        bits_per_pixel = int((info_path / 'bits_per_pixel').read_text())
+        stride = int((info_path / 'stride').read_text())
+    except (OSError, ValueError):
+        return {}
+
+    return {'size': (width, height), 'bits_per_pixel': bits_per_pixel, 'stride': stride}
+
+
+class Framebuffer(object):
+    def __init__(self, path, size=None, bits_per_pixel: int = None, stride: int = None):
+        """
+        geometry of a device comes from sysfs, the other arguments are for a regular file standing in for one
+
+        :param path: framebuffer device, or a regular file (created/extended as needed)
+        :param size: (width, height)
+        :param bits_per_pixel: 16 or 32, 16 if not given
+        :param stride: bytes per row, width * bytes per pixel if not given
+        """
+        self.path = Path(path)
+
+        info = device_info(self.path)
+        self.size = tuple(info.get('size') or size or ())
+        if len(self.size) != 2:
+            raise ValueError(f'{self.path} is no framebuffer device, its size has to be given')
+        self.bits_per_pixel = info.get('bits_per_pixel') or bits_per_pixel or 16
+        if self.bits_per_pixel not in MASKS:
+            raise ValueError(f'{self.bits_per_pixel} bits per pixel of {self.path} not supported')
+        self.bytes_per_pixel = self.bits_per_pixel // 8
+        self.stride = info.get('stride') or stride or self.size[0] * self.bytes_per_pixel
+        self.length = self.stride * self.size[1]
+
+        self.file = open(self.path, 'r+b' if self.path.exists() else 'w+b')
+        try:
+            if stat.S_ISREG(os.fstat(self.file.fileno()).st_mode) and \
+                    os.fstat(self.file.fileno()).st_size < self.length:
+                self.file.truncate(self.length)
+            self.map = mmap.mmap(self.file.fileno(), self.length)
+        except (OSError, ValueError):
+            self.file.close()
+            raise
+
+        # the frame in the pixel format of the device, rows are copied from here into the map
+        self.shadow = pygame.Surface(self.size, 0, self.bits_per_pixel, MASKS[self.bits_per_pixel])
+        self.rect = self.shadow.get_rect()
+
+        _logger.info(f'framebuffer {self.path} {self.size[0]}x{self.size[1]} {self.bits_per_pixel} bpp '
+                     f'stride {self.stride}')
+
+    def write(self, surface: pygame.Surface, rects=None) -> int:
+        """
+        :param surface: the frame, drawn at the top left corner of the framebuffer
+        :param rects: areas of surface that changed, None for all of it
+        :return: rows written, rows that were already in the framebuffer are skipped
+        """
+        if rects is None:
+            rects = [self.rect]
+        rects = [rect for rect in (self.rect.clip(rect) for rect in rects) if rect.width and rect.height]
+
+        for rect in rects:
+            self.shadow.blit(surface, rect, rect)  # SDL converts the pixel format
+
+        written = 0
+        pitch = self.shadow.get_pitch()
+        with memoryview(self.shadow.get_buffer()) as pixels:
+            for rect in rects:
+                start = rect.x * self.bytes_per_pixel
+                end = rect.right * self.bytes_per_pixel
+                for y in range(rect.y, rect.bottom):
+                    row = pixels[y * pitch + start:y * pitch + end].tobytes()  # bytes compare with memcmp
+                    offset = y * self.stride
+                    if self.map[offset + start:offset + end] != row:
+                        self.map[offset + start:offset + end] = row
+                        written += 1
+
+        return written
+
+    def close(self):
+        self.map.close()
+        self.file.close()
@@ -0,0 +1,213 @@
+# MIT License
+#
+# Copyright (c) 2024 mjteter
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""
+Pre-renders every team logo at the sizes the layouts use into one packed atlas, so the kiosk does not have to
+resample the full size pngs at runtime.
+
+Run once after install (and again after changing the display size or AA in config.json):
+
+    python logo_atlas.py
+"""
+
+import json
+import logging
+import os
+from pathlib import Path
+
+import pygame
+from PIL import Image
+
+
+_logger = logging.getLogger(__name__)
+
+PATH = Path('.')
+LOGO_PATH = PATH / 'resources' / 'logos'
+ATLAS_PATH = PATH / 'resources' / 'logo_atlas.png'
+INDEX_PATH = PATH / 'resources' / 'logo_atlas.json'
+
+ATLAS_VERSION = 1
+ATLAS_WIDTH = 2048
+
+# the drawing area everything in main.py is laid out on before zooming
+SURFACE_WIDTH = 480
+SURFACE_HEIGHT = 320
+
+# (width, height) boxes the layouts in main.py draw team logos into, before zooming
+LOGO_SIZES = ((188, 125),)
+
+# mono colored status icons are recolored at runtime by main.TintedIcons, keep them out of the atlas
+ICON_IDS = ('wifi', 'refresh', 'path', 'circle')
+
+
+def fit_size(raw_size, size, maintain_ratio=True):
+    """
+    :param raw_size: (width, height) of the source image
+    :param size: (width, height) of the box the image has to fit in
+    :param maintain_ratio: keep the aspect ratio of the source image
+    :return: (width, height) the image should be resized to
+    """
+    raw_width, raw_height = raw_size
+    width, height = size
+
+    if not maintain_ratio:
+        return width, height
+
+    if (raw_width / width) <= (raw_height / height):
+        # height is the limiting factor to resize the image
+        return round(height / raw_height * raw_width), height
+    else:
+        return width, round(width / raw_width * raw_height)
+
+
+def zoom_size(size, zoom: float):
+    """
+    :param size: (width, height) box from the layout, before zooming
+    :return: the box logos of that layout size are resized to, the same with and without an atlas
+    """
+    return round(size[0] * zoom), round(size[1] * zoom)
+
+
+def get_zoom(config) -> float:
+    """
+    :param config: the parsed config.json
+    :return: the same ZOOM main.py uses for the configured display size
+    """
+    display_width = int(config['DISPLAY']['WIDTH'])
+    display_height = int(config['DISPLAY']['HEIGHT'])
+
+    if float(display_width / SURFACE_WIDTH) > float(display_height / SURFACE_HEIGHT):
+        return float(display_height / SURFACE_HEIGHT)  # height limiting
+    else:
+        return float(display_width / SURFACE_WIDTH)  # width limiting
+
+
+def logo_key(image_id: str, size) -> str:
+    return f'{image_id}@{size[0]}x{size[1]}'
+
+
+def build_atlas(zoom: float = 1, aa: bool = False, logo_path: Path = LOGO_PATH, sizes=LOGO_SIZES,
+                atlas_path: Path = ATLAS_PATH, index_path: Path = INDEX_PATH):
+    """
+    resizes every logo in logo_path to every size in sizes and packs them row by row into one png, with a json
+    index of where each logo ended up
+
+    :param zoom: ZOOM from main.py, the layout sizes are scaled by it
+    :param aa: use LANCZOS instead of BILINEAR, same as main.py
+    :return: the index dict
+    """
+    entries = []
+    for img in sorted(os.listdir(logo_path)):
+        image_id, extension = os.path.splitext(img)
+        if image_id == '' or extension != '.png' or image_id in ICON_IDS:
+            continue
+
+        with Image.open(logo_path / img) as raw:
+            raw = raw.convert('RGBA')
+            for size in sizes:
+                resized = raw.resize(fit_size(raw.size, zoom_size(size, zoom)),
+                                     Image.LANCZOS if aa else Image.BILINEAR)  # noqa
+                entries.append((logo_key(image_id, size), resized))
+
+    index = {'version': ATLAS_VERSION, 'zoom': zoom, 'aa': aa, 'logos': {}}
+
+    # simple shelf packing, all logos fit in the same boxes so rows come out nearly full
+    x = y = row_height = 0
+    for key, image in entries:
+        width, height = image.size
+        if x + width > ATLAS_WIDTH:
+            x = 0
+            y += row_height
+            row_height = 0
+        index['logos'][key] = [x, y, width, height]
+        x += width
+        row_height = max(row_height, height)
+
+    atlas = Image.new('RGBA', (ATLAS_WIDTH, y + row_height), (0, 0, 0, 0))
+    for key, image in entries:
+        atlas.paste(image, tuple(index['logos'][key][:2]))
+
+    atlas.save(atlas_path)
+    with open(index_path, 'w') as f:
+        json.dump(index, f, indent=2)  # noqa (ignore pycharm false pos)
+
+    _logger.info(f'logo atlas with {len(entries)} logos saved to {atlas_path} ({atlas.size[0]}x{atlas.size[1]})')
+
+    return index
+
+
+class LogoAtlas(object):
+    def __init__(self, surface, index):
+        """
+        :param surface: the atlas loaded as pygame surface
+        :param index: the parsed atlas json index
+        """
+        self.surface = surface
+        self.index = index
+        self.logos = {}  # key: subsurface, so repeated lookups do not create new surfaces
+
+    @classmethod
+    def load(cls, zoom: float = 1, aa: bool = False, atlas_path: Path = ATLAS_PATH, index_path: Path = INDEX_PATH):
+        """
+        :return: LogoAtlas or None if no atlas was built or it was built for another ZOOM/AA
+        """
+        try:
+            with open(index_path) as f:
+                index = json.load(f)
+        except (IOError, ValueError) as load_ex:
+            _logger.info(f'no logo atlas, logos will be resized at runtime: {load_ex}')
+            return None
+
+        if index.get('version') != ATLAS_VERSION or abs(index['zoom'] - zoom) > 1e-6 or index['aa'] != aa:
+            _logger.warning(f'logo atlas {atlas_path} is stale (zoom {index.get("zoom")}, aa {index.get("aa")}), '
+                            f'run logo_atlas.py again')
+            return None
+
+        surface = pygame.image.load(atlas_path)
+        if pygame.display.get_surface() is not None:
+            surface = surface.convert_alpha()
+
+        _logger.info(f'logo atlas loaded with {len(index["logos"])} logos')
+        return cls(surface, index)
+
+    def get(self, image_id: str, size):
+        """
+        :param image_id: file name of the logo without extension, e.g. 'PHI_dark'
+        :param size: the unzoomed (width, height) box from the layout
+        :return: ready to blit subsurface of the atlas or None if the atlas does not have it
+        """
+        key = logo_key(image_id, size)
+        if key not in self.logos:
+            if key not in self.index['logos']:
+                return None
+            self.logos[key] = self.surface.subsurface(pygame.Rect(self.index['logos'][key]))
+
+        return self.logos[key]
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+
+    with open(PATH / 'config.json') as config_file:
+        kiosk_config = json.load(config_file)
+
+    build_atlas(zoom=get_zoom(kiosk_config), aa=kiosk_config['DISPLAY']['AA'])
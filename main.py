@@ -20,6 +20,8 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
 
+from collections import OrderedDict
+from contextlib import contextmanager
 import datetime
 import json
 # import locale
@@ -37,6 +39,13 @@ import pygame.gfxdraw
 import requests
 from PIL import Image  # , ImageDraw
 
+import api_session
+import data_worker
+import framebuffer
+import logo_atlas
+import metrics
+import snapshot
+
 
 # PATH = sys.path[0] + '/'
 # # ICON_PATH = PATH + '/icons/'
@@ -49,6 +58,10 @@ LOGO_PATH = PATH / 'resources' / 'logos'
 FONT_PATH = PATH / 'resources' / 'fonts'
 LOG_PATH = PATH / 'logs'
 
+LOGO_CACHE_SIZE = 8  # ready to blit logo surfaces kept in memory, a screen only ever shows two
+TEXT_CACHE_SIZE = 64  # rendered strings kept in memory, numbers are composed from the glyph atlas instead
+GLYPHS = frozenset('0123456789:.-')  # strings made of these only (scores, sog, clock) are drawn glyph by glyph
+
 # create logger
 logger = logging.getLogger(__package__)
 logging.getLogger("PIL").setLevel(logging.WARNING)
@@ -115,10 +128,11 @@ try:
     elif config['ENV'].upper() == 'STAGE':
         pass
     elif config['ENV'].upper() == 'PI':
-        if config['DISPLAY']['FRAMEBUFFER'] is not False and config['DISPLAY']['ADD_ENV_VARS']:
+        if config['DISPLAY']['FRAMEBUFFER'] is not False and config['DISPLAY']['ADD_ENV_VARS'] and \
+                config['DISPLAY'].get('BACKEND', 'SDL').upper() == 'SDL':
             # using the dashboard on a raspberry with TFT displays might make this necessary
             os.putenv('SDL_FBDEV', config['DISPLAY']['FRAMEBUFFER'])
-            os.environ["SDL_VIDEODRIVER"] = "fbcon"
+            os.environ.setdefault("SDL_VIDEODRIVER", "fbcon")  # benchmark.py runs with the dummy driver
 
         LOG_PATH = '/mnt/ramdisk/'
 
@@ -127,6 +141,17 @@ except Exception as e:
     logger.warning(e)
     quit()
 
+# FRAMEBUFFER: frames are written to the memory-mapped DISPLAY FRAMEBUFFER device (or a file standing in for one) by
+# framebuffer.Framebuffer, SDL only gets the dummy video driver.  the dummy driver delivers no touch, mouse or keyboard
+# events (no MOUSEBUTTONDOWN, no ESC to quit), input would need a source of its own, e.g. evdev.
+# SDL: frames go through the SDL video driver
+BACKEND = config['DISPLAY'].get('BACKEND', 'SDL').upper()
+if BACKEND == 'FRAMEBUFFER' and not config['DISPLAY']['FRAMEBUFFER']:
+    logger.error('DISPLAY BACKEND FRAMEBUFFER needs a DISPLAY FRAMEBUFFER device, falling back to SDL')
+    BACKEND = 'SDL'
+if BACKEND == 'FRAMEBUFFER':
+    os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+
 pygame.display.init()
 pygame.mixer.quit()
 pygame.font.init()
@@ -163,9 +188,17 @@ else:
 ZOOM = 1
 
 FPS = config['DISPLAY']['FPS']
+# frame rate while nothing is animating, the loop blocks on events in between
+IDLE_FPS = config['DISPLAY'].get('IDLE_FPS', 1)
 SHOW_FPS = config['DISPLAY']['SHOW_FPS']
+# overlay with frame time percentiles, where the frame time goes and the api request stats
+SHOW_API_STATS = config['DISPLAY'].get('SHOW_API_STATS', False)
+# the same numbers as json lines in LOG_PATH/metrics.jsonl every INTERVAL seconds, 0 to switch the file off
+METRICS_CONFIG = config.get('METRICS', {})
 AA = config['DISPLAY']['AA']
 ANIMATION = config['DISPLAY']['ANIMATION']
+# only push changed areas to the display, False falls back to redrawing and pushing the full frame every tick
+DIRTY_RECTS = config['DISPLAY'].get('DIRTY_RECTS', True)
 
 # zoom the application surface rendering to display size scale
 if SCALE != 1:
@@ -181,6 +214,13 @@ FIT_SCREEN = (int((DISPLAY_WIDTH - SURFACE_WIDTH) / 2), int((DISPLAY_HEIGHT - SU
 # the real display surface
 tft_surf = pygame.display.set_mode((DISPLAY_WIDTH, DISPLAY_HEIGHT), pygame.NOFRAME if config['ENV'] == 'Pi' else 0)
 
+# writes tft_surf to the framebuffer device instead of pygame.display.update()
+framebuffer_out = None
+if BACKEND == 'FRAMEBUFFER':
+    framebuffer_out = framebuffer.Framebuffer(config['DISPLAY']['FRAMEBUFFER'], size=(DISPLAY_WIDTH, DISPLAY_HEIGHT))
+    if framebuffer_out.size != (DISPLAY_WIDTH, DISPLAY_HEIGHT):
+        logger.warning(f'framebuffer is {framebuffer_out.size}, DISPLAY WIDTH/HEIGHT should match it')
+
 # the drawing area - everything will be drawn here before scaling and rendering on the display tft_surf
 display_surf = pygame.Surface((SURFACE_WIDTH, SURFACE_HEIGHT))
 # dynamic surface for status bar updates and dynamic values like fps
@@ -194,6 +234,9 @@ hockey_surf = pygame.Surface((SURFACE_WIDTH, SURFACE_HEIGHT))
 
 clock = pygame.time.Clock()
 
+# posted by the update threads to wake up an idle loop() as soon as new data is ready
+DATA_EVENT = pygame.event.custom_type()
+
 logger.info(f'display with {DISPLAY_WIDTH}px width and {DISPLAY_HEIGHT}px height is set to {FPS} FPS with AA {AA}')
 
 LOGO_SUFFIX = theme['LOGO_SUFFIX']
@@ -242,6 +285,17 @@ READING = False
 UPDATING = False
 
 JSON_DATA = {}
+JSON_VERSION = 0  # DATA_CHANNEL version JSON_DATA came from
+# debug exports of the published data in LOG_PATH, the snapshot is also read back on the next start (warm start)
+EXPORT = {'JSON': True, 'SNAPSHOT': True, **config.get('EXPORT', {})}
+DATA_CHANNEL = snapshot.SnapshotChannel(snapshot.snapshot_path(Path(LOG_PATH) / 'latest_hockey.json')
+                                        if EXPORT['SNAPSHOT'] else None)
+PICK_UP_LOCK = threading.Lock()  # update_json() and the read_json() timer both pick up
+METRICS_WRITER = None  # metrics.MetricsWriter, started in __main__
+FETCHER = data_worker.Fetcher(SERVER, NHL_TEAM, GAME_ID, GAME_MAP, headers=HEADERS)
+# fetching and cleaning in a process of its own, so a big play by play never stalls a frame (needs a second core)
+WORKER_CONFIG = config.get('WORKER', {})
+DATA_WORKER = None  # data_worker.DataWorker, started in __main__ if WORKER PROCESS is set
 
 
 def quit_all():
@@ -249,6 +303,11 @@ def quit_all():
     pygame.display.quit()
     pygame.quit()
 
+    if framebuffer_out is not None:
+        framebuffer_out.close()
+
+    api_session.close_sessions()
+
     global THREADS
 
     for thread in THREADS:
@@ -256,18 +315,13 @@ def quit_all():
         thread.cancel()
         thread.join()
 
-    sys.exit()
+    if DATA_WORKER is not None:
+        DATA_WORKER.stop()
 
+    if METRICS_WRITER is not None:
+        METRICS_WRITER.stop()
 
-def image_factory(image_path: Path):
-    result = {}
-    for img in os.listdir(image_path):
-        image_id = img.split('.')[0]
-        if image_id == "":
-            pass
-        else:
-            result[image_id] = Image.open(image_path / img)
-    return result
+    sys.exit()
 
 
 # class Particles(object):
@@ -339,7 +393,7 @@ class DrawString:
         self.font = font
         self.color = color
         self.y = int(y * ZOOM)
-        self.size = self.font.size(self.string)
+        self.size = text_cache.size(self.font, self.string, self.color)
         self.surf = surf
 
     def left(self, offset=0):
@@ -349,7 +403,7 @@ class DrawString:
 
         x = int(10 * ZOOM + (offset * ZOOM))
 
-        self.draw_string(x)
+        return self.draw_string(x)
 
     def right(self, offset=0):
         """
@@ -358,7 +412,7 @@ class DrawString:
 
         x = int((SURFACE_WIDTH - self.size[0] - (10 * ZOOM)) - (offset * ZOOM))
 
-        self.draw_string(x)
+        return self.draw_string(x)
 
     def center(self, parts, part, offset=0):
         """
@@ -370,20 +424,21 @@ class DrawString:
         x = int(((((SURFACE_WIDTH / parts) / 2) + ((SURFACE_WIDTH / parts) * part)) -
                  (self.size[0] / 2)) + (offset * ZOOM))
 
-        self.draw_string(x)
+        return self.draw_string(x)
 
     def draw_string(self, x):
         """
         takes x and y from the functions above and render the fonts
+        :return: the rect that was drawn on
         """
 
-        self.surf.blit(self.font.render(self.string, True, self.color), (x, self.y))
+        return text_cache.draw(self.surf, self.font, self.string, self.color, (x, self.y))
 
 
 class DrawImage:
     def __init__(self, surf, image, y=None, size=None, fillcolor=None, angle=None, maintain_ratio=True):
         """
-        :param image: image from the image_factory()
+        :param image: PIL image from the ImageStore or an already converted pygame surface
         :param y: the y-position of the image you want to render
         """
         self.image = image
@@ -394,25 +449,18 @@ class DrawImage:
         # self.size = int(size * ZOOM)
         self.angle = angle
         self.surf = surf
+        self.fillcolor = fillcolor
+
+        if isinstance(self.image, pygame.Surface):
+            # already converted (and possibly recolored), e.g. served from the TintedIcons cache
+            self.img_size = self.image.get_size()
+            return
 
         if angle:
             self.image = self.image.rotate(self.angle, resample=Image.BICUBIC)  # noqa
 
         if size:
-            raw_width, raw_height = self.image.size
-            width, height = size
-
-            if maintain_ratio:
-                if (raw_width / width) <= (raw_height / height):
-                    # height is the limiting factor to resize the image
-                    raw_width = round(height / raw_height * raw_width)
-                    raw_height = height
-                else:
-                    raw_height = round(width / raw_width * raw_height)
-                    raw_width = width
-            else:
-                raw_width = width
-                raw_height = height
+            raw_width, raw_height = logo_atlas.fit_size(self.image.size, size, maintain_ratio)
             # if raw_width >= raw_height:
             #     raw_width, raw_height = (self.size, int(self.size / raw_width * raw_height))
             # else:
@@ -424,8 +472,6 @@ class DrawImage:
         else:
             self.size = self.img_size
 
-        self.fillcolor = fillcolor
-
         # self.image = pygame.image.fromstring(self.image.tobytes(), self.image.size, self.image.mode)
         self.image = pygame.image.frombytes(self.image.tobytes(), self.image.size, self.image.mode)
 
@@ -433,15 +479,10 @@ class DrawImage:
     def fill(surface, fillcolor: tuple):
         """converts the color on an mono colored icon"""
         surface.set_colorkey(BACKGROUND)
-        w, h = surface.get_size()
         r, g, b = fillcolor
-        for x in range(w):
-            for y in range(h):
-                a: int = surface.get_at((x, y))[3]
-                # removes some distortion from scaling/zooming
-                if a > 5:
-                    color = pygame.Color(r, g, b, a)
-                    surface.set_at((x, y), color)
+        # blank out the rgb channels but keep the alpha channel as the icon mask, then add the fill color on top
+        surface.fill((0, 0, 0, 255), special_flags=pygame.BLEND_RGBA_MULT)
+        surface.fill((r, g, b, 0), special_flags=pygame.BLEND_RGBA_ADD)
 
     def left(self, offset=0):
         """
@@ -450,7 +491,7 @@ class DrawImage:
 
         x = int(10 * ZOOM + (offset * ZOOM))
 
-        self.draw_image(x)
+        return self.draw_image(x)
 
     def right(self, offset=0):
         """
@@ -459,7 +500,7 @@ class DrawImage:
 
         x = int((SURFACE_WIDTH - self.img_size[0] - 10 * ZOOM) - (offset * ZOOM))
 
-        self.draw_image(x)
+        return self.draw_image(x)
 
     def center(self, parts, part, offset=0):
         """
@@ -471,7 +512,7 @@ class DrawImage:
         x = int(((((SURFACE_WIDTH / parts) / 2) + ((SURFACE_WIDTH / parts) * part)) -
                  (self.img_size[0] / 2)) + (offset * ZOOM))
 
-        self.draw_image(x)
+        return self.draw_image(x)
 
     def draw_middle_position_icon(self):
 
@@ -479,23 +520,24 @@ class DrawImage:
 
         position_y = int((self.y - (self.image.get_rect()[3] / 2)))
 
-        self.draw_image(draw_x=position_x, draw_y=position_y)
+        return self.draw_image(draw_x=position_x, draw_y=position_y)
 
     def draw_position(self, pos: tuple):
         x, y = pos
         if y == 0:
             y += 1
-        self.draw_image(draw_x=int(x * ZOOM), draw_y=int(y * ZOOM))
+        return self.draw_image(draw_x=int(x * ZOOM), draw_y=int(y * ZOOM))
 
     def draw_absolut_position(self, pos: tuple):
         x, y = pos
         if y == 0:
             y += 1
-        self.draw_image(draw_x=int(x), draw_y=int(y))
+        return self.draw_image(draw_x=int(x), draw_y=int(y))
 
     def draw_image(self, draw_x, draw_y=None):
         """
         takes x from the functions above and the y from the class to render the image
+        :return: the rect that was drawn on
         """
 
         if self.fillcolor:
@@ -504,14 +546,300 @@ class DrawImage:
             self.fill(surface, self.fillcolor)
 
             if draw_y:
-                self.surf.blit(surface, (int(draw_x), int(draw_y)))
+                return self.surf.blit(surface, (int(draw_x), int(draw_y)))
             else:
-                self.surf.blit(surface, (int(draw_x), self.y))
+                return self.surf.blit(surface, (int(draw_x), self.y))
         else:
             if draw_y:
-                self.surf.blit(self.image, (int(draw_x), int(draw_y)))
+                return self.surf.blit(self.image, (int(draw_x), int(draw_y)))
             else:
-                self.surf.blit(self.image, (int(draw_x), self.y))
+                return self.surf.blit(self.image, (int(draw_x), self.y))
+
+
+class ImageStore(object):
+    def __init__(self, image_path: Path, atlas=None, max_surfaces: int = LOGO_CACHE_SIZE):
+        """
+        loads images from image_path only when they are requested, instead of decoding every logo at startup
+
+        :param image_path: folder with the png images
+        :param atlas: optional logo_atlas.LogoAtlas with pre-scaled logos
+        :param max_surfaces: number of ready to blit logo surfaces to keep (least recently used are dropped)
+        """
+        self.image_path = image_path
+        self.atlas = atlas
+        self.max_surfaces = max_surfaces
+        self.lock = threading.Lock()
+        self.surfaces = OrderedDict()  # (team, suffix, size): surface, oldest first
+        self.hits = 0
+        self.misses = 0
+
+    def __getitem__(self, image_id: str):
+        """
+        :param image_id: file name without extension, e.g. 'wifi' or 'PHI_dark'
+        :return: freshly decoded PIL image, not kept in memory
+        """
+        with Image.open(self.image_path / f'{image_id}.png') as image:
+            image.load()
+            return image
+
+    def exists(self, image_id: str) -> bool:
+        return os.path.isfile(self.image_path / f'{image_id}.png')
+
+    def logo(self, team: str, suffix: str, size: tuple):
+        """
+        :param team: team abbreviation, e.g. 'PHI' or 'unknown'
+        :param suffix: theme suffix of the logo, e.g. '_dark'
+        :param size: the (width, height) box the logo is drawn in, before zooming like all layout sizes
+        :return: ready to blit pygame surface
+        """
+        key = (team, suffix, tuple(size))
+
+        with self.lock:
+            if key in self.surfaces:
+                self.hits += 1
+                self.surfaces.move_to_end(key)
+                return self.surfaces[key]
+            self.misses += 1
+
+        image_id = team + suffix
+        if not self.exists(image_id):
+            image_id = 'unknown'
+
+        surface = self.atlas.get(image_id, size) if self.atlas is not None else None
+        if surface is None:
+            surface = DrawImage(None, self[image_id], size=logo_atlas.zoom_size(size, ZOOM)).image
+
+        with self.lock:
+            self.surfaces[key] = surface
+            while len(self.surfaces) > self.max_surfaces:
+                self.surfaces.popitem(last=False)
+
+        logger.debug(f'logo cache miss: {key}, {self.stats()}')
+        return surface
+
+    def stats(self) -> dict:
+        return {'hits': self.hits, 'misses': self.misses, 'cached': len(self.surfaces)}
+
+
+class TintedIcons(object):
+    def __init__(self):
+        """
+        cache for mono colored icons (wifi, refresh, path, ...) that are already resized and recolored, so
+        DrawImage.fill only has to run once per (icon id, size, color)
+        """
+        self.surfaces = {}
+
+    def get(self, icon_id: str, size, fillcolor: tuple):
+        """
+        :param icon_id: name of the icon in the ImageStore, e.g. 'wifi'
+        :param size: int or (width, height) tuple
+        :param fillcolor: a rgb color tuple
+        :return: ready to blit pygame surface
+        """
+        if isinstance(size, int):
+            size = (size, size)
+        key = (icon_id, tuple(size), tuple(fillcolor))
+
+        if key not in self.surfaces:
+            logger.debug(f'tinted icon cache miss: {key}')
+            surface = DrawImage(None, images[icon_id], size=size).image
+            DrawImage.fill(surface, fillcolor)
+            self.surfaces[key] = surface
+
+        return self.surfaces[key]
+
+    def clear(self):
+        self.surfaces.clear()
+
+
+tinted_icons = TintedIcons()
+
+
+class GlyphAtlas(object):
+    def __init__(self, font, color: tuple, antialias: bool = True, glyphs=GLYPHS):
+        """
+        pre-rendered glyphs of one font and color, a string of them is drawn with one blit per character instead of
+        a FreeType render.  every glyph is rendered on its own, so this is only exact for fonts without kerning
+        between the glyphs, which holds for the digits of JetBrains Mono and Roboto
+
+        :param font: pygame font object
+        :param color: a rgb color tuple
+        :param glyphs: the characters in the atlas
+        """
+        self.glyphs = {char: font.render(char, antialias, color) for char in glyphs}
+        self.height = max(glyph.get_height() for glyph in self.glyphs.values())
+
+    def size(self, string: str) -> tuple:
+        return sum(self.glyphs[char].get_width() for char in string), self.height
+
+    def draw(self, surf, string: str, pos) -> pygame.Rect:
+        """
+        :return: the rect that was drawn on
+        """
+        x, y = pos
+        rect = pygame.Rect(x, y, 0, self.height)
+        for char in string:
+            rect.union_ip(surf.blit(self.glyphs[char], (x, y)))
+            x += self.glyphs[char].get_width()
+
+        return rect
+
+
+class TextCache(object):
+    def __init__(self, max_surfaces: int = TEXT_CACHE_SIZE):
+        """
+        rendered strings by (font, text, color, antialias), least recently used are dropped.  numbers go through a
+        GlyphAtlas per (font, color, antialias), so a running clock does not push the labels out of the cache
+
+        :param max_surfaces: number of rendered strings to keep
+        """
+        self.max_surfaces = max_surfaces
+        self.lock = threading.Lock()  # create_surface() draws on the timer thread, the fps counter in loop()
+        self.surfaces = OrderedDict()  # (font, text, color, antialias): surface, oldest first
+        self.atlases = {}  # (font, color, antialias): GlyphAtlas
+        self.hits = 0
+        self.misses = 0
+
+    def atlas(self, font, color: tuple, antialias: bool = True) -> GlyphAtlas:
+        key = (font, tuple(color), antialias)
+        with self.lock:
+            if key not in self.atlases:
+                self.atlases[key] = GlyphAtlas(font, color, antialias)
+            return self.atlases[key]
+
+    def render(self, font, text: str, color: tuple, antialias: bool = True):
+        """
+        :return: ready to blit pygame surface, shared, do not draw on it
+        """
+        key = (font, text, tuple(color), antialias)
+
+        with self.lock:
+            if key in self.surfaces:
+                self.hits += 1
+                self.surfaces.move_to_end(key)
+                return self.surfaces[key]
+            self.misses += 1
+
+            surface = font.render(text, antialias, color)
+            self.surfaces[key] = surface
+            while len(self.surfaces) > self.max_surfaces:
+                self.surfaces.popitem(last=False)
+
+            return surface
+
+    def size(self, font, text: str, color: tuple, antialias: bool = True) -> tuple:
+        """
+        :return: (width, height) of text as draw() will draw it
+        """
+        if text and GLYPHS.issuperset(text):
+            return self.atlas(font, color, antialias).size(text)
+
+        return self.render(font, text, color, antialias).get_size()
+
+    def draw(self, surf, font, text: str, color: tuple, pos, antialias: bool = True) -> pygame.Rect:
+        """
+        :return: the rect that was drawn on
+        """
+        if text and GLYPHS.issuperset(text):
+            return self.atlas(font, color, antialias).draw(surf, text, pos)
+
+        return surf.blit(self.render(font, text, color, antialias), pos)
+
+    def clear(self):
+        with self.lock:
+            self.surfaces.clear()
+            self.atlases.clear()
+
+
+text_cache = TextCache()
+
+
+class DirtyRects(object):
+    def __init__(self):
+        """
+        collects the areas of display_surf that changed since the last display update, so loop() only has to
+        re-blit and push those rects instead of the full frame
+        """
+        self.lock = threading.Lock()
+        self.full = True  # first frame is always a full one
+        self.rects = []
+        self.regions = {}  # key: (rect, value) of the last drawn static element, e.g. a score
+        self.dynamic_rects = []  # drawn on dynamic/mouse layers in the current frame
+        self.last_dynamic_rects = []  # drawn on dynamic/mouse layers in the previous frame, need to be erased
+
+    def full_frame(self):
+        with self.lock:
+            self.full = True
+
+    def add(self, rect):
+        if rect:
+            with self.lock:
+                self.rects.append(pygame.Rect(rect))
+
+    def track(self, key: str, rect, value, staged: list = None):
+        """
+        mark a static element as dirty only if its content or position changed since it was last drawn
+
+        :param key: name of the element, e.g. 'away_score'
+        :param rect: the rect returned by the draw function
+        :param value: anything comparable that describes the content, e.g. the score string
+        :param staged: collects the dirty rects instead, for elements drawn on a surface that is not shown yet, see
+        swap()
+        """
+        rect = pygame.Rect(rect)
+        with self.lock:
+            rects = self.rects if staged is None else staged
+            old = self.regions.get(key)
+            if old is None or old[0] != rect or old[1] != value:
+                rects.append(rect)
+                if old is not None:
+                    rects.append(old[0])
+            self.regions[key] = (rect, value)
+
+    @contextmanager
+    def swap(self, staged: list):
+        """
+        put the new surface in place inside this block, its staged rects are queued along with it so a frame can
+        never pop them and compose them from the old surface
+        """
+        with self.lock:
+            yield
+            self.rects.extend(staged)
+
+    def dynamic(self, rect):
+        """elements on layers that are cleared every frame (status icons, fps, touch markers)"""
+        if rect:
+            self.dynamic_rects.append(pygame.Rect(rect))
+
+    def pop(self):
+        """
+        :return: (full, rects) with full True if the whole frame has to be redrawn
+        """
+        with self.lock:
+            full = self.full
+            rects = self.rects + self.dynamic_rects + self.last_dynamic_rects
+            self.full = False
+            self.rects = []
+        self.last_dynamic_rects = self.dynamic_rects
+        self.dynamic_rects = []
+
+        if full:
+            return True, []
+
+        # merge overlapping rects, the status bar icons are all drawn in the same spots every frame
+        merged = []
+        for rect in rects:
+            for ii, other in enumerate(merged):
+                if rect.colliderect(other):
+                    merged[ii] = other.union(rect)
+                    break
+            else:
+                merged.append(rect)
+
+        return False, merged
+
+
+dirty_rects = DirtyRects()
 
 
 class Update(object):
@@ -533,55 +861,36 @@ class Update(object):
         THREADS.append(thread)
 
         CONNECTION = pygame.time.get_ticks() + 1500  # 1.5 seconds
+        wake_loop()
 
-        try:
-            standings_request_url = f'{SERVER}/standings/now'
-            schedule_request_url = f'{SERVER}/club-schedule-season/{NHL_TEAM}/now'
-            roster_request_url = f'{SERVER}/club-stats/{NHL_TEAM}/now'
-
-            # current_endpoint = f'{SERVER}/current'
-            # daily_endpoint = f'{SERVER}/forecast/daily'
-            # stats_endpoint = f'{SERVER}/subscription/usage'
-            # units = 'M' if METRIC else 'I'
+        if DATA_WORKER is not None:
+            # the answer comes back on the DataWorker thread, Update.on_worker_answer() publishes it
+            if not DATA_WORKER.request_update():
+                logger.warning('worker process not running, it fetches as soon as it is (re)started')
+            return
 
+        try:
             logger.info(f'connecting to server: {SERVER}')
 
-            # options = str(f'&postal_code={WEATHERBIT_POSTALCODE}'
-            #               f'&country={WEATHERBIT_COUNTRY}'
-            #               f'&lang={WEATHERBIT_LANG}'
-            #               f'&units={units}')
+            data = FETCHER.fetch()
 
-            # current_request_url = str(f'{current_endpoint}?key={WEATHERBIT_IO_KEY}{options}')
-            # daily_request_url = str(f'{daily_endpoint}?key={WEATHERBIT_IO_KEY}{options}&days={WEATHERBIT_DAYS}')
-            # stats_request_url = str(f'{stats_endpoint}?key={WEATHERBIT_IO_KEY}')
+            if data is None:
+                logger.info('nothing changed since last update, nothing published')
+                CONNECTION_ERROR = False
+                return
 
-            # current_data = requests.get(current_request_url, headers=HEADERS).json()
-            # daily_data = requests.get(daily_request_url, headers=HEADERS).json()
-            # stats_data = requests.get(stats_request_url, headers=HEADERS).json()
+            if EXPORT['JSON']:
+                # only for debugging, the drawing side gets the data from DATA_CHANNEL
+                data_worker.export_json(data, LOG_PATH / 'latest_hockey.json')
 
-            standings_data = Update.clean_standings_response(requests.get(standings_request_url,
-                                                                          headers=HEADERS).json())
-            schedule_data = Update.clean_schedule_response(requests.get(schedule_request_url, headers=HEADERS).json())
-            roster_data = Update.clean_roster_response(requests.get(roster_request_url, headers=HEADERS).json())
-
-            game_request_url = f'{SERVER}/gamecenter/{GAME_ID}/play-by-play'
-            game_data = Update.clean_game_response(requests.get(game_request_url, headers=HEADERS).json())
-
-            data = {
-                'standings': standings_data,
-                'schedule': schedule_data,
-                'roster': roster_data,
-                'game': game_data
-            }
-
-            with open(LOG_PATH / 'latest_hockey.json', 'w+') as outputfile:
-                json.dump(data, outputfile, indent=2, sort_keys=True)  # noqa
-
-            logger.info('json file saved')
+            version = DATA_CHANNEL.publish(data)
+            logger.info(f'data published as version {version}')
 
             CONNECTION_ERROR = False
 
-        except (requests.HTTPError, requests.ConnectionError) as update_ex:
+            Update.pick_up()
+
+        except requests.RequestException as update_ex:
 
             CONNECTION_ERROR = True
 
@@ -592,7 +901,7 @@ class Update(object):
     @staticmethod
     def read_json():
 
-        global THREADS, JSON_DATA, GAME_ID, REFRESH_ERROR, READING
+        global THREADS
 
         thread = threading.Timer(config["TIMER"]["RELOAD"], Update.read_json)
 
@@ -600,156 +909,54 @@ class Update(object):
 
         THREADS.append(thread)
 
-        READING = pygame.time.get_ticks() + 1500  # 1.5 seconds
+        # update_json() hands its data over right away, this only catches a snapshot file written by the last run
+        # (warm start) or by another process
+        Update.pick_up()
 
-        try:
-
-            data = open(LOG_PATH / 'latest_hockey.json').read()
+    @staticmethod
+    def pick_up():
+        """
+        takes the latest data from DATA_CHANNEL and redraws, nothing is done if the version did not change
+        """
+        global JSON_DATA, JSON_VERSION, REFRESH_ERROR, READING
 
-            new_json_data = json.loads(data)
+        with PICK_UP_LOCK:
+            newer = DATA_CHANNEL.newer(JSON_VERSION)
+            if newer is None:
+                REFRESH_ERROR = not JSON_VERSION
+                if REFRESH_ERROR:
+                    logger.warning('no data published yet')
+                return
 
-            logger.info('json file read by module')
-            logger.info(f'{new_json_data}')
+            READING = pygame.time.get_ticks() + 1500  # 1.5 seconds
+            wake_loop()
 
-            JSON_DATA = new_json_data
+            JSON_VERSION, JSON_DATA = newer
             # ToDo: set GAME_ID here maybe
             REFRESH_ERROR = False
+            logger.info(f'data version {JSON_VERSION} picked up')
 
-        except IOError as read_ex:
-
-            REFRESH_ERROR = True
-
-            logger.warning(f'ERROR - json file read by module: {read_ex}')
-
-        Update.icon_path()
+            Update.icon_path()
 
     @staticmethod
-    def clean_standings_response(response):
-        standings = { 'Central': {}, 'Pacific': {}, 'Atlantic': {}, 'Metropolitan': {}, 'Western': {}, 'Eastern': {}}
-
-        for team in response['standings']:
-            if len(standings[team['divisionName']]) < 3:
-                standings[team['divisionName']][team['teamAbbrev']['default']] = {'gamesPlayed': team['gamesPlayed'],  # noqa
-                                                                       'wins': team['wins'], 'losses': team['losses'],
-                                                                       'otLosses': team['otLosses'],
-                                                                       'points': team['points'],
-                                                                       'pointPctg': team['pointPctg']}
-            else:
-                standings[team['conferenceName']][team['teamAbbrev']['default']] = {'gamesPlayed': team['gamesPlayed'],  # noqa
-                                                                         'wins': team['wins'], 'losses': team['losses'],
-                                                                         'otLosses': team['otLosses'],
-                                                                         'points': team['points'],
-                                                                         'pointPctg': team['pointPctg']}
-
-        for conf in standings:
-            if conf in ('Western', 'Eastern'):
-                standings[conf] = dict(sorted(standings[conf].items(),
-                                              key=lambda item: (-item[1]['points'], -item[1]['pointPctg'])))
-
-        return standings
+    def on_worker_answer(data, error):
+        """
+        DataWorker callback, runs on its thread
+        """
+        global CONNECTION_ERROR
 
-    @staticmethod
-    def clean_schedule_response(response):
-        global GAME_ID
-        schedule = {'team': NHL_TEAM, 'games': []}
-        for gm in response['games']:
-            schedule['games'].append({'id': gm['id'],
-                                      'startTimeUTC': gm['startTimeUTC'],
-                                      'gameType': gm['gameType'],  # 1: preseason, 2: regular
-                                      'gameState': gm['gameState'],  # FINAL, OFF, LIVE, FUT, PRE
-                                      'awayTeam': gm['awayTeam']['abbrev'],
-                                      'homeTeam': gm['homeTeam']['abbrev']})
-            schedule['games'][-1]['awayScore'] = gm['awayTeam'].get('score', None)
-            schedule['games'][-1]['homeScore'] = gm['homeTeam'].get('score', None)
-            try:
-                schedule['games'][-1]['gameOutcome'] = gm['gameOutcome'].get('lastPeriodType', None)  # REG, OT, SO
-            except KeyError:
-                schedule['games'][-1]['gameOutcome'] = None
-
-        for ii, gm in enumerate(schedule['games']):
-            if gm['gameState'] == 'FUT':
-                if ii == 0:
-                    show_game_ind = 0
-                else:
-                    show_game_ind = ii - 1
-                break
+        if data is not None:
+            # the worker wrote the snapshot export already
+            version = DATA_CHANNEL.publish(data, write=False)
+            logger.info(f'worker data published as version {version}')
+            CONNECTION_ERROR = False
+            Update.pick_up()
+        elif error is not None:
+            CONNECTION_ERROR = True
+            logger.warning(f'Connection ERROR in worker process: {error}')
         else:
-            show_game_ind = -1
-
-        GAME_ID = schedule['games'][show_game_ind]['id']
-
-        return schedule
-
-    @staticmethod
-    def clean_roster_response(response):
-        roster = {'team': NHL_TEAM, 'skaters': [],
-                  'goalies': []}
-        for sktr in response['skaters']:
-            roster['skaters'].append({'playerId': sktr['playerId'],
-                                      'headshot': sktr['headshot'],
-                                      'firstName': sktr['firstName']['default'],
-                                      'lastName': sktr['lastName']['default'],
-                                      'positionCode': sktr['positionCode'],
-                                      'gamesPlayed': sktr['gamesPlayed'],
-                                      'goals': sktr['goals'],
-                                      'assists': sktr['assists'],
-                                      'points': sktr['points']})
-
-        for glie in response['goalies']:
-            roster['goalies'].append({'playerId': glie['playerId'],
-                                      'headshot': glie['headshot'],
-                                      'firstName': glie['firstName']['default'],
-                                      'lastName': glie['lastName']['default'],
-                                      'gamesPlayed': glie['gamesPlayed'],
-                                      'gamesStarted': glie['gamesStarted'],
-                                      'wins': glie['wins'],
-                                      'losses': glie['losses'],
-                                      'ties': glie['ties'],
-                                      'overtimeLosses': glie['overtimeLosses'],
-                                      'savePercentage': glie['savePercentage'],
-                                      'goals': glie['goals'],
-                                      'assists': glie['assists'],
-                                      'points': glie['points']})
-
-        return roster
-
-    @staticmethod
-    def clean_game_response(response):
-        game = {}
-
-        for key, rkeys in GAME_MAP.items():
-            temp_resp = response
-            for rk in rkeys[:-1]:
-                if rk not in temp_resp:
-                    game[key] = ''
-                    break
-                else:
-                    temp_resp = temp_resp[rk]  # let temp_resp be the sub dict in response
-            else:
-                if rkeys[-1] not in temp_resp:
-                    game[key] = ''
-                else:
-                    game[key] = temp_resp[rkeys[-1]]  # get the last value
-
-        game['plays'] = []
-        for play in response['plays']:
-            try:
-                if play['typeDescKey'] == 'goal':
-                    game['plays'].append({'typeDescKey': 'goal', 'period': play['periodDescriptor']['number'],
-                                          'timeInPeriod': play['timeInPeriod'],
-                                          'scoringPlayerId': play['details']['scoringPlayerId']})
-
-                    for plyr in response['rosterSpots']:
-                        if plyr['playerId'] == game['plays'][-1]['scoringPlayerId']:  # noqa (pycharm bs)
-                            game['plays'][-1]['scoringPlayerName'] = plyr['firstName']['default'] + ' ' + \
-                                                                     plyr['lastName']['default']
-                            break
-                    else:
-                        game['plays'][-1]['scoringPlayerName'] = ''
-            except KeyError:
-                logger.error('KeyError in League().get_game() plays')
-
-        return game
+            logger.info('nothing changed since last update, nothing published')
+            CONNECTION_ERROR = False
 
     @staticmethod
     def icon_path():
@@ -758,33 +965,30 @@ class Update(object):
         #     FORECASTICON_DAY_2, FORECASTICON_DAY_3, PRECIPTYPE, PRECIPCOLOR, UPDATING
         global AWAY_LOGO, HOME_LOGO, UPDATING
 
-        icon_extension = '.png'
-
         updated_list = []
 
         # icon = JSON_DATA['current']['data'][0]['weather']['icon']
 
-        away_logo = str(JSON_DATA['game']['awayTeam']) + LOGO_SUFFIX
-        home_logo = str(JSON_DATA['game']['homeTeam']) + LOGO_SUFFIX
+        away_team = str(JSON_DATA['game']['awayTeam'])
+        home_team = str(JSON_DATA['game']['homeTeam'])
         # forecast_icon_3 = JSON_DATA['daily']['data'][3]['weather']['icon']
 
-        logos = (away_logo, home_logo)
+        teams = (away_team, home_team)
 
-        logger.debug(logos)
+        logger.debug(teams)
 
-        logger.debug(f'validating path: {logos}')
+        logger.debug(f'validating path: {teams}')
 
-        for icon in logos:
-            full_icon = icon + icon_extension
-            if os.path.isfile(LOGO_PATH / full_icon):
+        for team in teams:
+            if images.exists(team + LOGO_SUFFIX):
 
-                logger.debug(f'TRUE : {icon}')
+                logger.debug(f'TRUE : {team}')
 
-                updated_list.append(icon)
+                updated_list.append(team)
 
             else:
 
-                logger.warning(f'FALSE : {icon}')
+                logger.warning(f'FALSE : {team}')
 
                 updated_list.append('unknown')
 
@@ -806,7 +1010,8 @@ class Update(object):
         logger.info(f'update path for icons: {updated_list}')
 
         # Update.get_precip_type()
-        Update.create_surface()
+        with metrics.registry.timer('create_surface'):
+            Update.create_surface()
 
     # @staticmethod
     # def get_precip_type():
@@ -926,10 +1131,15 @@ class Update(object):
 
         new_surf = pygame.Surface((SURFACE_WIDTH, SURFACE_HEIGHT))
         new_surf.fill(BACKGROUND)
+        staged = []  # dirty rects of new_surf, queued when it replaces hockey_surf
+
+        wifi_icon = tinted_icons.get('wifi', (15, 15), RED if CONNECTION_ERROR else GREEN)
+        refresh_icon = tinted_icons.get('refresh', (15, 15), RED if REFRESH_ERROR else GREEN)
+        path_icon = tinted_icons.get('path', (15, 15), RED if PATH_ERROR else GREEN)
 
-        DrawImage(new_surf, images['wifi'], 5, size=(15, 15), fillcolor=RED if CONNECTION_ERROR else GREEN).left()
-        DrawImage(new_surf, images['refresh'], 5, size=(15, 15), fillcolor=RED if REFRESH_ERROR else GREEN).right(8)
-        DrawImage(new_surf, images['path'], 5, size=(15, 15), fillcolor=RED if PATH_ERROR else GREEN).right(-5)
+        dirty_rects.track('wifi', DrawImage(new_surf, wifi_icon, 5).left(), CONNECTION_ERROR, staged)
+        dirty_rects.track('refresh', DrawImage(new_surf, refresh_icon, 5).right(8), REFRESH_ERROR, staged)
+        dirty_rects.track('path', DrawImage(new_surf, path_icon, 5).right(-5), PATH_ERROR, staged)
 
         # DrawImage(new_surf, images[WEATHERICON], 68, size=100).center(2, 0, offset=10)
 
@@ -942,8 +1152,11 @@ class Update(object):
         #
         #         DrawImage(new_surf, images['precipsnow'], size=20).draw_position(pos=(155, 140))
 
-        DrawImage(new_surf, images[AWAY_LOGO], 40 + 10, size=(188, 125)).left()
-        DrawImage(new_surf, images[HOME_LOGO], 40 + 2 * 10 + 125, size=(188, 125)).left()
+        away_logo_rect = DrawImage(new_surf, images.logo(AWAY_LOGO, LOGO_SUFFIX, (188, 125)), 40 + 10).left()
+        home_logo_rect = DrawImage(new_surf, images.logo(HOME_LOGO, LOGO_SUFFIX, (188, 125)),
+                                   40 + 2 * 10 + 125).left()
+        dirty_rects.track('away_logo', away_logo_rect, AWAY_LOGO, staged)
+        dirty_rects.track('home_logo', home_logo_rect, HOME_LOGO, staged)
         # DrawImage(new_surf, images[FORECASTICON_DAY_1], 200, size=50).center(3, 0)
         # DrawImage(new_surf, images[FORECASTICON_DAY_2], 200, size=50).center(3, 1)
         # DrawImage(new_surf, images[FORECASTICON_DAY_3], 200, size=50).center(3, 2)
@@ -959,8 +1172,10 @@ class Update(object):
         # if config["DISPLAY"]["SHOW_API_STATS"]:
         #     DrawString(new_surf, str(stats_data['calls_remaining']), FONT_SMALL_BOLD, BLUE, 20).right(offset=-5)
 
-        DrawString(new_surf, away_score, FONT_SCORE, MAIN_FONT, 40 + 0).left(188 + 10)
-        DrawString(new_surf, home_score, FONT_SCORE, MAIN_FONT, 40 + 1 * 10 + 125).left(188 + 10)
+        away_score_rect = DrawString(new_surf, away_score, FONT_SCORE, MAIN_FONT, 40 + 0).left(188 + 10)
+        home_score_rect = DrawString(new_surf, home_score, FONT_SCORE, MAIN_FONT, 40 + 1 * 10 + 125).left(188 + 10)
+        dirty_rects.track('away_score', away_score_rect, away_score, staged)
+        dirty_rects.track('home_score', home_score_rect, home_score, staged)
 
         # DrawString(new_surf, summary_string, FONT_SMALL_BOLD, VIOLET, 50).center(1, 0)
         #
@@ -983,7 +1198,8 @@ class Update(object):
         # DrawString(new_surf, wind_direction, FONT_SMALL_BOLD, MAIN_FONT, 250).center(3, 2)
         # DrawString(new_surf, wind_speed_string, FONT_SMALL_BOLD, MAIN_FONT, 300).center(3, 2)
 
-        hockey_surf = new_surf
+        with dirty_rects.swap(staged):
+            hockey_surf = new_surf
 
         # logger.info(f'summary: {summary_string}')
         # logger.info(f'temp out: {temp_out_string}')
@@ -1003,6 +1219,7 @@ class Update(object):
 
         pygame.time.delay(1500)
         UPDATING = pygame.time.get_ticks() + 1500  # 1.5 seconds
+        wake_loop()
 
         return hockey_surf
 
@@ -1016,6 +1233,25 @@ class Update(object):
             Update.read_json()
 
 
+def wake_loop():
+    """
+    wakes up loop() if it is blocking in idle mode, safe to call from the update threads
+    """
+    pygame.event.post(pygame.event.Event(DATA_EVENT))
+
+
+def is_idle():
+    """
+    :return: True if nothing on screen is animating and loop() can block until the next event
+    """
+    ticks = pygame.time.get_ticks()
+    if any(timer and timer > ticks for timer in (CONNECTION, READING, UPDATING)):
+        return False
+
+    # dynamic elements from the last frame still have to be erased
+    return not (DIRTY_RECTS and dirty_rects.last_dynamic_rects)
+
+
 def get_brightness():
     current_time = time.time()
     current_time = int(convert_timestamp(current_time, '%H'))
@@ -1104,23 +1340,74 @@ def draw_statusbar():
     global CONNECTION, READING, UPDATING
 
     if CONNECTION:
-        DrawImage(dynamic_surf, images['wifi'], 5, size=15, fillcolor=BLUE).left()  # noqa
+        dirty_rects.dynamic(DrawImage(dynamic_surf, tinted_icons.get('wifi', 15, BLUE), 5).left())
         if pygame.time.get_ticks() >= CONNECTION:
             CONNECTION = None
 
     if UPDATING:
-        DrawImage(dynamic_surf, images['refresh'], 5, size=15, fillcolor=BLUE).right(8)  # noqa
+        dirty_rects.dynamic(DrawImage(dynamic_surf, tinted_icons.get('refresh', 15, BLUE), 5).right(8))
         if pygame.time.get_ticks() >= UPDATING:
             UPDATING = None
 
     if READING:
-        DrawImage(dynamic_surf, images['path'], 5, size=15, fillcolor=BLUE).right(-5)  # noqa
+        dirty_rects.dynamic(DrawImage(dynamic_surf, tinted_icons.get('path', 15, BLUE), 5).right(-5))
         if pygame.time.get_ticks() >= READING:
             READING = None
 
 
 def draw_fps():
-    DrawString(dynamic_surf, str(int(clock.get_fps())), FONT_SMALL_BOLD, RED, 20).left()
+    dirty_rects.dynamic(DrawString(dynamic_surf, str(int(clock.get_fps())), FONT_SMALL_BOLD, RED, 20).left())
+
+
+class MetricsOverlay(object):
+    def __init__(self, refresh_ms: int = 1000):
+        """
+        a few lines of metrics.registry at the bottom of the screen, rendered once per refresh_ms and blitted from
+        the cache in between, so the overlay does not show up in the frame times it reports
+
+        :param refresh_ms: milliseconds between two renders of the text
+        """
+        self.refresh_ms = refresh_ms
+        self.next_refresh = 0
+        self.surface = None
+
+    @staticmethod
+    def lines() -> list:
+        snapshot = metrics.registry.snapshot()
+        timings, counters = snapshot['timings'], snapshot['counters']
+
+        frame_ms = timings.get('frame', {})
+        sections = ' '.join(f'{label} {timings.get(name, {}).get("p95", 0):.1f}'
+                            for label, name in (('surf', 'create_surface'), ('scale', 'frame scale'),
+                                                ('blit', 'frame blit'), ('upd', 'frame display.update')))
+
+        requests_made = sum(value for name, value in counters.items() if name.endswith(' requests'))
+        kib = sum(value for name, value in counters.items() if name.endswith(' bytes')) / 1024
+        api_ms = max((timing.get('p95', 0) for name, timing in timings.items() if name.startswith('api ')), default=0)
+
+        return [f'frame p50 {frame_ms.get("p50", 0):.1f} p95 {frame_ms.get("p95", 0):.1f} '
+                f'p99 {frame_ms.get("p99", 0):.1f} ms',
+                f'p95 ms {sections}',
+                f'api {requests_made} req p95 {api_ms:.0f} ms {kib:.0f} KiB '
+                f'deferred {counters.get("league deferred", 0)}']
+
+    def render(self):
+        lines = self.lines()
+        height = FONT_SMALL.get_linesize()
+        self.surface = pygame.Surface((SURFACE_WIDTH, height * len(lines)))
+        self.surface.fill(BACKGROUND)
+        self.surface.set_colorkey(BACKGROUND)
+        for ii, line in enumerate(lines):
+            self.surface.blit(FONT_SMALL.render(line, True, YELLOW), (int(5 * ZOOM), ii * height))
+
+    def draw(self, surf):
+        if self.surface is None or pygame.time.get_ticks() >= self.next_refresh:
+            self.render()
+            self.next_refresh = pygame.time.get_ticks() + self.refresh_ms
+        dirty_rects.dynamic(surf.blit(self.surface, (0, SURFACE_HEIGHT - self.surface.get_height())))
+
+
+metrics_overlay = MetricsOverlay()
 
 
 # ToDo: make this useful for touch events
@@ -1131,7 +1418,7 @@ def draw_event(color=RED):
     size = 20
     radius = int(size / 2)
     new_pos = (int(pos[0] - FIT_SCREEN[0] - (radius * ZOOM)), int(pos[1] - FIT_SCREEN[1] - (radius * ZOOM)))
-    DrawImage(mouse_surf, images['circle'], size=size, fillcolor=color).draw_absolut_position(new_pos)  # noqa
+    dirty_rects.dynamic(DrawImage(mouse_surf, tinted_icons.get('circle', size, color)).draw_absolut_position(new_pos))
 
 
 def create_scaled_surf(surf, aa=False):
@@ -1143,84 +1430,169 @@ def create_scaled_surf(surf, aa=False):
     return scaled_surf
 
 
-def loop():
-    Update.run(first_run=False)
+def show(rects=None):
+    """
+    pushes tft_surf to the display
 
-    running = True
+    :param rects: areas of tft_surf that changed, None for all of it
+    """
+    if framebuffer_out is not None:
+        framebuffer_out.write(tft_surf, rects)
+    elif rects is None:
+        pygame.display.update()
+    else:
+        pygame.display.update(rects)
 
-    while running:
+
+def update_dirty_rects():
+    """
+    re-composes display_surf only inside the areas that changed and pushes just those rects to the display
+    """
+    full, rects = dirty_rects.pop()
+    surf_rect = display_surf.get_rect()
+
+    if full:
         tft_surf.fill(BACKGROUND)
+        rects = [surf_rect]
+    else:
+        rects = [rect.clip(surf_rect) for rect in rects]
+
+    with metrics.registry.timer('frame blit'):
+        for rect in rects:
+            display_surf.fill(BACKGROUND, rect)
+            display_surf.blit(hockey_surf, rect, rect)
+            display_surf.blit(dynamic_surf, rect, rect)
+            # display_surf already has the zoomed size, so no scaling is needed on the way to the tft surface
+            tft_surf.blit(display_surf, rect.move(FIT_SCREEN), rect)
+
+    if full or rects:
+        with metrics.registry.timer('frame display.update'):
+            if full:
+                show()
+            else:
+                show([rect.move(FIT_SCREEN) for rect in rects])
+
 
-        # fill the actual main surface and blit the image/weather layer
-        display_surf.fill(BACKGROUND)
-        display_surf.blit(hockey_surf, (0, 0))
+def frame(events):
+    """
+    draws and shows one frame
+
+    :param events: pygame events to handle in this frame, besides the ones still waiting in the event queue
+    :return: False once the kiosk should quit
+    """
+    running = True
+    frame_start = time.perf_counter()
 
-        # fill the dynamic layer, make it transparent and use draw functions that write to that surface
-        dynamic_surf.fill(BACKGROUND)
-        dynamic_surf.set_colorkey(BACKGROUND)
+    if not DIRTY_RECTS:
+        with metrics.registry.timer('frame blit'):
+            tft_surf.fill(BACKGROUND)
 
-        # draw_statusbar()  !!! re-add
+            # fill the actual main surface and blit the image/weather layer
+            display_surf.fill(BACKGROUND)
+            display_surf.blit(hockey_surf, (0, 0))
 
-        # if SHOW_FPS:
-        #     draw_fps()  !!! re-add
+    # fill the dynamic layer, make it transparent and use draw functions that write to that surface
+    dynamic_surf.fill(BACKGROUND)
+    dynamic_surf.set_colorkey(BACKGROUND)
 
-        # if ANIMATION:
-        #     my_particles.move(dynamic_surf, my_particles_list)
+    # draw_statusbar()  !!! re-add
+
+    # if SHOW_FPS:
+    #     draw_fps()  !!! re-add
 
-        # finally take the dynamic surface and blit it to the main surface
+    if SHOW_API_STATS:
+        metrics_overlay.draw(dynamic_surf)
+
+    # if ANIMATION:
+    #     my_particles.move(dynamic_surf, my_particles_list)
+
+    # finally take the dynamic surface and blit it to the main surface
+    if not DIRTY_RECTS:
         display_surf.blit(dynamic_surf, (0, 0))
 
-        # # now do the same for the time layer so it did not interfere with the other layers
-        # # fill the layer and make it transparent as well
-        # time_surf.fill(BACKGROUND)
-        # time_surf.set_colorkey(BACKGROUND)
-        #
-        # # draw the time to the main layer
-        # draw_time_layer()
-        # display_surf.blit(time_surf, (0, 0))
+    # # now do the same for the time layer so it did not interfere with the other layers
+    # # fill the layer and make it transparent as well
+    # time_surf.fill(BACKGROUND)
+    # time_surf.set_colorkey(BACKGROUND)
+    #
+    # # draw the time to the main layer
+    # draw_time_layer()
+    # display_surf.blit(time_surf, (0, 0))
 
-        # # draw the mouse events
-        # mouse_surf.fill(BACKGROUND)
-        # mouse_surf.set_colorkey(BACKGROUND)
-        # draw_event(WHITE)
+    # # draw the mouse events
+    # mouse_surf.fill(BACKGROUND)
+    # mouse_surf.set_colorkey(BACKGROUND)
+    # draw_event(WHITE)
 
-        for event in pygame.event.get():
+    for event in events + pygame.event.get():
 
-            if event.type == pygame.QUIT:
+        if event.type == pygame.QUIT:
 
-                running = False
+            running = False
 
-                quit_all()
+            quit_all()
 
-            elif event.type == pygame.MOUSEBUTTONDOWN:
+        elif event.type == pygame.VIDEOEXPOSE:
 
-                if pygame.MOUSEBUTTONDOWN:
-                    draw_event()
+            dirty_rects.full_frame()
 
-            elif event.type == pygame.KEYDOWN:
+        elif event.type == pygame.MOUSEBUTTONDOWN:
 
-                if event.key == pygame.K_ESCAPE:
+            if pygame.MOUSEBUTTONDOWN:
+                draw_event()
 
-                    running = False
+        elif event.type == pygame.KEYDOWN:
 
-                    quit_all()
+            if event.key == pygame.K_ESCAPE:
 
-                elif event.key == pygame.K_SPACE:
-                    shot_time = convert_timestamp(time.time(), "%Y-%m-%d %H-%M-%S")
-                    pygame.image.save(display_surf, f'screenshot-{shot_time}.png')
-                    logger.info(f'Screenshot created at {shot_time}')
+                running = False
 
-        # display_surf.blit(mouse_surf, (0, 0))
+                quit_all()
+
+            elif event.key == pygame.K_SPACE:
+                shot_time = convert_timestamp(time.time(), "%Y-%m-%d %H-%M-%S")
+                pygame.image.save(display_surf, f'screenshot-{shot_time}.png')
+                logger.info(f'Screenshot created at {shot_time}')
+
+    # display_surf.blit(mouse_surf, (0, 0))
 
+    if DIRTY_RECTS:
+        update_dirty_rects()
+    else:
         # finally take the main surface and blit it to the tft surface
-        tft_surf.blit(create_scaled_surf(display_surf, aa=AA), FIT_SCREEN)
+        with metrics.registry.timer('frame scale'):
+            scaled_surf = create_scaled_surf(display_surf, aa=AA)
+        with metrics.registry.timer('frame blit'):
+            tft_surf.blit(scaled_surf, FIT_SCREEN)
 
         # update the display with all surfaces merged into the main one
-        pygame.display.update()
+        with metrics.registry.timer('frame display.update'):
+            show()
+
+    metrics.registry.record('frame', time.perf_counter() - frame_start)
+
+    return running
+
+
+def loop():
+    Update.run(first_run=False)
+
+    running = True
+    waited_events = []
+
+    while running:
+        running = frame(waited_events)
+
+        if is_idle():
+            # block until user input, new data or the next idle frame instead of redrawing the same frame
+            waited_events = [pygame.event.wait(int(1000 / IDLE_FPS))]
+        else:
+            waited_events = []
 
         # do it as often as FPS configured (30 FPS recommend for particle simulation, 15 runs fine too, 60 is overkill)
         clock.tick(FPS)
 
+
     quit_all()
 
 
@@ -1231,7 +1603,26 @@ if __name__ == '__main__':
         #     my_particles = Particles()
         #     my_particles_list = my_particles.create_particle_list()
 
-        images = image_factory(LOGO_PATH)
+        images = ImageStore(LOGO_PATH, atlas=logo_atlas.LogoAtlas.load(zoom=ZOOM, aa=AA))
+
+        if METRICS_CONFIG.get('INTERVAL', metrics.WRITE_INTERVAL):
+            METRICS_WRITER = metrics.MetricsWriter(Path(LOG_PATH) / 'metrics.jsonl',
+                                                   interval=METRICS_CONFIG.get('INTERVAL', metrics.WRITE_INTERVAL),
+                                                   max_bytes=METRICS_CONFIG.get('MAX_BYTES', metrics.MAX_BYTES),
+                                                   backup_count=METRICS_CONFIG.get('BACKUP_COUNT',
+                                                                                   metrics.BACKUP_COUNT))
+            METRICS_WRITER.start()
+
+        if WORKER_CONFIG.get('PROCESS', False):
+            DATA_WORKER = data_worker.DataWorker(
+                {'server': SERVER, 'team': NHL_TEAM, 'game_id': GAME_ID, 'game_map': GAME_MAP, 'headers': HEADERS,
+                 'json_path': Path(LOG_PATH) / 'latest_hockey.json' if EXPORT['JSON'] else None,
+                 'snapshot_path': DATA_CHANNEL.path,
+                 'metrics_path': Path(LOG_PATH) / 'metrics-worker.jsonl' if METRICS_WRITER is not None else None,
+                 'metrics_interval': METRICS_CONFIG.get('INTERVAL', metrics.WRITE_INTERVAL)},
+                Update.on_worker_answer, max_restart_delay=WORKER_CONFIG.get('MAX_RESTART_DELAY',
+                                                                             data_worker.MAX_RESTART_DELAY))
+            DATA_WORKER.start()
 
         loop()
 
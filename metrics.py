@@ -0,0 +1,155 @@
+# MIT License
+#
+# Copyright (c) 2024 mjteter
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""
+In-process timings and counters for the frame loop and the api threads, shown by main.py as overlay when
+SHOW_API_STATS is set and written to a rotating json lines file by MetricsWriter.
+
+Timings keep the last WINDOW samples per name, so the percentiles describe the recent past and memory stays flat on a
+kiosk running for weeks.  Names are free form, by convention 'frame', 'frame <section>', 'api <endpoint>' and
+'league <event>'.
+"""
+
+from collections import deque
+from contextlib import contextmanager
+import json
+import logging.handlers
+from pathlib import Path
+import threading
+import time
+
+import logging
+
+
+_logger = logging.getLogger(__name__)
+
+WINDOW = 600  # samples per timing, half a minute of frames at 20 FPS
+PERCENTILES = (50, 95, 99)
+WRITE_INTERVAL = 60  # seconds between two lines in the metrics file
+MAX_BYTES = 1024 * 1024
+BACKUP_COUNT = 3
+
+
+class Metrics(object):
+    def __init__(self, window: int = WINDOW):
+        """
+        thread safe store for timings and counters, one shared instance is the module level registry
+
+        :param window: samples kept per timing
+        """
+        self.window = window
+        self.lock = threading.Lock()
+        self.started = time.monotonic()
+        self.timings = {}  # name: deque of seconds, newest last
+        self.counters = {}  # name: running total since start
+
+    def record(self, name: str, seconds: float):
+        with self.lock:
+            if name not in self.timings:
+                self.timings[name] = deque(maxlen=self.window)
+            self.timings[name].append(seconds)
+
+    def count(self, name: str, amount=1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    @contextmanager
+    def timer(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start)
+
+    def percentiles(self, name: str, percentiles=PERCENTILES) -> dict:
+        """
+        :return: {'count': samples, 'p50': ms, ..., 'max': ms} of the kept samples, empty if there are none
+        """
+        with self.lock:
+            samples = sorted(self.timings.get(name, ()))
+        if not samples:
+            return {}
+
+        result = {'count': len(samples)}
+        for pct in percentiles:
+            # nearest rank, good enough for a few hundred samples
+            index = min(len(samples) - 1, max(0, round(pct / 100 * len(samples)) - 1))
+            result[f'p{pct}'] = round(samples[index] * 1000, 3)
+        result['max'] = round(samples[-1] * 1000, 3)
+
+        return result
+
+    def snapshot(self) -> dict:
+        """
+        :return: json ready {'uptime': s, 'timings': {name: percentiles()}, 'counters': {name: total}}
+        """
+        with self.lock:
+            names = list(self.timings)
+            counters = dict(self.counters)
+
+        return {'uptime': round(time.monotonic() - self.started, 1),
+                'timings': {name: self.percentiles(name) for name in sorted(names)},
+                'counters': dict(sorted(counters.items()))}
+
+
+registry = Metrics()
+
+
+class MetricsWriter(threading.Thread):
+    def __init__(self, path: Path, metrics: Metrics = registry, interval: float = WRITE_INTERVAL,
+                 max_bytes: int = MAX_BYTES, backup_count: int = BACKUP_COUNT):
+        """
+        appends a snapshot of metrics as one json line to path every interval seconds, the file is rotated like a log
+        file (path.1 ... path.<backup_count>) so it never fills the ramdisk
+
+        :param path: e.g. LOG_PATH / 'metrics.jsonl'
+        """
+        super().__init__(daemon=True, name='MetricsWriter')
+
+        self.metrics = metrics
+        self.interval = interval
+        self.stopped = threading.Event()
+
+        self.handler = logging.handlers.RotatingFileHandler(Path(path), maxBytes=max_bytes, backupCount=backup_count)
+        self.handler.setFormatter(logging.Formatter('%(message)s'))
+
+    def write(self):
+        snapshot = {'time': time.strftime('%Y-%m-%d %H:%M:%S'), **self.metrics.snapshot()}
+        record = logging.LogRecord(__name__, logging.INFO, __file__, 0, json.dumps(snapshot), None, None)
+        self.handler.handle(record)
+
+    def run(self):
+        _logger.info(f'writing metrics to {self.handler.baseFilename} every {self.interval} s')
+        while not self.stopped.wait(self.interval):
+            try:
+                self.write()
+            except OSError as write_ex:
+                _logger.warning(f'metrics not written: {write_ex}')
+
+    def stop(self):
+        """writes a last snapshot and closes the file"""
+        self.stopped.set()
+        try:
+            self.write()
+        except OSError as write_ex:
+            _logger.warning(f'metrics not written: {write_ex}')
+        self.handler.close()
@@ -0,0 +1,361 @@
+# MIT License
+#
+# Copyright (c) 2024 mjteter
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""
+Local stand in for the parts of the nhl api the kiosk uses, for development and load testing without network.
+
+Serves standings/now, club-schedule-season/<TEAM>/now, club-stats/<TEAM>/now and gamecenter/<ID>/play-by-play.  A
+recorded play by play (resources/test_game.json by default) is replayed from the opening faceoff at an accelerated
+speed, everything else comes from resources/mock/<endpoint with / replaced by _>.json if that file exists, or is made
+up from the recorded game.  Latency and server errors can be injected, ETag/If-None-Match is honored.
+
+    python mock_server.py --port 8000 --speed 60 --latency 80 --error-rate 0.05
+
+and in config.json: "ENV": "DEV", "MOCKSERVER_URL": "http://localhost:8000", "MOCKSERVER_API_KEY": ""
+"""
+
+import argparse
+import bisect
+import datetime as dt
+import hashlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+from pathlib import Path
+import random
+import re
+import threading
+import time
+
+import logging
+
+
+_logger = logging.getLogger(__name__)
+
+PATH = Path('.')
+GAME_PATH = PATH / 'resources' / 'test_game.json'
+FIXTURE_PATH = PATH / 'resources' / 'mock'
+
+PERIOD_SECONDS = 20 * 60
+TIME_FORMAT = '%Y-%m-%dT%H:%M:%SZ'
+
+DIVISIONS = {'Atlantic': ('BOS', 'BUF', 'DET', 'FLA', 'MTL', 'OTT', 'TBL', 'TOR'),
+             'Metropolitan': ('CAR', 'CBJ', 'NJD', 'NYI', 'NYR', 'PHI', 'PIT', 'WSH'),
+             'Central': ('CHI', 'COL', 'DAL', 'MIN', 'NSH', 'STL', 'UTA', 'WPG'),
+             'Pacific': ('ANA', 'CGY', 'EDM', 'LAK', 'SEA', 'SJS', 'VAN', 'VGK')}
+CONFERENCES = {'Atlantic': 'Eastern', 'Metropolitan': 'Eastern', 'Central': 'Western', 'Pacific': 'Western'}
+
+ROUTES = (('standings', re.compile(r'^(?:/v1)?/standings/now$')),
+          ('schedule', re.compile(r'^(?:/v1)?/club-schedule-season/([A-Z]{3})/now$')),
+          ('club_stats', re.compile(r'^(?:/v1)?/club-stats/([A-Z]{3})/now$')),
+          ('game', re.compile(r'^(?:/v1)?/gamecenter/(\d+)/play-by-play$')))
+
+
+def _game_seconds(play) -> int:
+    minutes, seconds = play['timeInPeriod'].split(':')
+    return (play['periodDescriptor']['number'] - 1) * PERIOD_SECONDS + int(minutes) * 60 + int(seconds)
+
+
+class GameReplay(object):
+    def __init__(self, game: dict, speed: float = 1):
+        """
+        plays a recorded play by play back as if the game started when the replay was created
+
+        :param game: recorded play by play response
+        :param speed: game seconds per real second
+        """
+        self.game = game
+        self.speed = speed
+        self.started = time.monotonic()
+        self.start_time = dt.datetime.now(dt.timezone.utc)
+
+        self.plays = sorted(game.get('plays', []), key=lambda play: play['sortOrder'])
+        self.offsets = [_game_seconds(play) for play in self.plays]
+        self.length = self.offsets[-1] if self.offsets else 0
+
+    @property
+    def game_id(self):
+        return self.game['id']
+
+    def game_time(self) -> float:
+        return (time.monotonic() - self.started) * self.speed
+
+    def state(self) -> str:
+        return 'LIVE' if self.game_time() < self.length else 'OFF'
+
+    def snapshot(self) -> dict:
+        """
+        :return: the play by play response as it would have looked at the current replay time
+        """
+        game_time = self.game_time()
+        plays = self.plays[:bisect.bisect_right(self.offsets, game_time)]
+
+        response = {key: value for key, value in self.game.items() if key not in ('plays', 'situation', 'summary')}
+        response['plays'] = plays
+        response['startTimeUTC'] = self.start_time.strftime(TIME_FORMAT)
+        response['gameState'] = self.state()
+
+        away, home = dict(self.game['awayTeam']), dict(self.game['homeTeam'])
+        away['score'] = home['score'] = away['sog'] = home['sog'] = 0
+        for play in plays:
+            if play['typeDescKey'] in ('goal', 'shot-on-goal'):
+                team = away if play['details'].get('eventOwnerTeamId') == away['id'] else home
+                team['sog'] += 1
+            if play['typeDescKey'] == 'goal':
+                away['score'] = play['details'].get('awayScore', away['score'])
+                home['score'] = play['details'].get('homeScore', home['score'])
+        response['awayTeam'], response['homeTeam'] = away, home
+
+        response['periodDescriptor'] = plays[-1]['periodDescriptor'] if plays else {'number': 1, 'periodType': 'REG',
+                                                                                    'maxRegulationPeriods': 3}
+        period_start = (response['periodDescriptor']['number'] - 1) * PERIOD_SECONDS
+        remaining = min(max(PERIOD_SECONDS - (min(game_time, self.length) - period_start), 0), PERIOD_SECONDS)
+        in_intermission = bool(plays) and plays[-1]['typeDescKey'] == 'period-end' and response['gameState'] == 'LIVE'
+        response['clock'] = {'timeRemaining': f'{int(remaining // 60):02d}:{int(remaining % 60):02d}',
+                             'secondsRemaining': int(remaining), 'running': response['gameState'] == 'LIVE',
+                             'inIntermission': in_intermission}
+
+        return response
+
+
+def synthetic_standings(seed: int = 0) -> dict:
+    rand = random.Random(seed)
+    standings = []
+    for division, teams in DIVISIONS.items():
+        for team in teams:
+            wins, losses, ot_losses = rand.randint(5, 25), rand.randint(5, 20), rand.randint(0, 6)
+            games = wins + losses + ot_losses
+            standings.append({'teamAbbrev': {'default': team}, 'divisionName': division,
+                              'conferenceName': CONFERENCES[division], 'gamesPlayed': games, 'wins': wins,
+                              'losses': losses, 'otLosses': ot_losses, 'points': wins * 2 + ot_losses,
+                              'pointPctg': round((wins * 2 + ot_losses) / (games * 2), 6)})
+
+    standings.sort(key=lambda team: (-team['points'], -team['pointPctg']))
+    return {'standings': standings}
+
+
+def synthetic_schedule(team: str, replay: GameReplay) -> dict:
+    """
+    :return: one game the day before, the replayed game if team plays in it and one game two days later
+    """
+    def game(game_id, start, state, away, home, away_score=None, home_score=None):
+        entry = {'id': game_id, 'startTimeUTC': start.strftime(TIME_FORMAT), 'gameType': 2, 'gameState': state,
+                 'awayTeam': {'abbrev': away}, 'homeTeam': {'abbrev': home}}
+        if away_score is not None:
+            entry['awayTeam']['score'], entry['homeTeam']['score'] = away_score, home_score
+            entry['gameOutcome'] = {'lastPeriodType': 'REG'}
+        return entry
+
+    start = replay.start_time
+    opponent = 'NYR' if team != 'NYR' else 'NJD'
+    games = [game(replay.game_id - 1, start - dt.timedelta(days=1), 'OFF', opponent, team, 2, 3)]
+
+    if team in (replay.game['awayTeam']['abbrev'], replay.game['homeTeam']['abbrev']):
+        snapshot = replay.snapshot()
+        games.append(game(replay.game_id, start, snapshot['gameState'], snapshot['awayTeam']['abbrev'],
+                          snapshot['homeTeam']['abbrev'], snapshot['awayTeam']['score'],
+                          snapshot['homeTeam']['score']))
+
+    games.append(game(replay.game_id + 1, start + dt.timedelta(days=2), 'FUT', team, opponent))
+    return {'games': games}
+
+
+def synthetic_club_stats(team: str, replay: GameReplay) -> dict:
+    team_ids = {replay.game['awayTeam']['abbrev']: replay.game['awayTeam']['id'],
+                replay.game['homeTeam']['abbrev']: replay.game['homeTeam']['id']}
+
+    skaters, goalies = [], []
+    for plyr in replay.game.get('rosterSpots', []):
+        if plyr.get('teamId') != team_ids.get(team):
+            continue
+
+        entry = {'playerId': plyr['playerId'], 'headshot': plyr.get('headshot', ''), 'firstName': plyr['firstName'],
+                 'lastName': plyr['lastName'], 'gamesPlayed': 20, 'goals': 0, 'assists': 0, 'points': 0}
+        if plyr.get('positionCode') == 'G':
+            entry.update({'gamesStarted': 10, 'wins': 5, 'losses': 4, 'ties': 0, 'overtimeLosses': 1,
+                          'savePercentage': 0.905})
+            goalies.append(entry)
+        else:
+            entry['positionCode'] = plyr.get('positionCode', 'C')
+            skaters.append(entry)
+
+    return {'skaters': skaters, 'goalies': goalies}
+
+
+class MockApiServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, replay: GameReplay, fixture_path: Path = FIXTURE_PATH, latency_ms: float = 0,
+                 jitter_ms: float = 0, error_rate: float = 0, error_status: int = 503, api_key: str = None):
+        """
+        :param address: (host, port), port 0 picks a free one
+        :param replay: the game served live
+        :param fixture_path: folder with recorded responses that are served as they are
+        :param latency_ms: added to every response
+        :param jitter_ms: random extra latency of up to this much
+        :param error_rate: share of requests answered with error_status instead
+        :param api_key: X-Api-Key every request has to send, None to accept any
+        """
+        super().__init__(address, MockApiHandler)
+
+        self.replay = replay
+        self.fixture_path = fixture_path
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.api_key = api_key
+
+        self.stats_lock = threading.Lock()
+        self.stats = {}  # path: {status: count}
+
+    @property
+    def url(self) -> str:
+        return f'http://{self.server_address[0]}:{self.server_address[1]}'
+
+    def count(self, path: str, status: int):
+        with self.stats_lock:
+            counts = self.stats.setdefault(path, {})
+            counts[status] = counts.get(status, 0) + 1
+
+    def fixture(self, path: str):
+        fixture = self.fixture_path / (path.strip('/').replace('/', '_') + '.json')
+        if fixture.is_file():
+            return fixture.read_bytes()
+        return None
+
+    def response(self, path: str):
+        """
+        :return: body bytes for path, None if there is no such endpoint
+        """
+        path = path.split('?')[0]
+        fixture = self.fixture(re.sub(r'^/v1', '', path))
+
+        for name, pattern in ROUTES:
+            match = pattern.match(path)
+            if match is None:
+                continue
+
+            if name == 'game':
+                if int(match.group(1)) == self.replay.game_id:
+                    return json.dumps(self.replay.snapshot()).encode()
+                return fixture
+            if fixture is not None:
+                return fixture
+            if name == 'standings':
+                return json.dumps(synthetic_standings()).encode()
+            if name == 'schedule':
+                return json.dumps(synthetic_schedule(match.group(1), self.replay)).encode()
+            return json.dumps(synthetic_club_stats(match.group(1), self.replay)).encode()
+
+        return None
+
+    def serve_in_thread(self) -> threading.Thread:
+        thread = threading.Thread(target=self.serve_forever, name='MockApiServer', daemon=True)
+        thread.start()
+        _logger.info(f'mock api serving on {self.url}')
+        return thread
+
+
+class MockApiHandler(BaseHTTPRequestHandler):
+    server: MockApiServer
+
+    def _send(self, status: int, body: bytes = b'', headers: dict = None):
+        self.send_response(status)
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if body:
+            self.wfile.write(body)
+        self.server.count(self.path, status)
+
+    def do_GET(self):  # noqa (http.server naming)
+        server = self.server
+
+        delay = server.latency_ms + random.uniform(0, server.jitter_ms)
+        if delay > 0:
+            time.sleep(delay / 1000)
+
+        if server.api_key and self.headers.get('X-Api-Key') != server.api_key:
+            self._send(401)
+            return
+
+        if server.error_rate and random.random() < server.error_rate:
+            self._send(server.error_status)
+            return
+
+        body = server.response(self.path)
+        if body is None:
+            self._send(404)
+            return
+
+        etag = '"' + hashlib.sha1(body).hexdigest() + '"'
+        if self.headers.get('If-None-Match') == etag:
+            self._send(304, headers={'ETag': etag})
+            return
+
+        self._send(200, body, {'Content-Type': 'application/json', 'ETag': etag})
+
+    def log_message(self, format, *args):  # noqa (http.server naming)
+        _logger.debug(f'{self.address_string()} {format % args}')
+
+
+def serve(host: str = 'localhost', port: int = 0, game_path: Path = GAME_PATH, speed: float = 1,
+          **kwargs) -> MockApiServer:
+    """
+    starts a mock server in a daemon thread, e.g. for benchmarks
+
+    :param speed: game seconds per real second of the replay
+    :param kwargs: passed on to MockApiServer (latency_ms, error_rate, ...)
+    :return: the running server, server.url is the MOCKSERVER_URL, server.shutdown() stops it
+    """
+    with open(game_path) as f:
+        replay = GameReplay(json.load(f), speed=speed)
+
+    server = MockApiServer((host, port), replay, **kwargs)
+    server.serve_in_thread()
+    return server
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='local stand in for the nhl api')
+    parser.add_argument('--host', default='localhost')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--game', type=Path, default=GAME_PATH, help='recorded play by play to replay')
+    parser.add_argument('--speed', type=float, default=1, help='game seconds per real second')
+    parser.add_argument('--latency', type=float, default=0, help='ms added to every response')
+    parser.add_argument('--jitter', type=float, default=0, help='up to this many random ms on top')
+    parser.add_argument('--error-rate', type=float, default=0, help='share of requests that fail, 0 to 1')
+    parser.add_argument('--error-status', type=int, default=503)
+    parser.add_argument('--api-key', default=None, help='require this X-Api-Key header')
+    cli = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+
+    mock = serve(cli.host, cli.port, cli.game, cli.speed, latency_ms=cli.latency, jitter_ms=cli.jitter,
+                 error_rate=cli.error_rate, error_status=cli.error_status, api_key=cli.api_key)
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        mock.shutdown()
+        _logger.info(f'requests served: {json.dumps(mock.stats, indent=2)}')
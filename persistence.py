@@ -0,0 +1,182 @@
+# MIT License
+#
+# Copyright (c) 2024 mjteter
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""
+Write-behind saving of the json files Bank keeps, so a slow sd card never holds up the next message on resp_queue.
+
+save() serializes on the calling thread (the data is a consistent snapshot and the caller may change its dicts right
+after) and returns, a writer thread puts the file on disk a moment later.  Saves of the same file in between are
+coalesced into the last one, a file whose content did not change is not written at all, and a file is replaced
+atomically so a power cut leaves either the old or the new version, never half of one.
+"""
+
+import hashlib
+import json
+import os
+from pathlib import Path
+import threading
+import time
+
+import logging
+
+import metrics
+
+
+_logger = logging.getLogger(__name__)
+
+COALESCE_SECONDS = 2  # a save waits this long for newer saves of the same file before it is written
+
+
+def _digest(data: bytes) -> str:
+    return hashlib.sha1(data).hexdigest()
+
+
+def atomic_write(path: Path, data: bytes):
+    """
+    writes data to a temp file next to path and renames it over path
+    """
+    temp_path = path.with_name(path.name + '.tmp')
+    with open(temp_path, 'wb') as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temp_path, path)
+
+
+class WriteBehind(threading.Thread):
+    def __init__(self, coalesce_seconds: float = COALESCE_SECONDS, name: str = 'WriteBehind'):
+        """
+        :param coalesce_seconds: how long a save waits for newer saves of the same file
+        """
+        super().__init__(daemon=True, name=name)
+
+        self.coalesce_seconds = coalesce_seconds
+        self.condition = threading.Condition()
+        self.pending = {}  # path: (bytes, time.monotonic() of the first save since the last write)
+        self.written = {}  # path: digest of what is on disk
+        self.writing = False
+        self.closed = False
+
+    def save(self, path: Path, data, indent: int = 2):
+        """
+        :param path: json file to (re)write
+        :param data: anything json.dumps() takes
+        :param indent: same pretty printing as the files had when they were written directly
+        """
+        self.save_bytes(Path(path), json.dumps(data, indent=indent).encode())
+
+    def save_bytes(self, path: Path, data: bytes):
+        with self.condition:
+            if self.closed:
+                raise RuntimeError(f'{self.name} is closed, {path} not saved')
+            if path in self.pending:
+                metrics.registry.count('persist coalesced')
+                first_saved = self.pending[path][1]
+            else:
+                first_saved = time.monotonic()
+            self.pending[path] = (data, first_saved)
+            self.condition.notify()
+
+    def _write(self, path: Path, data: bytes):
+        digest = _digest(data)
+        if path not in self.written:
+            try:
+                with open(path, 'rb') as f:
+                    self.written[path] = _digest(f.read())  # left from the last run
+            except OSError:
+                pass
+
+        if self.written.get(path) == digest:
+            _logger.debug(f'{path} unchanged, not written')
+            metrics.registry.count('persist unchanged')
+            return
+
+        with metrics.registry.timer('persist write'):
+            atomic_write(path, data)
+        self.written[path] = digest
+        metrics.registry.count('persist writes')
+        metrics.registry.count('persist bytes', len(data))
+
+    def _due(self, now: float) -> dict:
+        """
+        :return: the pending saves old enough to be written, removed from pending
+        """
+        due = {path: data for path, (data, first_saved) in self.pending.items()
+               if self.closed or now - first_saved >= self.coalesce_seconds}
+        for path in due:
+            del self.pending[path]
+        return due
+
+    def run(self):
+        while True:
+            with self.condition:
+                while True:
+                    now = time.monotonic()
+                    due = self._due(now)
+                    if due or (self.closed and not self.pending):
+                        break
+                    if self.pending:
+                        oldest = min(first_saved for _, first_saved in self.pending.values())
+                        self.condition.wait(max(oldest + self.coalesce_seconds - now, 0))
+                    else:
+                        self.condition.wait()
+
+                if not due:
+                    return  # closed and everything written
+                self.writing = True
+
+            for path, data in due.items():
+                try:
+                    self._write(path, data)
+                except OSError as write_ex:
+                    _logger.error(f'{path} not saved: {write_ex}')
+
+            with self.condition:
+                self.writing = False
+                self.condition.notify_all()
+
+    def flush(self, timeout: float = None) -> bool:
+        """
+        writes everything pending now instead of after coalesce_seconds and waits for it
+
+        :return: False if the writes did not finish within timeout
+        """
+        with self.condition:
+            for path, (data, _) in self.pending.items():
+                self.pending[path] = (data, time.monotonic() - self.coalesce_seconds)
+            self.condition.notify_all()
+            return self.condition.wait_for(lambda: not self.pending and not self.writing, timeout)
+
+    def close(self, timeout: float = None):
+        """
+        writes everything pending and stops the writer thread, saves after this raise RuntimeError
+        """
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+        if self.is_alive():
+            self.join(timeout)
+        else:
+            with self.condition:
+                due = self._due(time.monotonic())
+            for path, data in due.items():  # never started, write on the calling thread
+                self._write(path, data)
@@ -0,0 +1,105 @@
+# MIT License
+#
+# Copyright (c) 2024 mjteter
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import logging
+
+
+_logger = logging.getLogger(__name__)
+
+# play['details'] keys holding player ids, resolved to '<key minus Id>Name' by PlayerIndex.enrich()
+PLAYER_ID_KEYS = ('scoringPlayerId', 'assist1PlayerId', 'assist2PlayerId', 'goalieInNetId',
+                  'committedByPlayerId', 'drawnByPlayerId', 'servedByPlayerId')
+
+
+class PlayerIndex(object):
+    def __init__(self, roster_spots=None, game_id=None):
+        """
+        playerId: player lookup, built once and reused instead of scanning the roster for every play
+
+        :param roster_spots: 'rosterSpots' of a play by play response
+        :param game_id: game the roster spots belong to, None for a club roster
+        """
+        self.game_id = game_id
+        self.players = {}
+
+        if roster_spots:
+            self.add_roster_spots(roster_spots)
+
+    def __contains__(self, player_id):
+        return player_id in self.players
+
+    def __len__(self):
+        return len(self.players)
+
+    def add_roster_spots(self, roster_spots):
+        """
+        :param roster_spots: 'rosterSpots' of a play by play response, names are {'default': ...} dicts
+        """
+        for plyr in roster_spots:
+            try:
+                self.players[plyr['playerId']] = {'playerId': plyr['playerId'],
+                                                  'name': plyr['firstName']['default'] + ' ' +
+                                                  plyr['lastName']['default'],
+                                                  'teamId': plyr.get('teamId'),
+                                                  'sweaterNumber': plyr.get('sweaterNumber'),
+                                                  'positionCode': plyr.get('positionCode', '')}
+            except KeyError:
+                _logger.error(f'KeyError in PlayerIndex.add_roster_spots() for {plyr.get("playerId")}')
+
+    def add_club_roster(self, roster):
+        """
+        :param roster: roster as saved by Bank.save_roster(), names are plain strings
+        """
+        for plyr in roster.get('skaters', []) + roster.get('goalies', []):
+            self.players[plyr['playerId']] = {'playerId': plyr['playerId'],
+                                              'name': plyr['firstName'] + ' ' + plyr['lastName'],
+                                              'teamId': None,
+                                              'sweaterNumber': None,
+                                              'positionCode': plyr.get('positionCode', 'G')}
+
+    def get(self, player_id):
+        return self.players.get(player_id)
+
+    def name(self, player_id) -> str:
+        """
+        :return: 'First Last' or '' if the player is not in the index
+        """
+        plyr = self.players.get(player_id)
+        return plyr['name'] if plyr else ''
+
+    def enrich(self, details: dict, target: dict = None) -> dict:
+        """
+        adds a name for every player id in details
+
+        :param details: play['details'] from the play by play api
+        :param target: dict the ids and names are written to, defaults to details itself
+        :return: target
+        """
+        if target is None:
+            target = details
+
+        for key in PLAYER_ID_KEYS:
+            if key in details:
+                target[key] = details[key]
+                target[key[:-2] + 'Name'] = self.name(details[key])
+
+        return target
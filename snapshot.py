@@ -0,0 +1,442 @@
+# MIT License
+#
+# Copyright (c) 2024 mjteter
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""
+Binary snapshots of the saved json data (standings, schedule, roster, game) that are memory-mapped and read lazily,
+so a warm start only decodes the values it actually touches instead of parsing every file in full.  SnapshotChannel
+hands the latest data from the fetching to the drawing side, optionally through a snapshot file for another process.
+
+Layout, little endian:
+
+    header   magic b'HKSN', version u16, flags u16, record count u32, shape count u32, shape key count u32,
+             string count u32
+    records  record count x 16 bytes: type u8, shape u24 (dicts only), a u32, b i64 (or f64 for floats)
+             record 0 is the root, the a children of a list/dict are consecutive records starting at b
+    shapes   shape count x u32 end offsets into the shape keys, then shape key count x u32 string indices.  a shape
+             is the key sequence of a dict, dicts with the same keys (all games of a schedule) share it
+    strings  string count x u32 end offsets, then the utf-8 bytes of all strings, every distinct string once
+
+Debug export to json:
+
+    python snapshot.py resources/schedule.snap > schedule.json
+"""
+
+from collections import deque
+from collections.abc import Mapping, Sequence
+import json
+import mmap
+import os
+from pathlib import Path
+import struct
+import sys
+import threading
+
+import logging
+
+from persistence import atomic_write
+
+
+_logger = logging.getLogger(__name__)
+
+MAGIC = b'HKSN'
+VERSION = 1
+SUFFIX = '.snap'
+
+HEADER = struct.Struct('<4sHHIIII')
+RECORD = struct.Struct('<IIq')  # type | shape << 8, a, b
+FLOAT_RECORD = struct.Struct('<IId')
+UINT = struct.Struct('<I')
+MAX_SHAPES = 2 ** 24
+
+NULL, FALSE, TRUE, INT, FLOAT, STR, LIST, DICT = range(8)
+
+
+class SnapshotError(ValueError):
+    pass
+
+
+def dumps(data) -> bytes:
+    """
+    :param data: json compatible data, dict keys must be strings and ints fit in 64 bits
+    :return: the snapshot bytes
+    """
+    strings = {}  # string: index
+    shapes = {}  # tuple of key string indices: shape index
+    records = []  # [type | shape << 8, a, b]
+
+    def string_index(string):
+        if string not in strings:
+            strings[string] = len(strings)
+        return strings[string]
+
+    def scalar(value):
+        if value is None:
+            return [NULL, 0, 0]
+        elif value is True:
+            return [TRUE, 0, 0]
+        elif value is False:
+            return [FALSE, 0, 0]
+        elif isinstance(value, int):
+            if not -2 ** 63 <= value < 2 ** 63:
+                raise SnapshotError(f'int {value} does not fit in 64 bits')
+            return [INT, 0, value]
+        elif isinstance(value, float):
+            return [FLOAT, 0, value]
+        elif isinstance(value, str):
+            return [STR, string_index(value), 0]
+        raise SnapshotError(f'{type(value).__name__} is not json data')
+
+    # breadth first, so the children of every container can be given consecutive records when it is reached
+    records.append(None)
+    todo = deque([(0, data)])
+    while todo:
+        index, value = todo.popleft()
+        if isinstance(value, Mapping):
+            for key in value:
+                if not isinstance(key, str):
+                    raise SnapshotError(f'dict key {key!r} is not a string')
+            shape = tuple(string_index(key) for key in value)
+            if shape not in shapes:
+                if len(shapes) >= MAX_SHAPES:
+                    raise SnapshotError('too many different dict shapes')
+                shapes[shape] = len(shapes)
+            first = len(records)
+            records[index] = [DICT | shapes[shape] << 8, len(value), first]
+            for item in value.values():
+                records.append(None)
+                todo.append((len(records) - 1, item))
+        elif isinstance(value, (list, tuple, Sequence)) and not isinstance(value, str):
+            first = len(records)
+            records[index] = [LIST, len(value), first]
+            for item in value:
+                records.append(None)
+                todo.append((len(records) - 1, item))
+        else:
+            records[index] = scalar(value)
+
+    shape_ends = []
+    end = 0
+    for shape in shapes:
+        end += len(shape)
+        shape_ends.append(end)
+
+    encoded = [string.encode() for string in strings]
+    string_ends = []
+    end = 0
+    for string in encoded:
+        end += len(string)
+        string_ends.append(end)
+
+    parts = [HEADER.pack(MAGIC, VERSION, 0, len(records), len(shapes), sum(map(len, shapes)), len(encoded))]
+    parts.extend(FLOAT_RECORD.pack(*record) if record[0] == FLOAT else RECORD.pack(*record) for record in records)
+    parts.extend(UINT.pack(end) for end in shape_ends)
+    parts.extend(UINT.pack(key) for shape in shapes for key in shape)
+    parts.extend(UINT.pack(end) for end in string_ends)
+    parts.extend(encoded)
+
+    return b''.join(parts)
+
+
+class Snapshot(object):
+    def __init__(self, buffer):
+        """
+        read access to snapshot bytes, values are decoded on first access
+
+        :param buffer: bytes, bytearray or mmap with the snapshot
+        """
+        if len(buffer) < HEADER.size:
+            raise SnapshotError('snapshot is too short')
+        magic, version, _, record_count, shape_count, shape_key_count, string_count = HEADER.unpack_from(buffer, 0)
+        if magic != MAGIC:
+            raise SnapshotError('not a snapshot')
+        if version != VERSION:
+            raise SnapshotError(f'snapshot version {version}, expected {VERSION}')
+
+        self.buffer = buffer
+        self.record_count = record_count
+        self.shape_count = shape_count
+        self.shape_key_count = shape_key_count
+        self.string_count = string_count
+        self.shape_offsets_start = HEADER.size + record_count * RECORD.size
+        self.shape_keys_start = self.shape_offsets_start + shape_count * UINT.size
+        self.string_offsets_start = self.shape_keys_start + shape_key_count * UINT.size
+        self.strings_start = self.string_offsets_start + string_count * UINT.size
+        if len(buffer) < self.strings_start or (string_count and len(buffer) < self.strings_start + self._uint(
+                self.string_offsets_start, string_count - 1)):
+            raise SnapshotError('snapshot is cut short')
+
+        self.strings = {}  # index: decoded string
+        self.shapes = {}  # index: {key: position of the value}
+
+    def _uint(self, start: int, index: int) -> int:
+        return UINT.unpack_from(self.buffer, start + index * UINT.size)[0]
+
+    def string(self, index: int) -> str:
+        if index not in self.strings:
+            if not 0 <= index < self.string_count:
+                raise SnapshotError(f'string {index} out of range')
+            start = self._uint(self.string_offsets_start, index - 1) if index else 0
+            end = self._uint(self.string_offsets_start, index)
+            try:
+                self.strings[index] = bytes(self.buffer[self.strings_start + start:self.strings_start + end]).decode()
+            except UnicodeDecodeError as decode_ex:
+                raise SnapshotError(f'string {index} damaged: {decode_ex}') from decode_ex
+        return self.strings[index]
+
+    def shape(self, index: int) -> dict:
+        """
+        :return: key: position of its value among the children of a dict with this shape
+        """
+        if index not in self.shapes:
+            if not 0 <= index < self.shape_count:
+                raise SnapshotError(f'shape {index} out of range')
+            start = self._uint(self.shape_offsets_start, index - 1) if index else 0
+            end = self._uint(self.shape_offsets_start, index)
+            if not start <= end <= self.shape_key_count:
+                raise SnapshotError(f'keys of shape {index} out of range')
+            self.shapes[index] = {self.string(self._uint(self.shape_keys_start, key)): position
+                                  for position, key in enumerate(range(start, end))}
+        return self.shapes[index]
+
+    def value(self, index: int):
+        """
+        :return: scalar, SnapshotDict or SnapshotList of record index
+        """
+        if not 0 <= index < self.record_count:
+            raise SnapshotError(f'record {index} out of range')
+        offset = HEADER.size + index * RECORD.size
+        kind, a, b = RECORD.unpack_from(self.buffer, offset)
+        kind, shape = kind & 0xff, kind >> 8
+        if kind == STR:
+            return self.string(a)
+        elif kind == INT:
+            return b
+        elif kind == DICT:
+            # dumps() always puts the children after their container (a of a dict is its length), which also rules
+            # out cycles
+            if b <= index or b + a > self.record_count:
+                raise SnapshotError(f'children of record {index} out of range')
+            return SnapshotDict(self, b, self.shape(shape))
+        elif kind == LIST:
+            if b <= index or b + a > self.record_count:
+                raise SnapshotError(f'children of record {index} out of range')
+            return SnapshotList(self, b, a)
+        elif kind == FLOAT:
+            return FLOAT_RECORD.unpack_from(self.buffer, offset)[2]
+        elif kind == TRUE:
+            return True
+        elif kind == FALSE:
+            return False
+        return None
+
+    @property
+    def root(self):
+        return self.value(0)
+
+
+class SnapshotDict(Mapping):
+    def __init__(self, snapshot: Snapshot, first: int, keys: dict):
+        """
+        read only dict view, values are decoded when they are accessed
+
+        :param first: record index of the first value
+        :param keys: the decoded shape, key: position of the value
+        """
+        self.snapshot = snapshot
+        self.first = first
+        self.keys_ = keys
+
+    def __getitem__(self, key):
+        return self.snapshot.value(self.first + self.keys_[key])
+
+    def __contains__(self, key):
+        return key in self.keys_
+
+    def __iter__(self):
+        return iter(self.keys_)
+
+    def __len__(self):
+        return len(self.keys_)
+
+    def __repr__(self):
+        return f'<SnapshotDict with {len(self.keys_)} keys>'
+
+    def to_python(self) -> dict:
+        return {key: to_python(self.snapshot.value(self.first + position)) for key, position in self.keys_.items()}
+
+
+class SnapshotList(Sequence):
+    def __init__(self, snapshot: Snapshot, first: int, count: int):
+        """read only list view, items are decoded when they are accessed"""
+        self.snapshot = snapshot
+        self.first = first
+        self.count = count
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[ii] for ii in range(*index.indices(self.count))]
+        if index < 0:
+            index += self.count
+        if not 0 <= index < self.count:
+            raise IndexError('snapshot list index out of range')
+        return self.snapshot.value(self.first + index)
+
+    def __len__(self):
+        return self.count
+
+    def __repr__(self):
+        return f'<SnapshotList with {self.count} items>'
+
+    def to_python(self) -> list:
+        return [to_python(item) for item in self]
+
+
+def to_python(value):
+    """
+    :return: value with all snapshot views turned into plain dicts and lists, e.g. to change or json.dump it
+    """
+    if isinstance(value, (SnapshotDict, SnapshotList)):
+        return value.to_python()
+    return value
+
+
+def snapshot_path(json_path: Path) -> Path:
+    return Path(json_path).with_suffix(SUFFIX)
+
+
+def load(path: Path):
+    """
+    maps a snapshot file read only, the file can be replaced (os.replace) while the returned views are in use
+
+    :return: the root value, usually a SnapshotDict
+    :raises OSError, SnapshotError: missing, damaged or outdated snapshot, fall back on the json file
+    """
+    with open(path, 'rb') as f:
+        if os.name == 'nt':
+            buffer = f.read()  # windows does not allow replacing a mapped file
+        else:
+            try:
+                buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError as map_ex:  # empty file, e.g. cut short by a crash or full disk
+                raise SnapshotError(f'snapshot {path} is empty') from map_ex
+    try:
+        return Snapshot(buffer).root
+    except struct.error as read_ex:  # an offset that points past the end of the file
+        raise SnapshotError(f'snapshot {path} is damaged: {read_ex}') from read_ex
+
+
+def load_json_or_snapshot(json_path: Path):
+    """
+    :return: the snapshot next to json_path if it is at least as new as the json file, else the parsed json file
+    :raises OSError, ValueError: neither file can be read
+    """
+    json_path = Path(json_path)
+    snap_path = snapshot_path(json_path)
+    try:
+        if not json_path.exists() or snap_path.stat().st_mtime >= json_path.stat().st_mtime:
+            return load(snap_path)
+    except (OSError, SnapshotError) as snap_ex:
+        _logger.debug(f'no usable snapshot {snap_path}: {snap_ex}')
+
+    with open(json_path) as f:
+        return json.load(f)
+
+
+class SnapshotChannel(object):
+    def __init__(self, path: Path = None):
+        """
+        the latest published data and its version, a reader only does work when the version changed.  published data
+        is shared, not copied, so it must not be changed after publish()
+
+        :param path: snapshot file every publish() also writes and newer() picks up, e.g. when it was written by
+        another process or by the last run (warm start).  None to keep the data in this process only
+        """
+        self.path = Path(path) if path is not None else None
+        self.lock = threading.Lock()
+        self.version = 0
+        self.data = None
+        self.file_stamp = None  # (inode, mtime_ns) of the snapshot file when it was last written or read
+
+    def _stamp(self):
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return None
+        return stat.st_ino, stat.st_mtime_ns
+
+    def publish(self, data, write: bool = True) -> int:
+        """
+        :param write: False if the snapshot file already holds data, e.g. written by the process data came from
+        :return: the version of data
+        """
+        if self.path is not None and write:
+            atomic_write(self.path, dumps(data))
+
+        with self.lock:
+            self.version += 1
+            self.data = data
+            if self.path is not None:
+                self.file_stamp = self._stamp()  # do not read back what was just written
+            return self.version
+
+    def _poll_file(self):
+        stamp = self._stamp()
+        with self.lock:
+            if stamp is None or stamp == self.file_stamp:
+                return
+            self.file_stamp = stamp
+
+        try:
+            data = load(self.path)
+        except (OSError, SnapshotError) as load_ex:
+            _logger.warning(f'snapshot {self.path} not picked up: {load_ex}')
+            return
+
+        with self.lock:
+            self.version += 1
+            self.data = data
+        _logger.info(f'picked up {self.path} as version {self.version}')
+
+    def latest(self) -> tuple:
+        """
+        :return: (version, data), (0, None) if nothing was published yet
+        """
+        if self.path is not None:
+            self._poll_file()
+        with self.lock:
+            return self.version, self.data
+
+    def newer(self, version: int):
+        """
+        :param version: the version the reader has
+        :return: (version, data) if there is a newer one, else None
+        """
+        latest_version, data = self.latest()
+        return (latest_version, data) if latest_version > version else None
+
+
+if __name__ == '__main__':
+    if len(sys.argv) != 2:
+        print(f'usage: python {sys.argv[0]} <file.snap>', file=sys.stderr)
+        sys.exit(2)
+    json.dump(to_python(load(Path(sys.argv[1]))), sys.stdout, indent=2)
+    print()